@@ -0,0 +1,441 @@
+import json
+import math
+import multiprocessing
+import os
+import threading
+
+from match import Match
+from rugbydb import CachedDB
+from rugby_stats import _matchMinutes
+from summary import _toFloat
+from query import getLeagueId
+from symbols import TEAMS, STATS
+from variables import MATCH_IDS
+
+# aggregations that can be merged from partials, median needs every value so is not included
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max', 'std', 'per80')
+
+# season aggregates in the form {(leagueId, season): PartialAggregate}
+SEASON_AGGREGATES = {}
+SEASON_AGGREGATES_LOCK = threading.Lock()
+
+
+class StatAggregate(object):
+    """
+    Running count, sum, sum of squares, min, max and minutes of a stat's
+    values. Two aggregates of disjoint values merge into the aggregate of
+    every value, so partials can be combined in any order
+    """
+
+    @classmethod
+    def fromList(cls, values):
+        """
+        Load an aggregate stored with toList
+        ARGS:
+            values (list) - list in the form [count, sum, sumSquares, min, max, minutes]
+        RETURNS:
+            StatAggregate (obj) - new StatAggregate object
+        """
+        aggregate = cls()
+        aggregate.count, aggregate.total, aggregate.sumSquares, aggregate.minimum, aggregate.maximum, aggregate.minutes = values
+        return aggregate
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.sumSquares = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.minutes = 0.0
+
+    def add(self, value, minutes=None):
+        """
+        Add a single value
+        ARGS:
+            value (float) - stat value
+            minutes (float) - minutes played for the value, used for per80
+        """
+        self.count += 1
+        self.total += value
+        self.sumSquares += value * value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if minutes:
+            self.minutes += minutes
+
+    def merge(self, other):
+        """
+        Combine another aggregate into this one
+        ARGS:
+            other (StatAggregate) - aggregate of other values
+        RETURNS:
+            StatAggregate (obj) - this aggregate
+        """
+        if other.count:
+            self.count += other.count
+            self.total += other.total
+            self.sumSquares += other.sumSquares
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+            self.minutes += other.minutes
+        return self
+
+    def getValue(self, aggregation):
+        """
+        Get an aggregation of the values
+        ARGS:
+            aggregation (str) - one of AGGREGATIONS
+        RETURNS:
+            float - value of the aggregation, None if there are no values
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError("Unknown aggregation {}, expected one of {}".format(aggregation, AGGREGATIONS))
+        if aggregation == 'count':
+            return self.count
+        if not self.count:
+            return None
+        if aggregation == 'sum':
+            return self.total
+        if aggregation == 'mean':
+            return self.total / self.count
+        if aggregation == 'min':
+            return self.minimum
+        if aggregation == 'max':
+            return self.maximum
+        if aggregation == 'std':
+            mean = self.total / self.count
+            return math.sqrt(max(0.0, self.sumSquares / self.count - mean * mean))
+        return self.total * 80.0 / self.minutes if self.minutes else None
+
+    def toList(self):
+        """
+        RETURNS:
+            list - aggregate in the form [count, sum, sumSquares, min, max, minutes]
+        """
+        return [self.count, self.total, self.sumSquares, self.minimum, self.maximum, self.minutes]
+
+
+def _mergeStats(stats, otherStats):
+    """
+    Internal function to merge a dictionary of stat aggregates into another
+    """
+    for stat, aggregate in otherStats.items():
+        stats.setdefault(stat, StatAggregate()).merge(aggregate)
+
+
+class PartialAggregate(object):
+    """
+    Team and player stat aggregates for a partition of matches, typically a
+    league season. Partials of disjoint partitions merge into the aggregate of
+    every match, so multi season and multi league tables combine cached
+    partials rather than walking the matches again
+    """
+
+    @classmethod
+    def fromMatchDicts(cls, matchDicts):
+        """
+        Build an aggregate from stored match dictionaries
+        ARGS:
+            matchDicts (dict) - dictionary in the form {matchId: matchDict}
+        RETURNS:
+            PartialAggregate (obj) - new PartialAggregate object
+        """
+        partial = cls()
+        for matchId in sorted(matchDicts.keys()):
+            partial.addMatch(matchId, matchDicts[matchId])
+        return partial
+
+    @classmethod
+    def fromDict(cls, partialDict):
+        """
+        Load an aggregate stored with toDict
+        ARGS:
+            partialDict (dict) - dictionary from toDict
+        RETURNS:
+            PartialAggregate (obj) - new PartialAggregate object
+        """
+        partial = cls()
+        partial.matchIds = set(partialDict['matchIds'])
+        partial.version = partialDict.get('version')
+        for key in ('teams', 'against'):
+            getattr(partial, key).update((TEAMS.intern(team), dict((STATS.intern(stat), StatAggregate.fromList(values))
+                                                                   for stat, values in stats.items()))
+                                         for team, stats in partialDict[key].items())
+        for playerId, player in partialDict['players'].items():
+            partial.players[playerId] = {'name': player['name'],
+                                         'team': TEAMS.intern(player['team']),
+                                         'stats': dict((STATS.intern(stat), StatAggregate.fromList(values))
+                                                       for stat, values in player['stats'].items())}
+        return partial
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an aggregate saved with save
+        ARGS:
+            path (str) - json file to read
+        RETURNS:
+            PartialAggregate (obj) - new PartialAggregate object
+        """
+        with open(path) as partialFile:
+            return cls.fromDict(json.loads(partialFile.read()))
+
+    def __init__(self):
+        self.matchIds = set()
+        # version of the league file the aggregate was built from, see RugbyDB.getLeagueFileVersion
+        self.version = None
+        self.teams = {}
+        self.against = {}
+        self.players = {}
+
+    def __len__(self):
+        """
+        Number of matches in the aggregate
+        """
+        return len(self.matchIds)
+
+    def addMatch(self, matchId, matchDict):
+        """
+        Add a match to the aggregate
+        ARGS:
+            matchId (str) - id of the match
+            matchDict (dict) - match dictionary from the database
+        """
+        matchId = str(matchId)
+        if matchId in self.matchIds:
+            raise ValueError("Match {} is already in the aggregate".format(matchId))
+        self.matchIds.add(matchId)
+        match = Match(matchDict)
+        minutes = _matchMinutes(match)
+        for team, opposition in ((match.homeTeam['name'], match.awayTeam['name']),
+                                 (match.awayTeam['name'], match.homeTeam['name'])):
+            teamStats = self.teams.setdefault(team, {})
+            againstStats = self.against.setdefault(team, {})
+            for stat in match.matchStats.keys():
+                value = _toFloat(match.getStatForTeam(team, stat))
+                if value is not None:
+                    teamStats.setdefault(stat, StatAggregate()).add(value, minutes)
+                against = _toFloat(match.getStatForTeam(opposition, stat))
+                if against is not None:
+                    againstStats.setdefault(stat, StatAggregate()).add(against, minutes)
+            for player in match.players.get(team, []):
+                playerAggregate = self.players.setdefault(player.id, {'name': player.name, 'team': team, 'stats': {}})
+                for stat, value in player.matchStats.items():
+                    value = _toFloat(value)
+                    if value is not None:
+                        playerAggregate['stats'].setdefault(stat, StatAggregate()).add(value, player.minutesPlayed)
+
+    def merge(self, other):
+        """
+        Combine the aggregate of another partition into this one
+        ARGS:
+            other (PartialAggregate) - aggregate of other matches
+        RETURNS:
+            PartialAggregate (obj) - this aggregate
+        """
+        if self.matchIds & other.matchIds:
+            raise ValueError("Aggregates to merge share {} matches".format(len(self.matchIds & other.matchIds)))
+        self.matchIds.update(other.matchIds)
+        for key in ('teams', 'against'):
+            for team, stats in getattr(other, key).items():
+                _mergeStats(getattr(self, key).setdefault(team, {}), stats)
+        for playerId, player in other.players.items():
+            playerAggregate = self.players.setdefault(playerId, {'name': player['name'], 'team': player['team'], 'stats': {}})
+            _mergeStats(playerAggregate['stats'], player['stats'])
+        return self
+
+    def getTeamAggregate(self, team, stat, against=False):
+        """
+        Get the aggregate of a stat for a team
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+            against (bool) - True = the stat for the team's oppositions
+        RETURNS:
+            StatAggregate (obj) - aggregate of the stat, empty if not found
+        """
+        stats = (self.against if against else self.teams).get(TEAMS.canonical(team), {})
+        return stats.get(STATS.canonical(stat), StatAggregate())
+
+    def getTeamTable(self, teams, stats, aggregations=('mean',)):
+        """
+        Aggregate several stats for several teams
+        ARGS:
+            teams ([str]) - list of team names, None for every team
+            stats ([str]) - list of stat names
+            aggregations ([str]) - list of aggregations from AGGREGATIONS
+        RETURNS:
+            ([str], [tuple]) - column names in the form ['team', 'stat aggregation', ...] and one
+                               row per team sorted by team name, aggregate is None if the stat is not found
+        """
+        stats = [STATS.canonical(stat) for stat in stats]
+        columns = ['team'] + ["{} {}".format(stat, aggregation) for stat in stats for aggregation in aggregations]
+        rows = []
+        for team in sorted(TEAMS.canonical(team) for team in teams) if teams else sorted(self.teams.keys()):
+            rows.append(tuple([team] + [self.getTeamAggregate(team, stat).getValue(aggregation)
+                                        for stat in stats for aggregation in aggregations]))
+        return columns, rows
+
+    def getPlayerLeaders(self, stat, aggregation='sum'):
+        """
+        Rank every player by an aggregation of a stat
+        ARGS:
+            stat (str) - stat name
+            aggregation (str) - one of AGGREGATIONS
+        RETURNS:
+            [(str, str, float),] - list of tuples sorted by value, in the form (playerName, teamName, statValue)
+        """
+        stat = STATS.canonical(stat)
+        leaders = []
+        for player in self.players.values():
+            if stat in player['stats']:
+                value = player['stats'][stat].getValue(aggregation)
+                if value is not None:
+                    leaders.append((player['name'], player['team'], value))
+        return sorted(leaders, key=lambda tup: tup[2], reverse=True)
+
+    def toDict(self):
+        """
+        Return the aggregate in a form that can be stored or sent between processes
+        RETURNS:
+            dict - dictionary of the match ids, data version, team, opposition and player aggregates
+        """
+        return {'matchIds': sorted(self.matchIds),
+                'version': self.version,
+                'teams': dict((team, dict((stat, aggregate.toList()) for stat, aggregate in stats.items()))
+                              for team, stats in self.teams.items()),
+                'against': dict((team, dict((stat, aggregate.toList()) for stat, aggregate in stats.items()))
+                                for team, stats in self.against.items()),
+                'players': dict((playerId, {'name': player['name'], 'team': player['team'],
+                                            'stats': dict((stat, aggregate.toList()) for stat, aggregate in player['stats'].items())})
+                                for playerId, player in self.players.items())}
+
+    def save(self, path):
+        """
+        Write the aggregate to a json file
+        ARGS:
+            path (str) - json file to write
+        """
+        with open(path, "w") as partialFile:
+            partialFile.write(json.dumps(self.toDict(), sort_keys=True))
+
+
+def computeSeasonAggregate(partition):
+    """
+    Build the aggregate of a league season from the database, a top level
+    function so it can be mapped over a process pool
+    ARGS:
+        partition ((str, str)) - tuple in the form (leagueId, season)
+    RETURNS:
+        dict - aggregate from PartialAggregate.toDict
+    """
+    leagueId, season = partition
+    return PartialAggregate.fromMatchDicts(CachedDB().getMatchesForLeague(leagueId, [season])).toDict()
+
+
+def _aggregatePath(path, leagueId, season):
+    """
+    Internal function to get the file a season aggregate is persisted in
+    """
+    return os.path.join(path, "{}-{}.aggregate".format(leagueId, season))
+
+
+def getSeasonAggregates(partitions, path=None, processes=None):
+    """
+    Get the aggregates of league seasons, each is reused while its matches and
+    the league file's version are unchanged, read from the persisted file if there is one, and otherwise built
+    from the database, on a process pool if processes is set
+    ARGS:
+        partitions ([(str, str)]) - list of tuples in the form (leagueId, season)
+        path (str) - directory to read and persist the aggregates, None to keep them in memory only
+        processes (int) - number of worker processes to build missing aggregates, None to build them here
+    RETURNS:
+        [PartialAggregate] - aggregate of each partition, in partition order
+    """
+    db = CachedDB()
+    results = {}
+    versions = {}
+    missing = []
+    for leagueId, season in partitions:
+        catalog = db.getSeasonCatalog(leagueId, season)
+        matchIds = set(catalog.getMatchIds()) if catalog is not None else set()
+        # forced re-fetches change stats without changing the match ids, writes in this process are dropped by attach
+        version = versions[(leagueId, season)] = db.getLeagueFileVersion(leagueId)
+        isFresh = lambda partial: partial is not None and partial.matchIds == matchIds and partial.version == version
+        partial = SEASON_AGGREGATES.get((leagueId, season))
+        if not isFresh(partial) and path is not None and os.path.exists(_aggregatePath(path, leagueId, season)):
+            partial = PartialAggregate.load(_aggregatePath(path, leagueId, season))
+        if isFresh(partial):
+            results[(leagueId, season)] = partial
+        else:
+            missing.append((leagueId, season))
+    if missing:
+        if processes is not None and len(missing) > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                partialDicts = pool.map(computeSeasonAggregate, missing)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            partialDicts = [computeSeasonAggregate(partition) for partition in missing]
+        for (leagueId, season), partialDict in zip(missing, partialDicts):
+            partial = results[(leagueId, season)] = PartialAggregate.fromDict(partialDict)
+            partial.version = versions[(leagueId, season)]
+            if path is not None:
+                if not os.path.exists(path):
+                    os.makedirs(path)
+                partial.save(_aggregatePath(path, leagueId, season))
+    with SEASON_AGGREGATES_LOCK:
+        SEASON_AGGREGATES.update(results)
+    return [results[partition] for partition in partitions]
+
+
+def attach(db):
+    """
+    Drop the cached aggregate of a league season whenever a RugbyDBReadWrite
+    database adds or changes one of its matches, e.g. from a live delta
+    ARGS:
+        db (RugbyDBReadWrite) - database to listen to
+    """
+    def listener(leagueId, year, matchId, matchDict):
+        with SEASON_AGGREGATES_LOCK:
+            SEASON_AGGREGATES.pop((leagueId, year), None)
+    db.addIngestListener(listener)
+
+
+def getPartitions(leagues=None, seasons=None):
+    """
+    Get the league seasons in the database, seasons are read from MATCH_IDS
+    and the league catalogs so no league is loaded for it
+    ARGS:
+        leagues ([str]) - list of league ids or names, default every league
+        seasons ([str]) - list of seasons, default every season
+    RETURNS:
+        [(str, str)] - sorted list of tuples in the form (leagueId, season)
+    """
+    db = CachedDB()
+    leagueIds = [getLeagueId(league) or league for league in leagues] if leagues else db.getStoredLeagueIds()
+    partitions = []
+    for leagueId in leagueIds:
+        for season in sorted(MATCH_IDS[leagueId]['matchIds'].keys() if leagueId in MATCH_IDS else []):
+            if (not seasons or season in seasons) and db.getSeasonCatalog(leagueId, season) is not None:
+                partitions.append((leagueId, season))
+    return partitions
+
+
+def aggregate(leagues=None, seasons=None, path=None, processes=None):
+    """
+    Merge the season aggregates of several leagues and seasons
+    ARGS:
+        leagues ([str]) - list of league ids or names, default every league
+        seasons ([str]) - list of seasons, default every season
+        path (str) - directory to read and persist the season aggregates, None to keep them in memory only
+        processes (int) - number of worker processes to build missing aggregates, None to build them here
+    RETURNS:
+        PartialAggregate (obj) - aggregate of every selected match
+    """
+    merged = PartialAggregate()
+    for partial in getSeasonAggregates(getPartitions(leagues, seasons), path, processes):
+        merged.merge(partial)
+    return merged
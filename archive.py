@@ -0,0 +1,201 @@
+import json
+import mmap
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = "RDBZ1"
+TRAILER = struct.Struct("!QI")
+
+# gamePackage subtrees read by Match.__init__ and parseMatchStats, every other
+# subtree is kept in the archive for reprocessing but not decoded by RugbyDB
+MATCH_SUBTREES = ('gameStrip', 'matchLineUp', 'matchCommentary', 'matchStats',
+                  'matchDiscipline', 'matchEvents', 'matchAttacking', 'matchDefending')
+
+# frame name for the top level keys of a match dictionary other than gamePackage
+REST = '_rest'
+
+
+def _compressor(codec, level):
+    """
+    Internal function to get the compress function for a codec
+    """
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, level)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd archives require zstandard")
+        return zstandard.ZstdCompressor(level=level).compress
+    raise ValueError("Unknown codec {}, expected 'zlib' or 'zstd'".format(codec))
+
+
+def _decompressor(codec):
+    """
+    Internal function to get the decompress function for a codec
+    """
+    if codec == 'zlib':
+        return zlib.decompress
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd archives require zstandard")
+        return zstandard.ZstdDecompressor().decompress
+    raise ValueError("Unknown codec {}, expected 'zlib' or 'zstd'".format(codec))
+
+
+def writeArchive(path, leagueDict, codec=None, level=6):
+    """
+    Write a league to a compressed archive, each gamePackage subtree of each
+    match is its own frame and an index of frame offsets is written at the end
+    ARGS:
+        path (str) - archive file to write
+        leagueDict (dict) - league database in the form {season: {matchId: matchDict}}
+        codec (str) - 'zstd' or 'zlib', default zstd if zstandard is installed otherwise zlib
+        level (int) - compression level
+    RETURNS:
+        dict - archive stats in the form {'matches': int, 'rawBytes': int, 'compressedBytes': int, 'ratio': float}
+    """
+    codec = codec if codec is not None else ('zstd' if zstandard is not None else 'zlib')
+    compress = _compressor(codec, level)
+    index = {'codec': codec, 'seasons': {}}
+    with open(path, "wb") as archiveFile:
+        archiveFile.write(MAGIC)
+        offset = len(MAGIC)
+        for season in sorted(leagueDict.keys()):
+            seasonIndex = index['seasons'][season] = {}
+            for matchId in sorted(leagueDict[season].keys()):
+                matchDict = leagueDict[season][matchId]
+                frames = [(REST, dict((key, value) for key, value in matchDict.items() if key != 'gamePackage'))]
+                frames.extend(sorted(matchDict.get('gamePackage', {}).items()))
+                matchIndex = seasonIndex[matchId] = []
+                for name, subtree in frames:
+                    raw = json.dumps(subtree, separators=(',', ':'))
+                    frame = compress(raw)
+                    archiveFile.write(frame)
+                    matchIndex.append([name, offset, len(frame), len(raw)])
+                    offset += len(frame)
+        indexFrame = zlib.compress(json.dumps(index, separators=(',', ':')))
+        archiveFile.write(indexFrame)
+        archiveFile.write(TRAILER.pack(offset, len(indexFrame)))
+    return MatchArchive(path).getStats()
+
+
+class MatchArchive(object):
+    """
+    Read only view of a league archive written by writeArchive. Only the
+    frame index is read when it is opened, a match is decoded on request
+    and only the gamePackage subtrees asked for are decompressed
+    """
+
+    def __init__(self, path):
+        """
+        ARGS:
+            path (str) - archive file to read
+        """
+        self.path = path
+        with open(path, "rb") as archiveFile:
+            self._data = mmap.mmap(archiveFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a match archive".format(path))
+        indexOffset, indexLength = TRAILER.unpack(self._data[-TRAILER.size:])
+        index = json.loads(zlib.decompress(self._data[indexOffset:indexOffset + indexLength]))
+        self.codec = index['codec']
+        self._decompress = _decompressor(self.codec)
+        self._seasons = index['seasons']
+        self._matchSeasons = {}
+        for season, seasonIndex in self._seasons.items():
+            for matchId in seasonIndex.keys():
+                self._matchSeasons[matchId] = season
+
+    def __len__(self):
+        return len(self._matchSeasons)
+
+    def __contains__(self, matchId):
+        return str(matchId) in self._matchSeasons
+
+    def close(self):
+        self._data.close()
+
+    def getSeasons(self):
+        """
+        RETURNS:
+            [str] - sorted list of seasons in the archive
+        """
+        return sorted(self._seasons.keys())
+
+    def getMatchIds(self, season=None):
+        """
+        ARGS:
+            season (str) - season string, None for every season
+        RETURNS:
+            [str] - sorted list of match ids
+        """
+        if season is None:
+            return sorted(self._matchSeasons.keys())
+        return sorted(self._seasons.get(season, {}).keys())
+
+    def getSeason(self, matchId):
+        """
+        ARGS:
+            matchId (str) - id of the match
+        RETURNS:
+            str - season of the match, None if it is not in the archive
+        """
+        return self._matchSeasons.get(str(matchId))
+
+    def getMatch(self, matchId, subtrees=None):
+        """
+        Decode a single match
+        ARGS:
+            matchId (str) - id of the match
+            subtrees ([str]) - gamePackage subtrees to decode, e.g. MATCH_SUBTREES, None for the full payload
+        RETURNS:
+            dict - match dictionary, None if the match is not in the archive
+        """
+        matchId = str(matchId)
+        season = self._matchSeasons.get(matchId)
+        if season is None:
+            return None
+        matchDict = {}
+        gamePackage = {}
+        for name, offset, length, rawLength in self._seasons[season][matchId]:
+            if name == REST:
+                if subtrees is None:
+                    matchDict.update(json.loads(self._decompress(self._data[offset:offset + length])))
+            elif subtrees is None or name in subtrees:
+                gamePackage[name] = json.loads(self._decompress(self._data[offset:offset + length]))
+        matchDict['gamePackage'] = gamePackage
+        return matchDict
+
+    def toLeagueDict(self, subtrees=None, seasons=None):
+        """
+        Decode every match into a league database dictionary
+        ARGS:
+            subtrees ([str]) - gamePackage subtrees to decode, e.g. MATCH_SUBTREES, None for the full payload
+            seasons ([str]) - seasons to decode, None for every season
+        RETURNS:
+            dict - league database in the form {season: {matchId: matchDict}}
+        """
+        return dict((season, dict((matchId, self.getMatch(matchId, subtrees)) for matchId in seasonIndex.keys()))
+                    for season, seasonIndex in self._seasons.items() if seasons is None or season in seasons)
+
+    def getStats(self):
+        """
+        Get the compression stats of the archive
+        RETURNS:
+            dict - archive stats in the form {'matches': int, 'rawBytes': int, 'compressedBytes': int, 'ratio': float}
+        """
+        rawBytes = 0
+        compressedBytes = 0
+        for seasonIndex in self._seasons.values():
+            for frames in seasonIndex.values():
+                for name, offset, length, rawLength in frames:
+                    rawBytes += rawLength
+                    compressedBytes += length
+        return {'matches': len(self._matchSeasons),
+                'rawBytes': rawBytes,
+                'compressedBytes': compressedBytes,
+                'ratio': float(rawBytes) / compressedBytes if compressedBytes else 0.0}
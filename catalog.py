@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+from rugbydb import parseIsoDate
+from symbols import TEAMS
+
+# match pages have no round number, kick offs more than this apart start a new round
+ROUND_GAP = timedelta(days=3)
+
+
+class SeasonCatalog(object):
+    """
+    Teams, kick off span, match count and rounds of a single league season,
+    read from the game strip of each match so no Match is built. Each match's
+    entry is kept so the catalog can be updated incrementally at ingest and
+    answered for a subset of the season's matches
+    """
+
+    @classmethod
+    def fromMatchDicts(cls, matchDicts):
+        """
+        Build a catalog from the stored match dictionaries for a season
+        ARGS:
+            matchDicts (dict) - dictionary in the form {matchId: matchDict}
+        RETURNS:
+            SeasonCatalog (obj) - new SeasonCatalog object
+        """
+        catalog = cls()
+        for matchId, matchDict in matchDicts.items():
+            catalog.addMatch(matchId, matchDict)
+        return catalog
+
+    @classmethod
+    def fromDict(cls, catalogDict):
+        """
+        Load a catalog stored with toDict
+        ARGS:
+            catalogDict (dict) - dictionary from toDict
+        RETURNS:
+            SeasonCatalog (obj) - new SeasonCatalog object
+        """
+        catalog = cls()
+        for matchId, (isoDate, homeTeam, awayTeam) in catalogDict['entries'].items():
+            catalog._addEntry(matchId, isoDate, homeTeam, awayTeam)
+        return catalog
+
+    @classmethod
+    def union(cls, catalogs):
+        """
+        Combine the catalogs of several seasons, e.g. for a match list spanning seasons
+        ARGS:
+            catalogs ([SeasonCatalog]) - catalogs to combine
+        RETURNS:
+            SeasonCatalog (obj) - new SeasonCatalog object with the matches of every catalog
+        """
+        catalog = cls()
+        for seasonCatalog in catalogs:
+            catalog._entries.update(seasonCatalog._entries)
+        return catalog
+
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        """
+        Number of matches in the catalog
+        """
+        return len(self._entries)
+
+    def __contains__(self, matchId):
+        return str(matchId) in self._entries
+
+    def addMatch(self, matchId, matchDict):
+        """
+        Add a match to the catalog, replacing it if it is already included
+        ARGS:
+            matchId (str) - id of the match
+            matchDict (dict) - match dictionary from the database
+        """
+        gameStrip = matchDict['gamePackage']['gameStrip']
+        self._addEntry(matchId, gameStrip['isoDate'], gameStrip['teams']['home']['name'], gameStrip['teams']['away']['name'])
+
+    def removeMatch(self, matchId):
+        """
+        Remove a match from the catalog, does nothing if it is not included
+        ARGS:
+            matchId (str) - id of the match
+        """
+        self._entries.pop(str(matchId), None)
+
+    def _addEntry(self, matchId, isoDate, homeTeam, awayTeam):
+        """
+        Internal function to add the entry for a single match
+        """
+        self._entries[str(matchId)] = (isoDate, TEAMS.intern(homeTeam), TEAMS.intern(awayTeam), parseIsoDate(isoDate))
+
+    def _getEntries(self, matchIds=None):
+        """
+        Internal function to get the entries of every match or only the given matches, in kick off order
+        """
+        if matchIds is None:
+            entries = self._entries.items()
+        else:
+            entries = [(str(matchId), self._entries[str(matchId)]) for matchId in matchIds if str(matchId) in self._entries]
+        return sorted(entries, key=lambda entry: (entry[1][3], entry[0]))
+
+    def getMatchIds(self):
+        """
+        Return all match ids in the catalog
+        RETURNS:
+            [str] - list of match ids
+        """
+        return sorted(self._entries.keys())
+
+    def getTeams(self, matchIds=None):
+        """
+        Get the teams that play in the season
+        ARGS:
+            matchIds ([str]) - only include these matches, default every match
+        RETURNS:
+            [str] - sorted list of lower case team names
+        """
+        teams = set()
+        for matchId, (isoDate, homeTeam, awayTeam, kickoff) in self._getEntries(matchIds):
+            teams.add(homeTeam)
+            teams.add(awayTeam)
+        return sorted(teams)
+
+    def getDateSpan(self, matchIds=None):
+        """
+        Get the first and last kick off of the season
+        ARGS:
+            matchIds ([str]) - only include these matches, default every match
+        RETURNS:
+            (datetime, datetime) - first and last kick off, (None, None) if there are no matches
+        """
+        entries = self._getEntries(matchIds)
+        if not entries:
+            return None, None
+        return entries[0][1][3], entries[-1][1][3]
+
+    def getRounds(self, matchIds=None):
+        """
+        Group the matches into rounds, a new round starts when there are more
+        than ROUND_GAP between consecutive kick offs
+        ARGS:
+            matchIds ([str]) - only include these matches, default every match
+        RETURNS:
+            [[str]] - list of rounds in kick off order, each a list of match ids
+        """
+        rounds = []
+        lastKickoff = None
+        for matchId, (isoDate, homeTeam, awayTeam, kickoff) in self._getEntries(matchIds):
+            if lastKickoff is None or kickoff - lastKickoff > ROUND_GAP:
+                rounds.append([])
+            rounds[-1].append(matchId)
+            lastKickoff = kickoff
+        return rounds
+
+    def toDict(self):
+        """
+        Return the catalog in a form that can be stored beside the database
+        RETURNS:
+            dict - dictionary of the season's teams, kick off span, match count, rounds and match entries
+        """
+        entries = self._getEntries()
+        return {'teams': self.getTeams(),
+                'firstKickoff': entries[0][1][0] if entries else None,
+                'lastKickoff': entries[-1][1][0] if entries else None,
+                'matches': len(self),
+                'rounds': self.getRounds(),
+                'entries': dict((matchId, entry[:3]) for matchId, entry in entries)}
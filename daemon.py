@@ -0,0 +1,358 @@
+import json
+import os
+import socket
+import SocketServer
+import struct
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+from match import MatchList, Match
+from league import League
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "rugbydb.sock")
+
+# rugby_stats functions that only take plain arguments and can be called remotely
+STAT_FUNCTIONS = ('getAveragePointsScored', 'getAverageStatForTeam', 'getLeagueLeadersForStatTotal', 'getTeamStatTable')
+
+HEADER = struct.Struct("!I")
+
+
+def _sendMessage(connection, message):
+    """
+    Internal function to write a length prefixed compact json message to a socket
+    """
+    body = json.dumps(message, separators=(',', ':'))
+    connection.sendall(HEADER.pack(len(body)) + body)
+
+
+def _readExactly(stream, size):
+    """
+    Internal function to read a number of bytes from a socket file, None at the end of the stream
+    """
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+def _readMessage(stream):
+    """
+    Internal function to read a length prefixed json message from a socket file, None at the end of the stream
+    """
+    header = _readExactly(stream, HEADER.size)
+    if header is None:
+        return None
+    body = _readExactly(stream, HEADER.unpack(header)[0])
+    return json.loads(body) if body is not None else None
+
+
+def _parseDate(date):
+    """
+    Internal function to read an iso date sent by the client
+    """
+    return datetime.strptime(date[:19], "%Y-%m-%dT%H:%M:%S") if date is not None else None
+
+
+def _matchQuery(leagues=None, seasons=None, teams=None, startDate=None, endDate=None):
+    """
+    Internal function to build a query from the filters sent by the client
+    """
+    from query import query
+    matchQuery = query().season(seasons).team(teams).dateRange(_parseDate(startDate), _parseDate(endDate))
+    return matchQuery.league(leagues) if leagues else matchQuery
+
+
+def _getMatchesByIds(matchIds):
+    """
+    Internal function to get several match dictionaries in one request
+    """
+    from rugbydb import CachedDB
+    db = CachedDB()
+    return dict((str(matchId), db.getMatchById(matchId)) for matchId in matchIds)
+
+
+def _records(*filters):
+    """
+    Internal function to get the records of a query in the form [leagueId, season, matchId, matchDict]
+    """
+    return [list(record) for record in _matchQuery(*filters).records()]
+
+
+def _stat(functionName, args):
+    """
+    Internal function to call one of STAT_FUNCTIONS
+    """
+    import rugby_stats
+    if functionName not in STAT_FUNCTIONS:
+        raise ValueError("Unknown stat function {}, expected one of {}".format(functionName, STAT_FUNCTIONS))
+    return getattr(rugby_stats, functionName)(*args)
+
+
+def _league(leagueName):
+    """
+    Internal function to resolve a league name or id to [leagueId, leagueName]
+    """
+    from query import getLeagueId
+    from variables import MATCH_IDS
+    leagueId = getLeagueId(leagueName)
+    if leagueId is None:
+        return None
+    return [leagueId, MATCH_IDS[leagueId]['name']]
+
+
+OPERATIONS = {'ping': lambda: 'pong',
+              'getMatchById': lambda matchId: _getMatchesByIds([matchId])[str(matchId)],
+              'getMatchesByIds': _getMatchesByIds,
+              'matchIds': lambda *filters: list(_matchQuery(*filters).matchIds()),
+              'records': _records,
+              'league': _league,
+              'stat': _stat}
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Internal handler answering every request on a client connection until it closes
+    """
+
+    def handle(self):
+        while True:
+            request = _readMessage(self.rfile)
+            if request is None:
+                break
+            try:
+                response = {'ok': True, 'result': OPERATIONS[request['op']](*request.get('args', []))}
+            except Exception as e:
+                response = {'ok': False, 'error': repr(e)}
+            _sendMessage(self.connection, response)
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class RugbyDaemon(object):
+    """
+    Resident process keeping the database, its indexes, season summaries and
+    the stat result cache warm, answering queries from DaemonClient over a
+    local unix socket with length prefixed compact json messages
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        """
+        ARGS:
+            path (str) - unix socket path to listen on, a stale socket file is replaced
+        """
+        from rugbydb import warmUp
+        self.path = path
+        warmUp(background=False)
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = _Server(path, _RequestHandler)
+        os.chmod(path, 0o600)
+        self._thread = None
+
+    def serveForever(self):
+        """
+        Answer requests until shutdown is called
+        """
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Answer requests in a background thread
+        RETURNS:
+            threading.Thread - thread running the server
+        """
+        self._thread = threading.Thread(target=self.serveForever, name="RugbyDaemon")
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def shutdown(self):
+        """
+        Stop answering requests and remove the socket file
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DaemonClient(object):
+    """
+    Thin client for a RugbyDaemon, returns the same Match, MatchList and League
+    objects as the local database without loading it in this process
+    """
+
+    def __init__(self, path=SOCKET_PATH, timeout=None):
+        """
+        ARGS:
+            path (str) - unix socket path of the daemon
+            timeout (float) - seconds to wait for a response, None to wait forever
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._stream = self._socket.makefile('rb')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._stream.close()
+        self._socket.close()
+
+    def _call(self, op, *args):
+        """
+        Internal function to send a request and wait for its result
+        """
+        with self._lock:
+            _sendMessage(self._socket, {'op': op, 'args': args})
+            response = _readMessage(self._stream)
+        if response is None:
+            raise IOError("Rugby daemon closed the connection")
+        if not response['ok']:
+            raise RuntimeError("Rugby daemon request {} failed: {}".format(op, response['error']))
+        return response['result']
+
+    def ping(self):
+        """
+        Check the daemon is answering
+        RETURNS:
+            bool - True if the daemon answered
+        """
+        return self._call('ping') == 'pong'
+
+    def getMatchById(self, matchId):
+        """
+        Get a match dictionary for a given id
+        ARGS:
+            matchId (str) - match id to search for
+        RETURNS:
+            matchDict - match dictionary if found else None
+        """
+        return self._call('getMatchById', str(matchId))
+
+    def getMatchIds(self, leagues=None, seasons=None, teams=None, startDate=None, endDate=None):
+        """
+        Get the ids of the matches that pass every filter without sending the matches
+        ARGS:
+            leagues ([str]) - list of league ids or names, all leagues if None
+            seasons ([str]) - list of seasons, all seasons if None
+            teams ([str]) - list of team names, all teams if None
+            startDate (datetime) - start date in range to search, default no limit
+            endDate (datetime) - end date in range to search, default no limit
+        RETURNS:
+            [str] - list of match ids
+        """
+        return self._call('matchIds', leagues, seasons, teams,
+                          startDate.isoformat() if startDate is not None else None,
+                          endDate.isoformat() if endDate is not None else None)
+
+    def matchFromId(self, matchId):
+        """
+        Create a Match object from match id
+        ARGS:
+            matchId (str) - id for a match to create object for
+        RETURNS
+            Match (obj) - Match object, None if not found
+        """
+        matchDict = self.getMatchById(matchId)
+        return Match(matchDict) if matchDict is not None else None
+
+    def matchList(self, matchIds):
+        """
+        Create a MatchList from match ids in one request
+        ARGS:
+            matchIds ([str]) - list of match ids
+        RETURNS:
+            MatchList (obj) - MatchList object with the matches found
+        """
+        matches = MatchList(matchIds=[])
+        for matchId, matchDict in self._call('getMatchesByIds', [str(matchId) for matchId in matchIds]).items():
+            if matchDict is not None:
+                matches.addMatch(matchId, Match(matchDict))
+        return matches
+
+    def _matchListFromRecords(self, *filters):
+        """
+        Internal function to create a MatchList for the matches of a query
+        """
+        matches = MatchList(matchIds=[])
+        for league, season, matchId, matchDict in self._call('records', *filters):
+            matches.addMatch(matchId, Match(matchDict))
+        return matches
+
+    def matchListForTeam(self, teamName, leagues=None, seasons=None):
+        """
+        Create a match list for a specific team, filter by league or seasons
+        ARGS:
+            teamName (str) - name of the team
+            leagues ([str]) - list of league ids or names to filter by, search all leagues if None
+            seasons ([str]) - list of seasons to filter by, search all seasons if None
+        RETURNS
+            MatchList - MatchList object
+        """
+        return self._matchListFromRecords(leagues, seasons, [teamName.lower()])
+
+    def getMatchesInDateRange(self, startDate=None, endDate=None, leagues=None):
+        """
+        Create a match list for the matches in a date range
+        ARGS:
+            startDate (datetime) - start date in range to search, default no limit
+            endDate (datetime) - end date in range to search, default no limit
+            leagues ([str]) - list of league ids or names to filter by, search all leagues if None
+        RETURNS:
+            MatchList (obj) - MatchList object with matches in date range
+        """
+        return self._matchListFromRecords(leagues, None, None,
+                                          startDate.isoformat() if startDate is not None else None,
+                                          endDate.isoformat() if endDate is not None else None)
+
+    def league(self, leagueName, seasons=None):
+        """
+        Create a League with every stored match loaded
+        ARGS:
+            leagueName (str) - league name or id
+            seasons ([str]) - list of seasons to load, all seasons if None
+        RETURNS:
+            League (obj) - League object, None if the league is not found
+        """
+        leagueInfo = self._call('league', leagueName)
+        if leagueInfo is None:
+            return None
+        league = League(leagueInfo[0], leagueInfo[1], matchIdDict={}, initMatches=False)
+        seasonMatches = {}
+        for leagueId, season, matchId, matchDict in self._call('records', [leagueInfo[0]], seasons):
+            seasonMatches.setdefault(season, MatchList(matchIds=[])).addMatch(matchId, Match(matchDict))
+        for season, matches in seasonMatches.items():
+            league.addSeason(season, matches)
+        return league
+
+    def stat(self, functionName, *args):
+        """
+        Call a function from rugby_stats in the daemon
+        ARGS:
+            functionName (str) - name of the function, one of STAT_FUNCTIONS
+            args - arguments for the function
+        RETURNS:
+            result of the function, tuples are returned as lists
+        """
+        return self._call('stat', functionName, args)
+
+
+if __name__ == "__main__":
+    daemon = RugbyDaemon(sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH)
+    print("Serving rugby database on {}".format(daemon.path))
+    try:
+        daemon.serveForever()
+    except KeyboardInterrupt:
+        daemon.shutdown()
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import time
+
+import variables
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "rugby_database", "manifest.json")
+
+MANIFEST = None
+MANIFEST_LOCK = threading.Lock()
+
+def getManifest():
+    """
+    Use the cached manifest to avoid reading the manifest file multiple times
+    RETURNS:
+        MatchManifest (obj) - MatchManifest object
+    """
+    global MANIFEST
+    if MANIFEST is None:
+        with MANIFEST_LOCK:
+            if MANIFEST is None:
+                MANIFEST = MatchManifest()
+    return MANIFEST
+
+def _getStoredTeams(db, leagueId):
+    """
+    Internal function to get the lower case names of every team stored for a league, read from the season catalogs
+    """
+    teams = set()
+    for season in variables.MATCH_IDS[leagueId]['matchIds'].keys():
+        catalog = db.getSeasonCatalog(leagueId, season)
+        if catalog is not None:
+            teams.update(catalog.getTeams())
+    return teams
+
+def getLeagueMatchIds(leagueId, manifest=None):
+    """
+    Get the match ids for every season of a league with known non-matches removed
+    ARGS:
+        leagueId (str) - id of the league
+        manifest (MatchManifest) - manifest to read, default the cached manifest
+    RETURNS:
+        dict - dictionary in the form {'season': MatchIdRange}
+    """
+    manifest = manifest if manifest is not None else getManifest()
+    return dict((season, manifest.getSeasonMatchIds(leagueId, season))
+                for season in variables.MATCH_IDS[leagueId]['matchIds'].keys())
+
+
+class MatchManifest(object):
+    """
+    Resolved match ids for each league season and a negative cache of ids
+    that are not matches, either because there is no match page or because
+    the match belongs to another league. Configured MATCH_IDS ranges are
+    narrowed by both so scrapes and League loads skip ids already known not
+    to be matches of the league. Read from json beside the database files,
+    writers save it with the rest of their write directory
+    """
+
+    def __init__(self, path=MANIFEST_PATH, retryMissing=7 * 24 * 60 * 60):
+        """
+        ARGS:
+            path (str) - json file to load the manifest from and save it to
+            retryMissing (float) - seconds before an id with no match page is tried again,
+                                   fixtures that have not been played have no page yet
+        """
+        self.path = path
+        self.retryMissing = retryMissing
+        self._found = {}
+        self._missing = {}
+        self._leagues = {}
+        self._lock = threading.RLock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """
+        Read the manifest file
+        """
+        with open(self.path) as manifestFile:
+            manifestDict = json.loads(manifestFile.read())
+        with self._lock:
+            self._found = dict((leagueId, dict((season, set(matchIds)) for season, matchIds in seasons.items()))
+                               for leagueId, seasons in manifestDict.get('found', {}).items())
+            self._missing = manifestDict.get('missing', {})
+            self._leagues = manifestDict.get('leagues', {})
+
+    def save(self, path=None):
+        """
+        Write the manifest file
+        ARGS:
+            path (str) - json file to write, default the file the manifest was loaded from
+        """
+        path = path if path is not None else self.path
+        with self._lock:
+            manifestDict = {'found': dict((leagueId, dict((season, sorted(matchIds)) for season, matchIds in seasons.items()))
+                                          for leagueId, seasons in self._found.items()),
+                            'missing': self._missing,
+                            'leagues': self._leagues}
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "w") as manifestFile:
+            manifestFile.write(json.dumps(manifestDict, indent=4, sort_keys=True))
+
+    def addFound(self, leagueId, season, matchId):
+        """
+        Record an id as a match of a league season
+        ARGS:
+            leagueId (str) - id of the league
+            season (str) - season string
+            matchId (str) - id of the match
+        """
+        matchId = str(matchId)
+        with self._lock:
+            self._found.setdefault(leagueId, {}).setdefault(season, set()).add(matchId)
+            self._missing.pop(matchId, None)
+            self._leagues[matchId] = leagueId
+
+    def addOtherLeague(self, leagueId, matchId):
+        """
+        Record an id as a match of a league without a known season, e.g. a page
+        fetched while resolving another league whose ids overlap
+        ARGS:
+            leagueId (str) - id of the league the match belongs to
+            matchId (str) - id of the match
+        """
+        with self._lock:
+            self._missing.pop(str(matchId), None)
+            self._leagues[str(matchId)] = leagueId
+
+    def getPageLeague(self, leagueId, matchId, matchDict, db=None):
+        """
+        Work out which league a fetched match page belongs to, the game strip does not
+        name the competition so when the id is configured in more than one league the
+        teams are compared with each league's stored teams
+        ARGS:
+            leagueId (str) - id of the league being resolved
+            matchId (str) - id of the match
+            matchDict (dict) - match dictionary of the fetched page
+            db (RugbyDB) - database to read stored teams from, default no team check
+        RETURNS:
+            str - league id of the match, leagueId when the page cannot be placed in another league
+        """
+        gameStrip = matchDict['gamePackage']['gameStrip']
+        candidates = [league for league, leagueDict in sorted(variables.MATCH_IDS.items())
+                      if any(int(matchId) in seasonIds for seasonIds in leagueDict['matchIds'].values())]
+        if db is None or candidates == [leagueId] or leagueId not in candidates:
+            return leagueId
+        teams = set(name.lower() for name in (gameStrip['teams']['home']['name'], gameStrip['teams']['away']['name']))
+        playedIn = [league for league in candidates if teams <= set(_getStoredTeams(db, league))]
+        if leagueId not in playedIn and len(playedIn) == 1:
+            return playedIn[0]
+        return leagueId
+
+    def addMissing(self, matchId):
+        """
+        Record an id as having no match page
+        ARGS:
+            matchId (str) - id with no match page
+        """
+        with self._lock:
+            self._missing[str(matchId)] = time.time()
+
+    def getLeague(self, matchId):
+        """
+        Get the league a match id was found in
+        ARGS:
+            matchId (str) - id of the match
+        RETURNS:
+            str - league id, None if the id has not been found in any league
+        """
+        return self._leagues.get(str(matchId))
+
+    def isMiss(self, leagueId, matchId):
+        """
+        Check the negative cache for an id
+        ARGS:
+            leagueId (str) - id of the league being resolved
+            matchId (str) - id to check
+        RETURNS:
+            bool - True if the id has no match page or is a match of another league
+        """
+        matchId = str(matchId)
+        missed = self._missing.get(matchId)
+        if missed is not None and time.time() - missed < self.retryMissing:
+            return True
+        foundLeague = self._leagues.get(matchId)
+        return foundLeague is not None and foundLeague != leagueId
+
+    def getCandidates(self, leagueId, season, force=False):
+        """
+        Get the configured ids of a league season that may still need to be fetched
+        ARGS:
+            leagueId (str) - id of the league
+            season (str) - season string
+            force (bool) - True = include ids already found in the season
+        RETURNS:
+            [int] - match ids not in the negative cache
+        """
+        found = self._found.get(leagueId, {}).get(season, set())
+        return [matchId for matchId in variables.MATCH_IDS[leagueId]['matchIds'][season]
+                if not self.isMiss(leagueId, matchId) and (force or str(matchId) not in found)]
+
+    def getSeasonMatchIds(self, leagueId, season):
+        """
+        Get the exact match ids of a league season, ids not resolved yet are kept
+        ARGS:
+            leagueId (str) - id of the league
+            season (str) - season string
+        RETURNS:
+            MatchIdRange (obj) - ids found in the season and configured ids not yet resolved
+        """
+        configured = variables.MATCH_IDS[leagueId]['matchIds'][season]
+        if not self._found and not self._missing:
+            return configured
+        found = self._found.get(leagueId, {}).get(season, set())
+        return variables.MatchIdRange.fromIds([matchId for matchId in configured
+                                               if str(matchId) in found or not self.isMiss(leagueId, matchId)])
+
+    def compact(self):
+        """
+        Compact MATCH_IDS into exact ids for every league season
+        RETURNS:
+            dict - dictionary in the same form as MATCH_IDS
+        """
+        return dict((leagueId, {'name': leagueDict['name'], 'matchIds': getLeagueMatchIds(leagueId, self)})
+                    for leagueId, leagueDict in variables.MATCH_IDS.items())
+
+    def addDatabase(self, db):
+        """
+        Record every match already stored in a database as found
+        ARGS:
+            db (RugbyDB) - database to read
+        """
+        for league, year, matchId, matchDict in db.iterMatches():
+            self.addFound(league, year, matchId)
+
@@ -0,0 +1,192 @@
+import bisect
+
+from match import Match
+from query import getLeagueId
+
+class StatDistributions(object):
+    """
+    Per position, per league season distributions of player per 80 stats.
+    Each distribution is a sorted list built once per filter, so percentile,
+    quantile and histogram queries are binary searches and new appearances
+    are inserted into the distributions already built
+    """
+
+    @classmethod
+    def fromQuery(cls, matchQuery):
+        """
+        Build the distributions from every player appearance in a query
+        ARGS:
+            matchQuery (Query) - query of the matches to include, e.g. query().league('Premiership')
+        RETURNS:
+            StatDistributions (obj) - new StatDistributions object
+        """
+        distributions = cls()
+        for league, season, matchId, matchDict in matchQuery.records():
+            distributions.addMatch(league, season, matchId, Match(matchDict))
+        return distributions
+
+    def __init__(self):
+        self._appearances = []
+        self._matchAppearances = {}
+        self._playerAppearances = {}
+        self._sorted = {}
+
+    def __len__(self):
+        """
+        Number of player appearances with minutes played
+        """
+        return len(self._appearances)
+
+    def addMatch(self, league, season, matchId, match):
+        """
+        Add every player appearance in a match, a match already added is replaced
+        ARGS:
+            league (str) - league id of the match
+            season (str) - season string of the match
+            matchId (str) - id of the match
+            match (Match) - Match object
+        """
+        matchId = str(matchId)
+        if matchId in self._matchAppearances:
+            self._appearances = [appearance for appearance in self._appearances if appearance[2] != matchId]
+            for appearance in self._matchAppearances[matchId]:
+                self._playerAppearances[appearance[3]].remove(appearance)
+            self._sorted = {}
+        appearances = []
+        for team in match.players.keys():
+            for player in match.players[team]:
+                if player.minutesPlayed:
+                    appearance = (league, season, matchId, player.id, player.position, float(player.minutesPlayed), player.matchStats)
+                    appearances.append(appearance)
+                    self._appearances.append(appearance)
+                    self._playerAppearances.setdefault(player.id, []).append(appearance)
+                    self._insert(appearance)
+        self._matchAppearances[matchId] = appearances
+
+    def attach(self, db):
+        """
+        Keep the distributions up to date with matches added to a RugbyDBReadWrite database
+        ARGS:
+            db (RugbyDBReadWrite) - database to listen to
+        """
+        db.addIngestListener(lambda leagueId, year, matchId, matchDict: self.addMatch(leagueId, year, matchId, Match(matchDict)))
+
+    def _matches(self, key, appearance):
+        """
+        Internal function to check if an appearance belongs in a distribution
+        """
+        league, season, position, stat, minMinutes = key
+        return ((league is None or appearance[0] == league) and
+                (season is None or appearance[1] == season) and
+                (position is None or appearance[4] == position) and
+                appearance[5] >= minMinutes and stat in appearance[6])
+
+    def _insert(self, appearance):
+        """
+        Internal function to insert a new appearance into every distribution already built
+        """
+        for key, values in self._sorted.items():
+            if self._matches(key, appearance):
+                bisect.insort(values, appearance[6][key[3]] * 80.0 / appearance[5])
+
+    def getValues(self, stat, league=None, season=None, position=None, minMinutes=0):
+        """
+        Get the sorted per 80 values of a stat, built the first time a filter is used
+        ARGS:
+            stat (str) - stat name
+            league (str) - league id or name, None for all leagues
+            season (str) - season string, None for all seasons
+            position (str) - position, e.g. 'FL', None for all positions
+            minMinutes (float) - only include appearances with at least this many minutes
+        RETURNS:
+            [float] - sorted list of per 80 values
+        """
+        if league is not None:
+            league = getLeagueId(league)
+        key = (league, season, position, stat.lower(), minMinutes)
+        values = self._sorted.get(key)
+        if values is None:
+            values = sorted(appearance[6][key[3]] * 80.0 / appearance[5]
+                            for appearance in self._appearances if self._matches(key, appearance))
+            self._sorted[key] = values
+        return values
+
+    def getPercentile(self, value, stat, league=None, season=None, position=None, minMinutes=0):
+        """
+        Get the percentage of appearances with a per 80 value less than or equal to a value
+        ARGS:
+            value (float) - per 80 value to rank
+            stat (str) - stat name
+            league (str) - league id or name, None for all leagues
+            season (str) - season string, None for all seasons
+            position (str) - position, e.g. 'FL', None for all positions
+            minMinutes (float) - only include appearances with at least this many minutes
+        RETURNS:
+            float - percentile between 0 and 100, None if the distribution is empty
+        """
+        values = self.getValues(stat, league, season, position, minMinutes)
+        if not values:
+            return None
+        return 100.0 * bisect.bisect_right(values, value) / len(values)
+
+    def getQuantile(self, quantile, stat, league=None, season=None, position=None, minMinutes=0):
+        """
+        Get the per 80 value at a quantile, interpolating between appearances
+        ARGS:
+            quantile (float) - quantile between 0 and 1, e.g. 0.5 for the median
+            stat (str) - stat name
+            league (str) - league id or name, None for all leagues
+            season (str) - season string, None for all seasons
+            position (str) - position, e.g. 'FL', None for all positions
+            minMinutes (float) - only include appearances with at least this many minutes
+        RETURNS:
+            float - value at the quantile, None if the distribution is empty
+        """
+        values = self.getValues(stat, league, season, position, minMinutes)
+        if not values:
+            return None
+        index = quantile * (len(values) - 1)
+        lower = int(index)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+    def getHistogram(self, edges, stat, league=None, season=None, position=None, minMinutes=0):
+        """
+        Count the appearances between each pair of bin edges
+        ARGS:
+            edges ([float]) - sorted bin edges, each bin includes its lower edge
+            stat (str) - stat name
+            league (str) - league id or name, None for all leagues
+            season (str) - season string, None for all seasons
+            position (str) - position, e.g. 'FL', None for all positions
+            minMinutes (float) - only include appearances with at least this many minutes
+        RETURNS:
+            [int] - count for each bin, one less than the number of edges
+        """
+        values = self.getValues(stat, league, season, position, minMinutes)
+        positions = [bisect.bisect_left(values, edge) for edge in edges]
+        return [positions[index + 1] - positions[index] for index in range(len(edges) - 1)]
+
+    def getPlayerPercentile(self, playerId, stat, league=None, season=None, position=None, minMinutes=0):
+        """
+        Rank a player's per 80 value over their matching appearances against the distribution
+        ARGS:
+            playerId (str) - id of the player
+            stat (str) - stat name
+            league (str) - league id or name, None for all leagues
+            season (str) - season string, None for all seasons
+            position (str) - position, e.g. 'FL', None for all positions
+            minMinutes (float) - only include appearances with at least this many minutes
+        RETURNS:
+            float - percentile between 0 and 100, None if the player has no matching appearances
+        """
+        key = (getLeagueId(league) if league is not None else None, season, position, stat.lower(), minMinutes)
+        total = 0.0
+        minutes = 0.0
+        for appearance in self._playerAppearances.get(playerId, []):
+            if self._matches(key, appearance):
+                total += appearance[6][key[3]]
+                minutes += appearance[5]
+        if not minutes:
+            return None
+        return self.getPercentile(total * 80.0 / minutes, stat, league, season, position, minMinutes)
@@ -0,0 +1,203 @@
+import csv
+import os
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from match import Match
+from query import query
+
+# Columns of each exported table in the form (column, type), stats are stored
+# in long form with one row per stat so the columns stay fixed between chunks
+TABLES = {'matches': [('matchId', 'string'), ('league', 'string'), ('season', 'string'), ('date', 'string'),
+                      ('homeTeam', 'string'), ('awayTeam', 'string'), ('homeScore', 'float'), ('awayScore', 'float')],
+          'teamStats': [('matchId', 'string'), ('team', 'string'), ('side', 'string'), ('stat', 'string'), ('value', 'float')],
+          'players': [('matchId', 'string'), ('team', 'string'), ('playerId', 'string'), ('name', 'string'),
+                      ('number', 'int'), ('position', 'string'), ('captain', 'bool'), ('minutesPlayed', 'float')],
+          'playerStats': [('matchId', 'string'), ('team', 'string'), ('playerId', 'string'), ('stat', 'string'), ('value', 'float')],
+          'events': [('matchId', 'string'), ('index', 'int'), ('type', 'int'), ('typeString', 'string'), ('time', 'int'),
+                     ('addedTime', 'int'), ('text', 'string'), ('homeScore', 'float'), ('awayScore', 'float')]}
+
+FORMATS = ('parquet', 'arrow', 'csv')
+
+
+def _optional(convert, value):
+    """
+    Internal function to convert a value, keeping missing values as None
+    """
+    return None if value is None or value == '' else convert(value)
+
+
+def getMatchRows(league, season, matchId, match):
+    """
+    Flatten a match into rows for every exported table
+    ARGS:
+        league (str) - league id of the match
+        season (str) - season string of the match
+        matchId (str) - id of the match
+        match (Match) - Match object
+    RETURNS:
+        dict - rows for each table in the form {table: [tuple]}, columns ordered as in TABLES
+    """
+    matchId = str(matchId)
+    homeTeam = match.homeTeam['name']
+    awayTeam = match.awayTeam['name']
+    rows = {'matches': [(matchId, league, season, match.date.isoformat(), homeTeam, awayTeam,
+                         _optional(float, match.homeTeam['score']), _optional(float, match.awayTeam['score']))],
+            'teamStats': [],
+            'players': [],
+            'playerStats': [],
+            'events': []}
+    for stat in sorted(match.matchStats.keys()):
+        rows['teamStats'].append((matchId, homeTeam, 'home', stat, match.matchStats[stat]['homeValue']))
+        rows['teamStats'].append((matchId, awayTeam, 'away', stat, match.matchStats[stat]['awayValue']))
+    for team in (homeTeam, awayTeam):
+        for player in match.players.get(team, []):
+            rows['players'].append((matchId, team, str(player.id), player.name, _optional(int, player.number),
+                                    player.position, bool(player.isCaptain), _optional(float, player.minutesPlayed)))
+            for stat in sorted(player.matchStats.keys()):
+                rows['playerStats'].append((matchId, team, str(player.id), stat, player.matchStats[stat]))
+    for index, event in enumerate(match.matchEventList.matchEvents):
+        rows['events'].append((matchId, index, event.type, str(event.typeString), event.time, event.addedTime,
+                               event.text, _optional(float, event.homeScore), _optional(float, event.awayScore)))
+    return rows
+
+
+class CsvTableWriter(object):
+    """
+    Streaming writer for one table to a csv file with a header row
+    """
+
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        """
+        ARGS:
+            path (str) - file to write
+            columns ([(str, str)]) - columns of the table in the form (column, type)
+        """
+        self._file = open(path, 'wb')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column for column, columnType in columns])
+
+    def write(self, rows):
+        """
+        Write a chunk of rows
+        ARGS:
+            rows ([tuple]) - rows to write
+        """
+        self._writer.writerows([[value.encode('utf-8') if isinstance(value, unicode) else value for value in row]
+                                for row in rows])
+
+    def close(self):
+        self._file.close()
+
+
+class ArrowTableWriter(object):
+    """
+    Streaming writer for one table to a parquet or arrow file, each chunk is
+    written as its own row group or record batch. Requires pyarrow
+    """
+
+    TYPES = {'string': 'string', 'int': 'int64', 'float': 'float64', 'bool': 'bool_'}
+
+    def __init__(self, path, columns, fileFormat='parquet'):
+        """
+        ARGS:
+            path (str) - file to write
+            columns ([(str, str)]) - columns of the table in the form (column, type)
+            fileFormat (str) - 'parquet' or 'arrow'
+        """
+        if pyarrow is None:
+            raise ImportError("{} export requires pyarrow".format(fileFormat))
+        self._types = [getattr(pyarrow, self.TYPES[columnType])() for column, columnType in columns]
+        self._schema = pyarrow.schema([pyarrow.field(column, arrowType)
+                                       for (column, columnType), arrowType in zip(columns, self._types)])
+        self._fileFormat = fileFormat
+        if fileFormat == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        else:
+            self._sink = pyarrow.OSFile(path, 'wb')
+            self._writer = pyarrow.ipc.new_file(self._sink, self._schema)
+
+    def write(self, rows):
+        """
+        Write a chunk of rows
+        ARGS:
+            rows ([tuple]) - rows to write
+        """
+        arrays = [pyarrow.array(list(column), type=arrowType) for column, arrowType in zip(zip(*rows), self._types)]
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema)
+        if self._fileFormat == 'parquet':
+            self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+        if self._fileFormat != 'parquet':
+            self._sink.close()
+
+
+def exportDatabase(outputDir, matchQuery=None, fileFormat=None, chunkSize=10000):
+    """
+    Stream matches into flat match, team stat, player, player stat and event
+    tables, one file per table. Rows are buffered per table and written every
+    chunkSize rows so memory does not grow with the number of matches
+    ARGS:
+        outputDir (str) - directory to write the tables to, created if it does not exist
+        matchQuery (Query) - query of the matches to export, default every match in the database
+        fileFormat (str) - 'parquet', 'arrow' or 'csv', default parquet if pyarrow is installed otherwise csv
+        chunkSize (int) - number of rows to buffer for a table before writing them
+    RETURNS:
+        dict - path and number of rows written for each table in the form {table: (path, rows)}, with the
+               ids of the matches skipped because no players could be read under 'skipped'
+    """
+    if fileFormat is None:
+        fileFormat = 'parquet' if pyarrow is not None else 'csv'
+    if fileFormat not in FORMATS:
+        raise ValueError("Unknown format {}, expected one of {}".format(fileFormat, FORMATS))
+    matchQuery = matchQuery if matchQuery is not None else query()
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    paths = {}
+    writers = {}
+    try:
+        for table, columns in TABLES.items():
+            paths[table] = os.path.join(outputDir, "{}.{}".format(table, fileFormat))
+            if fileFormat == 'csv':
+                writers[table] = CsvTableWriter(paths[table], columns)
+            else:
+                writers[table] = ArrowTableWriter(paths[table], columns, fileFormat)
+        buffers = dict((table, []) for table in TABLES.keys())
+        counts = dict((table, 0) for table in TABLES.keys())
+        skipped = []
+        for league, season, matchId, matchDict in matchQuery.records():
+            match = Match(matchDict)
+            if not match.players:
+                print("Skipping export of {} ({} {}), no players".format(matchId, league, season))
+                skipped.append(str(matchId))
+                continue
+            for table, rows in getMatchRows(league, season, matchId, match).items():
+                buffers[table].extend(rows)
+                if len(buffers[table]) >= chunkSize:
+                    writers[table].write(buffers[table])
+                    counts[table] += len(buffers[table])
+                    buffers[table] = []
+        for table, rows in buffers.items():
+            if rows:
+                writers[table].write(rows)
+                counts[table] += len(rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if skipped:
+        print("Skipped {} matches with no players".format(len(skipped)))
+    tables = dict((table, (paths[table], counts[table])) for table in TABLES.keys())
+    tables['skipped'] = skipped
+    return tables
@@ -0,0 +1,237 @@
+import bisect
+from datetime import timedelta
+
+from match import Match
+
+class FormSeries(object):
+    """
+    Kick off ordered history of one team or player with running totals for
+    every stat, so any last N matches or last N days window is answered from
+    two running totals instead of summing the matches again
+    """
+
+    def __init__(self):
+        self.dates = []
+        self.matchIds = []
+        self.stats = []
+        self._totals = {}
+        self._counts = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def addMatch(self, date, matchId, stats):
+        """
+        Add a match to the series, matches arriving in date order are appended
+        and only the running totals after an out of order match are recomputed
+        ARGS:
+            date (datetime) - kick off of the match
+            matchId (str) - id of the match
+            stats (dict) - stat values in the form {stat: float}
+        """
+        self.removeMatch(matchId)
+        index = bisect.bisect_right(self.dates, date)
+        self.dates.insert(index, date)
+        self.matchIds.insert(index, matchId)
+        self.stats.insert(index, stats)
+        for stat in stats.keys():
+            if stat not in self._totals:
+                # the new match's entry is inserted with every other column below
+                self._totals[stat] = [0.0] * (len(self.dates) - 1)
+                self._counts[stat] = [0] * (len(self.dates) - 1)
+        for stat in self._totals.keys():
+            self._totals[stat].insert(index, 0.0)
+            self._counts[stat].insert(index, 0)
+        self._updateTotals(index)
+
+    def removeMatch(self, matchId):
+        """
+        Remove a match from the series, does nothing if it is not included
+        ARGS:
+            matchId (str) - id of the match
+        """
+        if matchId not in self.matchIds:
+            return
+        index = self.matchIds.index(matchId)
+        for column in [self.dates, self.matchIds, self.stats] + self._totals.values() + self._counts.values():
+            del column[index]
+        self._updateTotals(index)
+
+    def _updateTotals(self, start):
+        """
+        Internal function to recompute the running totals from an index to the end of the series
+        """
+        for stat in self._totals.keys():
+            totals = self._totals[stat]
+            counts = self._counts[stat]
+            total = totals[start - 1] if start > 0 else 0.0
+            count = counts[start - 1] if start > 0 else 0
+            for index in range(start, len(self.dates)):
+                value = self.stats[index].get(stat)
+                if value is not None:
+                    total += value
+                    count += 1
+                totals[index] = total
+                counts[index] = count
+
+    def _window(self, lastMatches=None, lastDays=None, endDate=None):
+        """
+        Internal function to get the (start, end) indexes of a window, end is exclusive
+        """
+        end = len(self.dates) if endDate is None else bisect.bisect_right(self.dates, endDate)
+        start = 0
+        if lastMatches is not None:
+            start = max(start, end - lastMatches)
+        if lastDays is not None:
+            windowEnd = endDate if endDate is not None else (self.dates[end - 1] if end else None)
+            if windowEnd is not None:
+                start = max(start, bisect.bisect_right(self.dates, windowEnd - timedelta(days=lastDays)))
+        return start, end
+
+    def getWindow(self, stat, lastMatches=None, lastDays=None, endDate=None):
+        """
+        Get the total and number of matches with the stat in a window
+        ARGS:
+            stat (str) - stat name
+            lastMatches (int) - only the last N matches, None for no limit
+            lastDays (int) - only matches in the N days up to the window end, None for no limit
+            endDate (datetime) - end of the window, default the latest match
+        RETURNS:
+            (float, int) - total of the stat and number of matches it was recorded in
+        """
+        if stat not in self._totals:
+            return 0.0, 0
+        start, end = self._window(lastMatches, lastDays, endDate)
+        if end <= start:
+            return 0.0, 0
+        totals = self._totals[stat]
+        counts = self._counts[stat]
+        total = totals[end - 1] - (totals[start - 1] if start > 0 else 0.0)
+        count = counts[end - 1] - (counts[start - 1] if start > 0 else 0)
+        return total, count
+
+
+class FormTable(object):
+    """
+    Rolling form for every team and player across any leagues, kept in
+    kick off order so club and international matches combine
+    """
+
+    @classmethod
+    def fromQuery(cls, matchQuery):
+        """
+        Build a form table from the matches in a query
+        ARGS:
+            matchQuery (Query) - query of the matches to include, e.g. query().team('Munster')
+        RETURNS:
+            FormTable (obj) - new FormTable object
+        """
+        formTable = cls()
+        for league, season, matchId, matchDict in matchQuery.records():
+            formTable.addMatch(matchId, Match(matchDict))
+        return formTable
+
+    def __init__(self):
+        self.teams = {}
+        self.players = {}
+        self._playerIds = {}
+
+    def addMatch(self, matchId, match):
+        """
+        Add a match to the form of both teams and every player, a match already
+        in the table is replaced
+        ARGS:
+            matchId (str) - id of the match
+            match (Match) - Match object
+        """
+        matchId = str(matchId)
+        for team in match.players.keys():
+            stats = {}
+            for stat in match.matchStats.keys():
+                stats[stat] = match.getStatForTeam(team, stat)
+            self.teams.setdefault(team, FormSeries()).addMatch(match.date, matchId, stats)
+            for player in match.players[team]:
+                stats = dict(player.matchStats)
+                if player.minutesPlayed is not None:
+                    stats['minutes played'] = float(player.minutesPlayed)
+                self.players.setdefault(player.id, FormSeries()).addMatch(match.date, matchId, stats)
+                self._playerIds.setdefault(player.name.lower(), set()).add(player.id)
+
+    def attach(self, db):
+        """
+        Keep the form table up to date with matches added to a RugbyDBReadWrite database
+        ARGS:
+            db (RugbyDBReadWrite) - database to listen to
+        """
+        db.addIngestListener(lambda leagueId, year, matchId, matchDict: self.addMatch(matchId, Match(matchDict)))
+
+    def _getPlayerSeries(self, player):
+        """
+        Internal function to find a player's series by id or name
+        """
+        if player in self.players:
+            return self.players[player]
+        playerIds = self._playerIds.get(player.lower(), ())
+        if len(playerIds) == 1:
+            return self.players[list(playerIds)[0]]
+        return None
+
+    def getTeamForm(self, team, stat, lastMatches=None, lastDays=None, endDate=None):
+        """
+        Average of a stat for a team over a window of its most recent matches
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+            lastMatches (int) - only the last N matches, None for no limit
+            lastDays (int) - only matches in the N days up to the window end, None for no limit
+            endDate (datetime) - end of the window, default the team's latest match
+        RETURNS:
+            float - average value in the window, None if not found
+        """
+        series = self.teams.get(team.lower())
+        if series is None:
+            return None
+        total, count = series.getWindow(stat.lower(), lastMatches, lastDays, endDate)
+        return total / count if count else None
+
+    def getPlayerForm(self, player, stat, lastMatches=None, lastDays=None, endDate=None, perEighty=False):
+        """
+        Average of a stat for a player over a window of their most recent appearances
+        ARGS:
+            player (str) - player id or name, names shared by several players return None
+            stat (str) - stat name
+            lastMatches (int) - only the last N appearances, None for no limit
+            lastDays (int) - only appearances in the N days up to the window end, None for no limit
+            endDate (datetime) - end of the window, default the player's latest appearance
+            perEighty (bool) - True = total in the window normalized for 80 mins played
+        RETURNS:
+            float - average value in the window, None if not found
+        """
+        series = self._getPlayerSeries(player)
+        if series is None:
+            return None
+        total, count = series.getWindow(stat.lower(), lastMatches, lastDays, endDate)
+        if not count:
+            return None
+        if perEighty:
+            minutes, minuteCount = series.getWindow('minutes played', lastMatches, lastDays, endDate)
+            return total * 80.0 / minutes if minutes else None
+        return total / count
+
+    def getFormTable(self, stat, lastMatches=5, lastDays=None, endDate=None):
+        """
+        Rank every team by its form in a stat
+        ARGS:
+            stat (str) - stat name
+            lastMatches (int) - only the last N matches, None for no limit
+            lastDays (int) - only matches in the N days up to the window end, None for no limit
+            endDate (datetime) - end of the window, default each team's latest match
+        RETURNS:
+            [(str, float),] - list of tuples sorted by value, in the form (teamName, statValue)
+        """
+        formTable = []
+        for team in self.teams.keys():
+            value = self.getTeamForm(team, stat, lastMatches, lastDays, endDate)
+            if value is not None:
+                formTable.append((team, value))
+        return sorted(formTable, key=lambda tup: tup[1], reverse=True)
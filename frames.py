@@ -0,0 +1,58 @@
+from collections import OrderedDict
+
+
+def getNumpy():
+    """
+    Import numpy the first time a frame is built so importing the package stays fast
+    RETURNS:
+        module - numpy module, raises an ImportError if numpy is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("toFrame requires numpy")
+    return numpy
+
+
+def getPandas():
+    """
+    Import pandas the first time a frame is built so importing the package stays fast
+    RETURNS:
+        module - pandas module, raises an ImportError if pandas is not installed
+    """
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError("toFrame requires pandas")
+    return pandas
+
+
+def statColumns(statDicts, prefix=""):
+    """
+    Build one float column per stat from a stat dictionary for each row, every
+    column is a view into a single array filled in one pass
+    ARGS:
+        statDicts ([dict]) - stats for each row in the form {stat: float}
+        prefix (str) - prefix added to each column name, e.g. 'home '
+    RETURNS:
+        [(str, numpy.ndarray)] - list of sorted columns in the form (columnName, values), NaN for missing stats
+    """
+    stats = sorted(set(stat for statDict in statDicts for stat in statDict.keys()))
+    positions = dict((stat, position) for position, stat in enumerate(stats))
+    numpy = getNumpy()
+    values = numpy.full((len(stats), len(statDicts)), numpy.nan)
+    for row, statDict in enumerate(statDicts):
+        for stat, value in statDict.items():
+            values[positions[stat], row] = value
+    return [(prefix + stat, values[positions[stat]]) for stat in stats]
+
+
+def toFrame(columns):
+    """
+    Build a DataFrame from column buffers
+    ARGS:
+        columns ([(str, list)]) - ordered columns in the form (columnName, values)
+    RETURNS:
+        pandas.DataFrame - frame with one column per buffer
+    """
+    return getPandas().DataFrame(OrderedDict(columns), columns=[name for name, values in columns])
@@ -0,0 +1,260 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from query import query, getLeagueId
+from rugbydb import CachedDB
+from statschema import parseMatchStats
+from symbols import TEAMS
+
+class HeadToHeadIndex(object):
+    """
+    Pairwise team x team index over a set of matches. Every team appearance
+    is a row in columns of stats for and stats against, and each
+    (team, opposition) pair keeps the rows of its meetings so head to head and
+    opponent adjusted aggregates never rebuild Match objects. The columns are
+    numpy arrays when numpy is installed so aggregates are vectorised,
+    otherwise plain lists
+    """
+
+    # season indexes in the form {(leagueId, season): (dbVersion, HeadToHeadIndex)}
+    _seasonCache = {}
+
+    @classmethod
+    def forSeason(cls, league, season):
+        """
+        Get the index for a league season, cached until the database version changes
+        ARGS:
+            league (str) - league id or name
+            season (str) - season string
+        RETURNS:
+            HeadToHeadIndex (obj) - index of every match in the season
+        """
+        seasonQuery = query().league(league).season(season)
+        key = (getLeagueId(league), season)
+        dbVersion = CachedDB().getVersion()
+        cached = cls._seasonCache.get(key)
+        if cached is None or cached[0] != dbVersion:
+            cached = cls._seasonCache[key] = (dbVersion, cls(seasonQuery.records()))
+        return cached[1]
+
+    def __init__(self, records):
+        """
+        ARGS:
+            records - iterable of match records in the form (leagueId, season, matchId, matchDict),
+                      e.g. Query.records()
+        """
+        self.teams = []
+        self._rowTeam = []
+        self._rowOpposition = []
+        self._rowMatchId = []
+        self._statsFor = {}
+        self._statsAgainst = {}
+        self._pairs = {}
+        self._teamRows = {}
+        for league, season, matchId, matchDict in records:
+            gameStrip = matchDict['gamePackage']['gameStrip']
+            homeTeam = self._getTeamId(gameStrip['teams']['home']['name'])
+            awayTeam = self._getTeamId(gameStrip['teams']['away']['name'])
+            matchStats = parseMatchStats(matchDict['gamePackage'])
+            self._addRow(matchId, homeTeam, awayTeam, matchStats, 'homeValue', 'awayValue')
+            self._addRow(matchId, awayTeam, homeTeam, matchStats, 'awayValue', 'homeValue')
+        if numpy is not None:
+            self._toArrays()
+
+    def __len__(self):
+        """
+        Number of team appearances in the index
+        """
+        return len(self._rowTeam)
+
+    def _getTeamId(self, team):
+        """
+        Internal function to get the symbol id of a team, adding it to the index teams if it is new
+        """
+        teamId = TEAMS.add(team)
+        if teamId not in self._teamRows:
+            self.teams.append(TEAMS.getName(teamId))
+        return teamId
+
+    def _addRow(self, matchId, team, opposition, matchStats, value, oppositionValue):
+        """
+        Internal function to add a team appearance to the column lists
+        """
+        row = len(self._rowTeam)
+        self._rowTeam.append(team)
+        self._rowOpposition.append(opposition)
+        self._rowMatchId.append(matchId)
+        for stat in matchStats.keys():
+            if stat not in self._statsFor:
+                self._statsFor[stat] = [None] * row
+                self._statsAgainst[stat] = [None] * row
+        for stat in self._statsFor.keys():
+            values = matchStats.get(stat)
+            self._statsFor[stat].append(values[value] if values is not None else None)
+            self._statsAgainst[stat].append(values[oppositionValue] if values is not None else None)
+        self._pairs.setdefault((team, opposition), []).append(row)
+        self._teamRows.setdefault(team, []).append(row)
+
+    def _toArrays(self):
+        """
+        Internal function to convert the columns and row lists to numpy arrays once every row is added
+        """
+        self._rowTeam = numpy.array(self._rowTeam, dtype=numpy.intp)
+        self._rowOpposition = numpy.array(self._rowOpposition, dtype=numpy.intp)
+        for columns in (self._statsFor, self._statsAgainst):
+            for stat, column in columns.items():
+                columns[stat] = numpy.array([numpy.nan if value is None else value for value in column], dtype=numpy.float64)
+        self._teamRows = dict((team, numpy.array(rows, dtype=numpy.intp)) for team, rows in self._teamRows.items())
+
+    def _rows(self, team, oppositions=None):
+        """
+        Internal function to get the rows for a team, limited to games against the oppositions
+        """
+        teamId = TEAMS.getId(team)
+        if teamId not in self._teamRows:
+            return numpy.array([], dtype=numpy.intp) if numpy is not None else []
+        if oppositions is None:
+            return self._teamRows[teamId]
+        rows = []
+        for opposition in oppositions:
+            oppositionId = TEAMS.getId(opposition)
+            rows.extend(self._pairs.get((teamId, oppositionId), []))
+        return numpy.array(sorted(rows), dtype=numpy.intp) if numpy is not None else sorted(rows)
+
+    def _mean(self, column, rows):
+        """
+        Internal function to get the mean of a column over the rows, ignoring missing values
+        """
+        if numpy is not None:
+            values = column[rows]
+            values = values[~numpy.isnan(values)]
+            return float(values.sum()) / len(values) if len(values) else None
+        values = [column[row] for row in rows if column[row] is not None]
+        return sum(values) / len(values) if values else None
+
+    def _teamMeans(self, column):
+        """
+        Internal function to get the mean of a numpy column for every team in one pass,
+        indexed by team id and NaN for teams with no values
+        """
+        valid = ~numpy.isnan(column)
+        size = int(self._rowTeam.max()) + 1 if len(self._rowTeam) else 0
+        sums = numpy.bincount(self._rowTeam[valid], weights=column[valid], minlength=size)
+        counts = numpy.bincount(self._rowTeam[valid], minlength=size)
+        means = numpy.full(size, numpy.nan)
+        means[counts > 0] = sums[counts > 0] / counts[counts > 0]
+        return means
+
+    def getMatchIds(self, team, opposition=None):
+        """
+        Get the ids of the matches a team played, optionally only against one opposition
+        ARGS:
+            team (str) - team name
+            opposition (str) - opposition team name, None for all matches
+        RETURNS:
+            [str] - list of match ids
+        """
+        oppositions = [opposition] if opposition is not None else None
+        return [self._rowMatchId[row] for row in self._rows(team, oppositions)]
+
+    def getStatFor(self, team, stat, oppositions=None):
+        """
+        Average of a stat for a team
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+            oppositions ([str]) - only include matches against these teams, None for all matches
+        RETURNS:
+            float - average value, None if not found
+        """
+        column = self._statsFor.get(stat.lower())
+        return self._mean(column, self._rows(team, oppositions)) if column is not None else None
+
+    def getStatAgainst(self, team, stat, oppositions=None):
+        """
+        Average of a stat conceded by a team, i.e. the opposition's value
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+            oppositions ([str]) - only include matches against these teams, None for all matches
+        RETURNS:
+            float - average value, None if not found
+        """
+        column = self._statsAgainst.get(stat.lower())
+        return self._mean(column, self._rows(team, oppositions)) if column is not None else None
+
+    def getAdjustedStat(self, team, stat, oppositions=None):
+        """
+        Average difference between a team's stat and what each opposition concedes
+        on average, positive when a team does better than the opposition usually allows
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+            oppositions ([str]) - only include matches against these teams, None for all matches
+        RETURNS:
+            (float, float) - adjusted stat for and adjusted stat against, the second is the
+                             difference between what the team concedes and what each opposition
+                             usually makes, None if not found
+        """
+        stat = stat.lower()
+        if stat not in self._statsFor:
+            return None, None
+        statsFor = self._statsFor[stat]
+        statsAgainst = self._statsAgainst[stat]
+        if numpy is not None:
+            rows = self._rows(team, oppositions)
+            rowOppositions = self._rowOpposition[rows]
+            adjustedFor = statsFor[rows] - self._teamMeans(statsAgainst)[rowOppositions]
+            adjustedAgainst = statsAgainst[rows] - self._teamMeans(statsFor)[rowOppositions]
+            allRows = numpy.arange(len(adjustedFor))
+            return self._mean(adjustedFor, allRows), self._mean(adjustedAgainst, allRows)
+        averageFor = {}
+        averageAgainst = {}
+        adjustedFor = []
+        adjustedAgainst = []
+        for row in self._rows(team, oppositions):
+            opposition = self._rowOpposition[row]
+            if opposition not in averageFor:
+                averageFor[opposition] = self._mean(statsFor, self._teamRows[opposition])
+                averageAgainst[opposition] = self._mean(statsAgainst, self._teamRows[opposition])
+            if statsFor[row] is not None and averageAgainst[opposition] is not None:
+                adjustedFor.append(statsFor[row] - averageAgainst[opposition])
+            if statsAgainst[row] is not None and averageFor[opposition] is not None:
+                adjustedAgainst.append(statsAgainst[row] - averageFor[opposition])
+        return (sum(adjustedFor) / len(adjustedFor) if adjustedFor else None,
+                sum(adjustedAgainst) / len(adjustedAgainst) if adjustedAgainst else None)
+
+    def getHeadToHead(self, team, opposition, stats):
+        """
+        Head to head record between two teams
+        ARGS:
+            team (str) - team name
+            opposition (str) - opposition team name
+            stats ([str]) - list of stat names
+        RETURNS:
+            dict - dictionary in the form {'matches': int, stat: {'for': float, 'against': float}}
+        """
+        result = {'matches': len(self.getMatchIds(team, opposition))}
+        for stat in stats:
+            result[stat.lower()] = {'for': self.getStatFor(team, stat, [opposition]),
+                                    'against': self.getStatAgainst(team, stat, [opposition])}
+        return result
+
+    def getTopTeams(self, count, stat='points'):
+        """
+        Rank teams by their average difference in a stat, e.g. points difference
+        ARGS:
+            count (int) - number of teams to return
+            stat (str) - stat name to rank by
+        RETURNS:
+            [str] - list of team names, best first
+        """
+        ranking = []
+        for team in self.teams:
+            statFor = self.getStatFor(team, stat)
+            statAgainst = self.getStatAgainst(team, stat)
+            if statFor is not None and statAgainst is not None:
+                ranking.append((statFor - statAgainst, team))
+        return [team for difference, team in sorted(ranking, reverse=True)[:count]]
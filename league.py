@@ -1,7 +1,11 @@
 from datetime import datetime
 
 from match import MatchList, MatchListLite
+from rugbydb import CachedDB
+from symbols import TEAMS
 from variables import MATCH_IDS
+from discovery import getLeagueMatchIds
+import frames
 
 class LeagueList():
     """
@@ -27,7 +31,7 @@ class LeagueList():
         RETURNS:
             League (obj) - League object or None if not found
         """
-        for league in self._leagues.items():
+        for league in self._leagues.values():
             if league.name.lower() == leagueName.lower():
                 return league
         return None
@@ -45,6 +49,18 @@ class LeagueList():
         else:
             return None
 
+    def getLeaguesForTeam(self, team, season=None):
+        """
+        Return the leagues a team plays in, answered from the league catalogs
+        ARGS:
+            team (str) - team name to search for
+            season (str) - season name string to search, if None searches all seasons
+        RETURNS:
+            [League] - list of League objects sorted by league id
+        """
+        return [self._leagues[leagueId] for leagueId in sorted(self._leagues.keys())
+                if self._leagues[leagueId].containsTeam(team, season)]
+
 class League():
     """
     League class to store and manipulate data relating to a league
@@ -71,7 +87,7 @@ class League():
         ARGS:
             id (str) - id of the league
             name (str) - name of the league
-            matchIdDict (dict) - dictionary in the form {'season': [int(matchId), int(matchId)]}, loads from default if None
+            matchIdDict (dict) - dictionary in the form {'season': [int(matchId), int(matchId)]}, loads from the manifest if None
             initMatches (bool) - True = Load all match data into MatchList, False = Only store match ids in MatchList
         """
         self.id = id
@@ -79,7 +95,7 @@ class League():
         self._matchesLoaded = False
         self._matches = {}
         if matchIdDict is None:
-            matchIdDict = MATCH_IDS[self.id]['matchIds']
+            matchIdDict = getLeagueMatchIds(self.id)
         self.loadMatches(matchIdDict, initMatches)
 
     def loadMatches(self, matchIdDict, full=False):
@@ -89,13 +105,25 @@ class League():
             matchIdDict (dict) - dictionary in the form {'season': [int(matchId), int(matchId)]}
             full (bool) - True = Load all match data into MatchList, False = Only store match ids in MatchList
         """
-        if full:
-            matchListClass = MatchList
-        else:
-            matchListClass = MatchListLite
-        
         for season in matchIdDict:
-            self._matches[season] = matchListClass(matchIdDict[season])
+            if full:
+                # read the stored season once and keep the configured ids, keyed as configured
+                configured = dict((str(matchId), matchId) for matchId in matchIdDict[season])
+                matchDicts = CachedDB().getMatchesForLeague(self.id, [season])
+                self._matches[season] = MatchList.fromMatchDicts(dict((configured[matchId], matchDict)
+                                                                      for matchId, matchDict in matchDicts.items()
+                                                                      if matchId in configured))
+            else:
+                self._matches[season] = MatchListLite(matchIdDict[season], self.id, season)
+
+    def addSeason(self, season, matchList):
+        """
+        Add or replace the MatchList for a season
+        ARGS:
+            season (str) - season name string
+            matchList (MatchList) - matches in the season
+        """
+        self._matches[season] = matchList
 
     def _getSeasonList(self, season=None):
         """
@@ -132,10 +160,69 @@ class League():
         RETURNS:
             bool - True if team is in the league, False if team is not in the league
         """
-        teams = []
+        return TEAMS.canonical(team) in self.getTeams(season)
+
+    def _getSeasonCatalogs(self, season=None):
+        """
+        Internal function to get the catalog and stored match ids of each season
+        ARGS:
+            season (str) - season name string, if None returns all seasons
+        RETURNS:
+            [(SeasonCatalog, [str])] - list of tuples for the seasons in the database
+        """
+        catalogs = []
+        for season in sorted(self._getSeasonList(season)):
+            catalog = CachedDB().getSeasonCatalog(self.id, season)
+            if catalog is not None:
+                catalogs.append((catalog, [matchId for matchId in self._matches[season].getMatchIds() if matchId in catalog]))
+        return catalogs
+
+    def getTeams(self, season=None):
+        """
+        Return the teams that play in the league without loading matches
+        ARGS:
+            season (str) - season name string, if None includes all seasons
+        RETURNS:
+            [str] - sorted list of lower case team names
+        """
+        teams = set()
         for season in self._getSeasonList(season):
-            teams.extend(self._matches[season].getAllTeams())
-        return team.lower() in teams
+            teams.update(self._matches[season].getAllTeams())
+        return sorted(teams)
+
+    def getDateSpan(self, season=None):
+        """
+        Get the first and last kick off in the league without loading matches
+        ARGS:
+            season (str) - season name string, if None includes all seasons
+        RETURNS:
+            (datetime, datetime) - first and last kick off, (None, None) if there are no stored matches
+        """
+        spans = [catalog.getDateSpan(matchIds) for catalog, matchIds in self._getSeasonCatalogs(season) if matchIds]
+        if not spans:
+            return None, None
+        return min(span[0] for span in spans), max(span[1] for span in spans)
+
+    def getMatchCount(self, season=None):
+        """
+        Count the stored matches in the league without loading them
+        ARGS:
+            season (str) - season name string, if None includes all seasons
+        RETURNS:
+            int - number of matches in the database
+        """
+        return sum(len(matchIds) for catalog, matchIds in self._getSeasonCatalogs(season))
+
+    def getRounds(self, season):
+        """
+        Group the matches of a season into rounds by kick off, see catalog.ROUND_GAP
+        ARGS:
+            season (str) - season name string
+        RETURNS:
+            [[str]] - list of rounds in kick off order, each a list of match ids
+        """
+        catalogs = self._getSeasonCatalogs(season)
+        return catalogs[0][0].getRounds(catalogs[0][1]) if catalogs else []
 
     def getMatchesInDateRange(self, startDate=None, endDate=None):
         """
@@ -154,3 +241,25 @@ class League():
         for season in self._getSeasonList(None):
             mergedMatchList += self._matches[season].getMatchesInDateRange(startDate, endDate)
         return mergedMatchList
+
+    def toFrame(self, season=None):
+        """
+        Convert the matches in the league to a pandas DataFrame with one row per match,
+        seasons only storing match ids are loaded first. Requires pandas
+        ARGS:
+            season (str) - season name string, if None includes all seasons
+        RETURNS:
+            pandas.DataFrame - frame with a season column, sorted by season and match id
+        """
+        frames.getPandas()
+        seasonFrames = []
+        for season in sorted(self._getSeasonList(season)):
+            matchList = self._matches[season]
+            if isinstance(matchList, MatchListLite):
+                matchList = MatchList(matchList.getMatchIds())
+            seasonFrame = matchList.toFrame()
+            seasonFrame.insert(1, 'season', season)
+            seasonFrames.append(seasonFrame)
+        if not seasonFrames:
+            return frames.toFrame([('matchId', []), ('season', [])])
+        return frames.getPandas().concat(seasonFrames, ignore_index=True, sort=False)
@@ -0,0 +1,185 @@
+import time
+
+from rugbydb import parseMatchStr
+
+# event type of the end of game commentary event, see MatchEvent
+END_OF_GAME = 12
+
+
+def _eventKey(event):
+    """
+    Internal function to identify a commentary event
+    """
+    return (event.get('type'), event.get('time'), event.get('text'), event.get('homeScore'), event.get('awayScore'))
+
+
+def _diff(old, new, path, changes):
+    """
+    Internal function to collect the paths of every changed value, dictionaries
+    and lists of the same length are compared item by item
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in new.keys():
+            if key not in old:
+                changes.append((path + [key], new[key]))
+            else:
+                _diff(old[key], new[key], path + [key], changes)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for index in range(len(new)):
+            _diff(old[index], new[index], path + [index], changes)
+    elif old != new:
+        changes.append((path, new))
+
+
+def diffMatchDicts(oldDict, newDict):
+    """
+    Find what changed between two states of a match dictionary
+    ARGS:
+        oldDict (dict) - stored match dictionary
+        newDict (dict) - newly fetched match dictionary
+    RETURNS:
+        dict - delta in the form {'events': [eventDict], 'changes': [(path, value)]}, where events are
+               the new commentary events and changes are the other changed values by key path
+    """
+    oldEvents = oldDict['gamePackage']['matchCommentary']['events']
+    newEvents = newDict['gamePackage']['matchCommentary']['events']
+    known = set(_eventKey(event) for event in oldEvents)
+    events = [event for event in newEvents if _eventKey(event) not in known]
+    changes = []
+    for key in newDict.keys():
+        if key != 'gamePackage':
+            _diff(oldDict.get(key), newDict[key], [key], changes)
+    for key in newDict['gamePackage'].keys():
+        if key == 'matchCommentary':
+            commentary = newDict['gamePackage'][key]
+            for commentaryKey in commentary.keys():
+                if commentaryKey != 'events':
+                    _diff(oldDict['gamePackage'][key].get(commentaryKey), commentary[commentaryKey],
+                          ['gamePackage', key, commentaryKey], changes)
+        else:
+            _diff(oldDict['gamePackage'].get(key), newDict['gamePackage'][key], ['gamePackage', key], changes)
+    return {'events': events, 'changes': changes}
+
+
+def applyDelta(matchDict, delta):
+    """
+    Apply a delta to a match dictionary in place
+    ARGS:
+        matchDict (dict) - match dictionary to update
+        delta (dict) - delta from diffMatchDicts
+    """
+    matchDict['gamePackage']['matchCommentary']['events'].extend(delta['events'])
+    for path, value in delta['changes']:
+        target = matchDict
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+
+
+def isFinished(matchDict):
+    """
+    Check if the commentary of a match includes the end of the game
+    ARGS:
+        matchDict (dict) - match dictionary
+    RETURNS:
+        bool - True if the match has finished
+    """
+    return any(event.get('type') == END_OF_GAME for event in matchDict['gamePackage']['matchCommentary']['events'])
+
+
+class LiveUpdater(object):
+    """
+    Polls in progress matches, diffs each fetched state against the stored
+    match and applies only the new commentary events and changed values.
+    Tracked Match objects are updated in place, season summaries and ingest
+    listeners see the updated match and deltas are journaled rather than
+    rewriting the league file, which is written once a match finishes
+    """
+
+    def __init__(self, db, interval=60, fetch=None):
+        """
+        ARGS:
+            db (RugbyDBReadWrite) - database to update
+            interval (float) - seconds between polls
+            fetch (function) - function taking (leagueId, matchId) returning the match dictionary string,
+                               default db.fetchMatchStr
+        """
+        self.db = db
+        self.interval = interval
+        self.fetch = fetch if fetch is not None else db.fetchMatchStr
+        self._watched = {}
+        self._matches = {}
+
+    def watch(self, leagueId, year, matchIds):
+        """
+        Start polling matches
+        ARGS:
+            leagueId (str) - id of the league of the matches
+            year (str) - year/season string of the matches
+            matchIds ([str]) - ids of the matches
+        """
+        for matchId in matchIds:
+            self._watched[str(matchId)] = (leagueId, year)
+
+    def track(self, matchId, match):
+        """
+        Keep a Match object up to date with the deltas of its match
+        ARGS:
+            matchId (str) - id of the match
+            match (Match) - Match object to update in place
+        """
+        self._matches.setdefault(str(matchId), []).append(match)
+
+    def getWatched(self):
+        """
+        Get the ids of the matches still being polled
+        RETURNS:
+            [str] - sorted list of match ids
+        """
+        return sorted(self._watched.keys())
+
+    def poll(self):
+        """
+        Fetch every watched match once and apply what changed, finished matches
+        are written to the league file and no longer polled
+        RETURNS:
+            dict - deltas applied in the form {matchId: delta}
+        """
+        deltas = {}
+        for matchId, (leagueId, year) in sorted(self._watched.items()):
+            matchStr = self.fetch(leagueId, matchId)
+            if not matchStr:
+                continue
+            try:
+                newDict = parseMatchStr(matchStr)
+            except ValueError as e:
+                print("Skipping live update for {}: {}".format(matchId, e))
+                continue
+            stored = self.db.db.get(leagueId, {}).get(year, {}).get(matchId)
+            if stored is None:
+                self.db.addToDb(leagueId, year, matchId, matchStr)
+                stored = self.db.db[leagueId][year][matchId]
+            else:
+                delta = diffMatchDicts(stored, newDict)
+                if delta['events'] or delta['changes']:
+                    self.db.applyMatchDelta(leagueId, year, matchId, delta)
+                    for match in self._matches.get(matchId, []):
+                        match.applyDelta(stored, delta)
+                    deltas[matchId] = delta
+            if isFinished(stored):
+                del self._watched[matchId]
+                self.db.writeDbFile(leagueId)
+        return deltas
+
+    def run(self, maxPolls=None):
+        """
+        Poll on the interval until every watched match has finished
+        ARGS:
+            maxPolls (int) - stop after this many polls, None for no limit
+        """
+        polls = 0
+        while self._watched and (maxPolls is None or polls < maxPolls):
+            self.poll()
+            polls += 1
+            if self._watched and (maxPolls is None or polls < maxPolls):
+                time.sleep(self.interval)
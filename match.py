@@ -3,8 +3,12 @@ import re
 from rugbydb import RugbyDB, CachedDB
 from datetime import datetime
 
-from player import PlayerList
+from player import Player, PlayerList
 from matchevent import MatchEvent, MatchEventList
+from statschema import parseMatchStats
+from symbols import TEAMS, STATS
+from variables import MATCH_IDS
+import frames
 
 class MatchList():
     """
@@ -23,12 +27,40 @@ class MatchList():
             MatchList - MatchList object
         """
         db = CachedDB()
-        matchIds = db.getMatchesForTeam(teamName.lower(), leagues=leagues, seasons=seasons)
-        return cls(matchIds)
+        return cls.fromMatchDicts(db.getMatchesForTeam(teamName.lower(), leagues=leagues, seasons=seasons))
 
     @classmethod
-    def createMatchListForLeague(cls, leagueId):
-        pass
+    def createMatchListForLeague(cls, leagueId, seasons=None, lite=False):
+        """
+        Create a match list for every stored match of a league, read in one fetch
+        of the league's seasons rather than looking up each match id
+        ARGS:
+            leagueId (str) - id of the league
+            seasons ([str]) - list of seasons to include, all seasons if None
+            lite (bool) - True = only store match ids in a MatchListLite, False = build every Match
+        RETURNS
+            MatchList - MatchList object, MatchListLite if lite
+        """
+        matchDicts = CachedDB().getMatchesForLeague(leagueId, seasons=seasons)
+        if lite:
+            return MatchListLite(sorted(matchDicts.keys()), leagueId, seasons)
+        return cls.fromMatchDicts(matchDicts)
+
+    @classmethod
+    def fromMatchDicts(cls, matchDicts):
+        """
+        Create a match list from match dictionaries already read from the database
+        ARGS:
+            matchDicts (dict) - dictionary in the form {matchId: matchDict}
+        RETURNS
+            MatchList - MatchList object
+        """
+        if issubclass(cls, MatchListLite):
+            return cls(sorted(matchDicts.keys()))
+        matches = cls(matchIds=[])
+        for matchId in sorted(matchDicts.keys()):
+            matches.addMatch(matchId, Match(matchDicts[matchId]))
+        return matches
 
     def __init__(self, matchIds):
         """
@@ -37,6 +69,7 @@ class MatchList():
         """
         self._matches = {}
         self._teams = None
+        self._ordered = None
         db = CachedDB()
         for id in matchIds:
             newMatch = Match.fromMatchId(id)
@@ -69,7 +102,32 @@ class MatchList():
         RETURNS:
             [int] - list of match ids
         """
-        return sorted(self._matches.keys())
+        return list(self._getOrdered()[0])
+
+    def _getOrdered(self):
+        """
+        Internal function to get the match ids and items in id order, sorted
+        once and kept until the list changes
+        RETURNS:
+            ([int], [Match]) - match ids and the items stored for them
+        """
+        ordered = self._ordered
+        if ordered is None:
+            matchIds = sorted(self._matches.keys())
+            ordered = self._ordered = (matchIds, [self._matches[matchId] for matchId in matchIds])
+        return ordered
+
+    def getMatches(self, matchIds=None):
+        """
+        Get several matches in one call
+        ARGS:
+            matchIds ([int]) - match ids to get, default every match in id order
+        RETURNS:
+            [Match] - list of Match objects, None for ids not in the list
+        """
+        if matchIds is None:
+            return list(self._getOrdered()[1])
+        return [self._matches.get(matchId) for matchId in matchIds]
 
     def getAllTeams(self):
         """
@@ -78,30 +136,29 @@ class MatchList():
             [str] - list of team names
         """
         if self._teams is None:
-            self._teams = []
-            for match in self._matches.items():
-                self._teams.append(match.homeTeam)
+            teams = set()
+            for match in self._matches.values():
+                teams.add(match.homeTeam['name'])
+                teams.add(match.awayTeam['name'])
+            self._teams = sorted(teams)
         return self._teams
 
     def __iter__(self):
         """
-        Iterator implementation for MatchList
+        Iterator implementation for MatchList, each call returns an independent
+        iterator over the matches in id order so loops can be nested or run in threads
         """
-        self.currentMatchIndex = -1
-        return self
+        return iter(self._getOrdered()[1])
 
-    def next(self):
+    def __getitem__(self, index):
         """
-        Iterator implementation for MatchList
+        Get a match or a slice of matches by position in id order
+        ARGS:
+            index (int/slice) - position or slice
         RETURNS:
-            Match (obj) - returns next match object in list
+            Match (obj) - Match object, list of Match objects for a slice
         """
-        matchIds = self.getMatchIds()
-        if self.currentMatchIndex >= len(matchIds) - 1:
-            raise StopIteration
-        else:
-            self.currentMatchIndex += 1
-            return self._matches[matchIds[self.currentMatchIndex]]
+        return self._getOrdered()[1][index]
     
     def addMatch(self, id, match):
         """
@@ -111,6 +168,8 @@ class MatchList():
             match (Match) - match to add
         """
         self._matches[id] = match
+        self._teams = None
+        self._ordered = None
 
     def getMatchesInDateRange(self, startDate=None, endDate=None):
         """
@@ -132,40 +191,112 @@ class MatchList():
                 matches.addMatch(id, match)
         return matches
 
+    def toFrame(self):
+        """
+        Convert the MatchList to a pandas DataFrame with one row per match,
+        team stats are split into 'home <stat>' and 'away <stat>' columns. Requires pandas
+        RETURNS:
+            pandas.DataFrame - frame sorted by match id
+        """
+        frames.getPandas()
+        matchIds = self.getMatchIds()
+        matches = [self._matches[id] for id in matchIds]
+        columns = [('matchId', [str(id) for id in matchIds]),
+                   ('date', [match.date for match in matches]),
+                   ('homeTeam', [match.homeTeam['name'] for match in matches]),
+                   ('awayTeam', [match.awayTeam['name'] for match in matches]),
+                   ('homeScore', frames.getNumpy().array([match.homeTeam['score'] for match in matches], dtype=float)),
+                   ('awayScore', frames.getNumpy().array([match.awayTeam['score'] for match in matches], dtype=float))]
+        for value, prefix in (('homeValue', 'home '), ('awayValue', 'away ')):
+            statDicts = [dict((stat, values[value]) for stat, values in match.matchStats.items()) for match in matches]
+            columns.extend(frames.statColumns(statDicts, prefix))
+        return frames.toFrame(columns)
+
 
 class MatchListLite(MatchList):
     """
     Lite version of MatchList which doesnt load all matches
     Used to store matchIds only and overrides functionality 
-    that accessed Match object data
+    that accessed Match object data, teams and dates are read
+    from the league catalogs when the league is known
     """
-    def __init__(self, matchIds):
+    def __init__(self, matchIds, leagueId=None, seasons=None):
         """
         ARGS:
             matchIds [int] - list of match ids to load into the matchlist
+            leagueId (str) - id of the league the matches are from, used to read the catalogs
+            seasons (str/[str]) - season or list of seasons the matches are from, used to read
+                                  the catalogs, every season of the league if None
         """
         self._matches = {el: None for el in matchIds}
+        self._teams = None
+        self._ordered = None
+        self.leagueId = leagueId
+        self.seasons = [seasons] if isinstance(seasons, basestring) else seasons
+
+    def getCatalog(self):
+        """
+        Get the catalog of the league seasons the matches are from, the union of
+        the season catalogs when there is more than one season
+        RETURNS:
+            SeasonCatalog (obj) - catalog for the seasons, None if the league is not known or no season is stored
+        """
+        from catalog import SeasonCatalog
+        if self.leagueId is None:
+            return None
+        seasons = self.seasons if self.seasons is not None else sorted(MATCH_IDS.get(self.leagueId, {}).get('matchIds', {}).keys())
+        db = CachedDB()
+        catalogs = [catalog for catalog in (db.getSeasonCatalog(self.leagueId, season) for season in seasons) if catalog is not None]
+        if not catalogs:
+            return None
+        return catalogs[0] if len(catalogs) == 1 else SeasonCatalog.union(catalogs)
 
     def getAllTeams(self):
         """
-        Returns an empty list as MatchListLite does not have access to Match data
+        Return list of teams that play in the MatchList, read from the league catalog
         RETURNS:
-            [] - empty list
+            [str] - list of team names, empty if the league is not known
         """
-        return []
+        catalog = self.getCatalog()
+        return catalog.getTeams(self.getMatchIds()) if catalog is not None else []
 
-    def next(self):
+    def getDateSpan(self):
         """
-        Iterator implementation for MatchList
+        Get the first and last kick off of the matches, read from the league catalog
         RETURNS:
-            int - returns next match id in list
+            (datetime, datetime) - first and last kick off, (None, None) if the league is not known
         """
-        matchIds = self.getMatchIds()
-        if self.currentMatchIndex >= len(matchIds) - 1:
-            raise StopIteration
-        else:
-            self.currentMatchIndex += 1
-            return matchIds[self.currentMatchIndex]
+        catalog = self.getCatalog()
+        return catalog.getDateSpan(self.getMatchIds()) if catalog is not None else (None, None)
+
+    def getRounds(self):
+        """
+        Group the stored matches into rounds, read from the league catalog
+        RETURNS:
+            [[str]] - list of rounds in kick off order, each a list of match ids
+        """
+        catalog = self.getCatalog()
+        return catalog.getRounds(self.getMatchIds()) if catalog is not None else []
+
+    def _getOrdered(self):
+        """
+        Internal function to get the match ids in id order, iterating a MatchListLite gives match ids
+        RETURNS:
+            ([int], [int]) - match ids, twice
+        """
+        ordered = self._ordered
+        if ordered is None:
+            matchIds = sorted(self._matches.keys())
+            ordered = self._ordered = (matchIds, matchIds)
+        return ordered
+
+    def toFrame(self):
+        """
+        Convert the MatchListLite to a pandas DataFrame with a match id column only. Requires pandas
+        RETURNS:
+            pandas.DataFrame - frame sorted by match id
+        """
+        return frames.toFrame([('matchId', [str(id) for id in self.getMatchIds()])])
 
     def getMatchesInDateRange(self, startDate=None, endDate=None):
         """
@@ -203,20 +334,14 @@ class Match():
         homeTeam = matchDict['gamePackage']['gameStrip']['teams']['home'] 
         awayTeam = matchDict['gamePackage']['gameStrip']['teams']['away']
         date = matchDict['gamePackage']['gameStrip']['isoDate']
-        dataVis = matchDict['gamePackage']['matchStats']['dataVis']
-        table = matchDict['gamePackage']['matchStats']['table']
-        scores = matchDict['gamePackage']['matchEvents']['col'][0][0]['data']
-        attacking = matchDict['gamePackage']['matchEvents']['col'][1][1]['data']
-        discipline = matchDict['gamePackage']['matchDiscipline']['col'][1][0]['data']
-        penalties = matchDict['gamePackage']['matchDiscipline']['col'][0][0]['data']
-        matchAttacking = matchDict['gamePackage']['matchAttacking']['col'][1][0]['data']
-        matchDefending = matchDict['gamePackage']['matchDefending']['col'][0]
         players = matchDict['gamePackage']['matchLineUp']
         matchEvents = matchDict['gamePackage']['matchCommentary']['events']
 
         self.matchStats = {}
         self.players = {}
         self.matchEventList = MatchEventList([])
+        self.homeTeamId = None
+        self.awayTeamId = None
 
         try:
             dateParts = date[:10].split('-')
@@ -226,55 +351,12 @@ class Match():
                                 int(dateParts[2]),
                                 int(timeParts[0]),
                                 int(timeParts[1]))
-            self.homeTeam = {'name': homeTeam['name'].lower(), 'abbrev': homeTeam['abbrev'], 'score': homeTeam['score']}
-            self.awayTeam = {'name': awayTeam['name'].lower(), 'abbrev': awayTeam['abbrev'], 'score': awayTeam['score']}
-            self.matchStats = {'points': {'homeValue': float(homeTeam['score']), 'awayValue': float(awayTeam['score'])}}
-
-            for item in dataVis + table + discipline + scores + attacking:
-                try:
-                    homeValue = float(item['homeValue'])
-                    awayValue = float(item['awayValue'])
-                except:
-                    homeValue = float(item['homeValue'][:-1])
-                    awayValue = float(item['awayValue'][:-1])
-                self.matchStats[item['text'].lower()] = {'homeValue': homeValue, 'awayValue': awayValue}
-            self.matchStats['penalties conceded'] = {'homeValue': float(penalties['homeTotal']), 'awayValue': float(penalties['awayTotal'])}
-            
-            # adjust tackles to remove missed tackles from the total
-            for value in ('homeValue', 'awayValue'):
-                self.matchStats['tackles'][value] = self.matchStats['tackles'][value] - self.matchStats['missed tackles'][value]
-            
-            for stat in matchAttacking:
-                if "/" in stat['homeValue']:
-                    if "Won" in stat['text']:
-                        statName = stat['text'].split(' ')[0].lower()
-                        homeStat = stat['homeValue'].split(' ')
-                        awayStat = stat['awayValue'].split(' ') 
-                        self.matchStats["{} won".format(statName)] = {'homeValue': homeStat[0], 'awayValue': awayStat[0]}
-                        self.matchStats["{} total".format(statName)] = {'homeValue': homeStat[2], 'awayValue': awayStat[2]}
-                    else:
-                        statName = stat['text'].split(' ')[0].lower()
-                        statSubText = stat['text'].split(' ')[1].split('/')
-
-                        homeStat = stat['homeValue'].split(' / ')
-                        awayStat = stat['awayValue'].split(' / ') 
-                        self.matchStats["{} {}".format(statName, statSubText[0].lower())] = {'homeValue': homeStat[0][:-1], 'awayValue': awayStat[0][:-1]}
-                        self.matchStats["{} {}".format(statName, statSubText[1].lower())] = {'homeValue': homeStat[1][:-1], 'awayValue': awayStat[1][:-1]} 
-                else:
-                    try:
-                        homeValue = float(stat['homeValue'])
-                        awayValue = float(stat['awayValue'])
-                    except:
-                        homeValue = float(stat['homeValue'][:-1])
-                        awayValue = float(stat['awayValue'][:-1])
-                    self.matchStats[stat['text'].lower()] = {'homeValue': homeValue, 'awayValue': awayValue}
-            
-            for stat in matchDefending:
-                setPiece = stat['data']
-                statName = setPiece['text'].split(' ')[0].lower()
-                self.matchStats["{} won".format(statName)] = {'homeValue': setPiece['homeWon'], 'awayValue': setPiece['awayWon']}
-                self.matchStats["{} total".format(statName)] = {'homeValue': setPiece['homeTotal'], 'awayValue': setPiece['awayTotal']}
-            
+            self.homeTeamId = TEAMS.add(homeTeam['name'])
+            self.awayTeamId = TEAMS.add(awayTeam['name'])
+            self.homeTeam = {'name': TEAMS.getName(self.homeTeamId), 'abbrev': homeTeam['abbrev'], 'score': homeTeam['score']}
+            self.awayTeam = {'name': TEAMS.getName(self.awayTeamId), 'abbrev': awayTeam['abbrev'], 'score': awayTeam['score']}
+            self.matchStats = parseMatchStats(matchDict['gamePackage'])
+
             for event in matchEvents:
                 self.matchEventList.addMatchEvent(MatchEvent.fromMatchEventDict(event))
             
@@ -284,6 +366,67 @@ class Match():
             print "Skipping {}".format(self)
             print str(e)
     
+    def __getstate__(self):
+        """
+        Team ids are only valid in the TEAMS table of the process that built the
+        match, so they are left out when the match is pickled
+        """
+        state = self.__dict__.copy()
+        state.pop('homeTeamId', None)
+        state.pop('awayTeamId', None)
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore a pickled match, the team ids are resolved again from the names
+        in this process's TEAMS table
+        """
+        self.__dict__.update(state)
+        self.homeTeamId = None
+        self.awayTeamId = None
+        if hasattr(self, 'homeTeam') and hasattr(self, 'awayTeam'):
+            self.homeTeamId = TEAMS.add(self.homeTeam['name'])
+            self.awayTeamId = TEAMS.add(self.awayTeam['name'])
+            self.homeTeam['name'] = TEAMS.getName(self.homeTeamId)
+            self.awayTeam['name'] = TEAMS.getName(self.awayTeamId)
+            self.players = dict((TEAMS.intern(team), players) for team, players in self.players.items())
+
+    def applyDelta(self, matchDict, delta):
+        """
+        Update the match in place from a live delta, only the new events are added,
+        team stats are parsed again only if they changed and only players whose
+        line up entries changed are rebuilt, a sub changes the entries of both players
+        ARGS:
+            matchDict (dict) - match dictionary with the delta already applied
+            delta (dict) - delta from live.diffMatchDicts
+        """
+        gamePackage = matchDict['gamePackage']
+        newEvents = [MatchEvent.fromMatchEventDict(event) for event in delta['events']]
+        for event in newEvents:
+            self.matchEventList.addMatchEvent(event)
+        sections = set(path[1] for path, value in delta['changes'] if len(path) > 1 and path[0] == 'gamePackage')
+        if sections - set(['matchLineUp', 'matchCommentary']):
+            self.homeTeam['score'] = gamePackage['gameStrip']['teams']['home']['score']
+            self.awayTeam['score'] = gamePackage['gameStrip']['teams']['away']['score']
+            self.matchStats = parseMatchStats(gamePackage)
+
+        for side, team in (('home', self.homeTeam['name']), ('away', self.awayTeam['name'])):
+            lineUp = gamePackage['matchLineUp'][side]
+            changed = set()
+            for path, value in delta['changes']:
+                if path[:3] == ['gamePackage', 'matchLineUp', side]:
+                    if len(path) < 5:
+                        changed = None
+                        break
+                    changed.add(path[4] + (len(lineUp['team']) if path[3] == 'reserves' else 0))
+            playerDicts = lineUp['team'] + lineUp['reserves']
+            if changed is None or len(playerDicts) != len(self.players[team]):
+                self.players[team] = PlayerList(playerDicts, self.matchEventList)
+                continue
+            for index, playerDict in enumerate(playerDicts):
+                if index in changed:
+                    self.players[team].players[index] = Player(playerDict, self.matchEventList)
+
     def __str__(self):
         """
         String representation of a match
@@ -307,9 +450,12 @@ class Match():
         RETURNS:
             str - homeValue/awayValue for the team or None if team is not in the match
         """
-        if team.lower() == self.homeTeam['name']:
+        teamId = TEAMS.getId(team)
+        if teamId is None:
+            return None
+        if teamId == self.homeTeamId:
             return 'homeValue'
-        elif team.lower() == self.awayTeam['name']:
+        elif teamId == self.awayTeamId:
             return 'awayValue'
         else:
             return None
@@ -333,9 +479,12 @@ class Match():
         RETURNS:
             str - team name of the opposition or None if the team argument is not found in the match
         """
-        if team.lower() == self.homeTeam['name']:
+        teamId = TEAMS.getId(team)
+        if teamId is None:
+            return None
+        if teamId == self.homeTeamId:
             return self.awayTeam['name']
-        elif team.lower() == self.awayTeam['name']:
+        elif teamId == self.awayTeamId:
             return self.homeTeam['name']
         else:
             return None
@@ -360,9 +509,10 @@ class Match():
         RETURNS:
             float - value for stat or None if not found
         """
-        if stat.lower() in self.matchStats.keys():
+        stat = STATS.canonical(stat)
+        if stat in self.matchStats:
             value = self.getHomeAwayValue(team)
-            return self.matchStats[stat.lower()][value] if value is not None else None
+            return self.matchStats[stat][value] if value is not None else None
         return None
 
     def isPlayerInGame(self, playerName):
@@ -391,8 +541,8 @@ class Match():
         """
         if team is None:
             teams = self.players.keys()
-        elif team.lower() in self.players.keys():
-            teams = [team.lower()]
+        elif TEAMS.canonical(team) in self.players:
+            teams = [TEAMS.canonical(team)]
         else:
             return None
     
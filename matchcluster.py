@@ -0,0 +1,172 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from statschema import parseMatchStats
+
+# team stats used for a match fingerprint, a name ending in ' success' is the
+# ratio of the '<name> won' and '<name> total' stats
+DEFAULT_FEATURES = ['possession', 'territory', 'carries', 'tackles', 'missed tackles',
+                    'metres run', 'clean breaks', 'lineouts success', 'scrums success']
+
+
+def _featureValue(matchStats, feature, value):
+    """
+    Internal function to read one feature for one side of a match, None if it is missing
+    """
+    if feature.endswith(' success'):
+        statName = feature[:-len(' success')]
+        won = matchStats.get("{} won".format(statName))
+        total = matchStats.get("{} total".format(statName))
+        if won is None or total is None or not total[value]:
+            return None
+        return won[value] / total[value]
+    stat = matchStats.get(feature)
+    return stat[value] if stat is not None else None
+
+
+class MatchMatrix(object):
+    """
+    Standardised matrix of team stat fingerprints with one row per match and
+    home and away columns for each feature, built straight from the stored
+    match dictionaries. Supports nearest match search and k-means clustering.
+    Requires numpy
+    """
+
+    @classmethod
+    def fromQuery(cls, matchQuery, features=None):
+        """
+        Build the matrix for the matches in a query
+        ARGS:
+            matchQuery (Query) - query of the matches to include, e.g. query() for the full database
+            features ([str]) - team stats to include, default DEFAULT_FEATURES
+        RETURNS:
+            MatchMatrix (obj) - new MatchMatrix object
+        """
+        features = features if features is not None else DEFAULT_FEATURES
+        matchIds = []
+        rows = []
+        skipped = []
+        for league, season, matchId, matchDict in matchQuery.records():
+            try:
+                matchStats = parseMatchStats(matchDict['gamePackage'])
+            except Exception as e:
+                skipped.append((matchId, repr(e)))
+                continue
+            matchIds.append(matchId)
+            rows.append([_featureValue(matchStats, feature, value) for value in ('homeValue', 'awayValue') for feature in features])
+        return cls(matchIds, rows, features, skipped)
+
+    def __init__(self, matchIds, rows, features, skipped=None):
+        """
+        ARGS:
+            matchIds ([str]) - id of the match in each row
+            rows ([[float]]) - home feature values followed by away feature values, None for missing values
+            features ([str]) - feature names
+            skipped ([(str, str)]) - matches left out because their stats could not be read, in the form (matchId, error)
+        """
+        if numpy is None:
+            raise ImportError("MatchMatrix requires numpy")
+        self.matchIds = list(matchIds)
+        self.skipped = list(skipped) if skipped is not None else []
+        self.features = list(features)
+        self.columns = ["home {}".format(feature) for feature in features] + ["away {}".format(feature) for feature in features]
+        self._rows = dict((matchId, row) for row, matchId in enumerate(self.matchIds))
+        values = numpy.array([[numpy.nan if value is None else value for value in row] for row in rows],
+                             dtype=numpy.float64).reshape(len(self.matchIds), len(self.columns))
+        self.values = values
+        # standardise each column and fill missing values with the column mean
+        mean = numpy.nanmean(values, axis=0) if len(values) else numpy.zeros(len(self.columns))
+        std = numpy.nanstd(values, axis=0) if len(values) else numpy.ones(len(self.columns))
+        mean[numpy.isnan(mean)] = 0.0
+        std[numpy.isnan(std) | (std == 0)] = 1.0
+        self.standardised = numpy.nan_to_num((values - mean) / std)
+        self._squaredNorms = (self.standardised ** 2).sum(axis=1)
+        norms = numpy.sqrt(self._squaredNorms)
+        norms[norms == 0] = 1.0
+        self._unitVectors = self.standardised / norms[:, numpy.newaxis]
+
+    def __len__(self):
+        return len(self.matchIds)
+
+    def distances(self, rows, metric='euclidean'):
+        """
+        Distances from a batch of matches to every match
+        ARGS:
+            rows ([int]) - rows of the matches to compare
+            metric (str) - 'cosine' or 'euclidean'
+        RETURNS:
+            numpy.ndarray - matrix of distances with one row per match in the batch
+        """
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        if metric == 'cosine':
+            return 1.0 - self._unitVectors[rows].dot(self._unitVectors.T)
+        elif metric == 'euclidean':
+            squared = (self._squaredNorms[rows][:, numpy.newaxis] + self._squaredNorms[numpy.newaxis, :]
+                       - 2.0 * self.standardised[rows].dot(self.standardised.T))
+            return numpy.sqrt(numpy.maximum(squared, 0.0))
+        raise ValueError("Unknown metric {}, expected 'cosine' or 'euclidean'".format(metric))
+
+    def getSimilarMatches(self, matchIds, k=5, metric='euclidean'):
+        """
+        Nearest matches for a batch of matches
+        ARGS:
+            matchIds ([str]) - ids of the matches to find neighbours for
+            k (int) - number of neighbours for each match
+            metric (str) - 'cosine' or 'euclidean'
+        RETURNS:
+            [[(str, float),]] - for each match a list of tuples sorted by distance, in the
+                                form (matchId, distance), None if the match is not in the matrix
+        """
+        found = [(index, self._rows[str(matchId)]) for index, matchId in enumerate(matchIds) if str(matchId) in self._rows]
+        results = [None] * len(matchIds)
+        if not found:
+            return results
+        distances = self.distances([row for index, row in found], metric)
+        for batchRow, (index, row) in enumerate(found):
+            rowDistances = distances[batchRow]
+            rowDistances[row] = numpy.inf
+            count = min(k, len(self.matchIds) - 1)
+            nearest = numpy.argpartition(rowDistances, count - 1)[:count] if count > 0 else numpy.array([], dtype=numpy.intp)
+            nearest = nearest[numpy.argsort(rowDistances[nearest])]
+            results[index] = [(self.matchIds[other], float(rowDistances[other])) for other in nearest]
+        return results
+
+    def kMeans(self, clusters, iterations=50, seed=0):
+        """
+        Cluster the matches with k-means on the standardised matrix, seeded with k-means++
+        ARGS:
+            clusters (int) - number of clusters
+            iterations (int) - maximum number of iterations, at least 1
+            seed (int) - random seed for the initial centroids
+        RETURNS:
+            (dict, numpy.ndarray) - dictionary in the form {matchId: cluster} and the centroids
+                                    in standardised units, one row per cluster
+        """
+        if iterations < 1:
+            raise ValueError("kMeans needs at least 1 iteration, got {}".format(iterations))
+        points = self.standardised
+        if not len(points):
+            return {}, numpy.zeros((0, len(self.columns)))
+        random = numpy.random.RandomState(seed)
+        centroids = [points[random.randint(len(points))]]
+        for cluster in range(1, clusters):
+            squared = ((points[:, numpy.newaxis, :] - numpy.array(centroids)[numpy.newaxis, :, :]) ** 2).sum(axis=2).min(axis=1)
+            total = squared.sum()
+            choice = random.choice(len(points), p=squared / total) if total > 0 else random.randint(len(points))
+            centroids.append(points[choice])
+        centroids = numpy.array(centroids)
+        labels = None
+        for iteration in range(iterations):
+            squared = (self._squaredNorms[:, numpy.newaxis] + (centroids ** 2).sum(axis=1)[numpy.newaxis, :]
+                       - 2.0 * points.dot(centroids.T))
+            newLabels = squared.argmin(axis=1)
+            if labels is not None and (newLabels == labels).all():
+                break
+            labels = newLabels
+            for cluster in range(clusters):
+                members = points[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+        return dict((matchId, int(label)) for matchId, label in zip(self.matchIds, labels)), centroids
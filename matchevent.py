@@ -1,3 +1,5 @@
+import frames
+
 class MatchEvent():
 
     @classmethod
@@ -118,12 +120,12 @@ class MatchEventList():
                 events.append(MatchEvent(int(type), event))
         return cls(events)
 
-    def __init__(self, matchEvents=[]):
+    def __init__(self, matchEvents=None):
         """
         ARGS:
             matchEvents ([MatchEvent]) - list of MatchEvents to store in the list
         """
-        self.matchEvents = matchEvents
+        self.matchEvents = matchEvents if matchEvents is not None else []
     
     def __len__(self):
         """
@@ -133,22 +135,20 @@ class MatchEventList():
 
     def __iter__(self):
         """
-        Iterator implementation for MatchEventList
+        Iterator implementation for MatchEventList, each call returns an independent
+        iterator so loops can be nested or run in threads
         """
-        self.currentIndex = -1
-        return self
+        return iter(self.matchEvents)
 
-    def next(self):
+    def __getitem__(self, index):
         """
-        Iterator implementation for MatchEventList
+        Get an event or a slice of events by position
+        ARGS:
+            index (int/slice) - position or slice
         RETURNS:
-            MatchEvent (obj) - returns next MatchEvent object in list
+            MatchEvent (obj) - MatchEvent object, list of MatchEvent objects for a slice
         """
-        if self.currentIndex >= len(self.matchEvents) - 1:
-            raise StopIteration
-        else:
-            self.currentIndex += 1
-            return self.matchEvents[self.currentIndex]
+        return self.matchEvents[index]
 
     def addMatchEvent(self, MatchEvent):
         """
@@ -171,3 +171,19 @@ class MatchEventList():
             if matchEvent.type == type:
                 matchEvents.addMatchEvent(matchEvent)
         return matchEvents
+
+    def toFrame(self):
+        """
+        Convert the MatchEventList to a pandas DataFrame with one row per event. Requires pandas
+        RETURNS:
+            pandas.DataFrame - frame in list order
+        """
+        frames.getPandas()
+        events = self.matchEvents
+        return frames.toFrame([('type', frames.getNumpy().array([event.type for event in events], dtype=int)),
+                               ('typeString', [event.typeString for event in events]),
+                               ('time', frames.getNumpy().array([event.time for event in events], dtype=int)),
+                               ('addedTime', frames.getNumpy().array([event.addedTime for event in events], dtype=int)),
+                               ('text', [event.text for event in events]),
+                               ('homeScore', frames.getNumpy().array([event.homeScore for event in events], dtype=float)),
+                               ('awayScore', frames.getNumpy().array([event.awayScore for event in events], dtype=float))])
@@ -1,5 +1,7 @@
 
 from matchevent import MatchEventList
+from symbols import PLAYERS, POSITIONS, STATS
+import frames
 
 class Player():
     """
@@ -12,10 +14,10 @@ class Player():
             playerDict (dict) - dict for a player in a match stored in the database
             matchEventList (MatchEventList) - MatchEventList object used to get minutes played
         """     
-        self.name = playerDict['name']
+        self.name = PLAYERS.intern(playerDict['name'])
         self.id = playerDict['id']
         self.number = playerDict['number']
-        self.position = playerDict['position']
+        self.position = POSITIONS.intern(playerDict['position'])
         self.isCaptain = playerDict['captain']
         self.subbed = playerDict['subbed']
         self.eventTimes = playerDict['eventTimes']
@@ -23,7 +25,7 @@ class Player():
         for key in playerDict.keys():
             if type(playerDict[key]) is dict and key != 'eventTimes':
                 stat = playerDict[key]
-                self.matchStats[stat['name'].lower()] = float(stat['value'])
+                self.matchStats[STATS.intern(stat['name'])] = float(stat['value'])
         
         if 'missed tackles' in self.matchStats.keys() and self.matchStats['tackles'] >= self.matchStats['missed tackles']:
             # adjust tackles to be completed tackles
@@ -57,9 +59,7 @@ class Player():
         RETURNS
             float - stat value, None if stat not found
         """
-        if stat.lower() in self.matchStats.keys():
-            return self.matchStats[stat.lower()]
-        return None
+        return self.matchStats.get(STATS.canonical(stat))
 
     def getStatAverage(self, stat):
         """
@@ -77,9 +77,11 @@ class Player():
         ARGS:
             stat (str) - name of the stat to look for
         RETURNS
-            float - stat value, None if stat not found
+            float - stat value, None if stat not found or the player has no minutes played
         """
         statValue = self.getStat(stat)
+        if not self.minutesPlayed:
+            return None
         if statValue is not None:
             statValue = float(statValue) * (80.0/float(self.minutesPlayed))
         return statValue
@@ -113,22 +115,31 @@ class PlayerList():
     
     def __iter__(self):
         """
-        Iterator implementation for MatchList
+        Iterator implementation for PlayerList, each call returns an independent
+        iterator so loops can be nested or run in threads
         """
-        self.currentIndex = -1
-        return self
+        return iter(self.players)
 
-    def next(self):
+    def __getitem__(self, index):
         """
-        Iterator implementation for PlayerList
+        Get a player or a slice of players by position
+        ARGS:
+            index (int/slice) - position or slice
         RETURNS:
-            Player (obj) - returns next player object in list
+            Player (obj) - Player object, list of Player objects for a slice
         """
-        if self.currentIndex >= len(self.players) - 1:
-            raise StopIteration
-        else:
-            self.currentIndex += 1
-            return self.players[self.currentIndex]
+        return self.players[index]
+
+    def getStatValues(self, stat):
+        """
+        Get the value of a stat for every player in one call
+        ARGS:
+            stat (str) - name of the stat to look for
+        RETURNS:
+            [float] - list of stat values in list order, None for players without the stat
+        """
+        stat = STATS.canonical(stat)
+        return [player.matchStats.get(stat) for player in self.players]
 
     def getPlayer(self, index):
         """
@@ -149,6 +160,23 @@ class PlayerList():
         """
         self.players.append(player)
 
+    def toFrame(self):
+        """
+        Convert the PlayerList to a pandas DataFrame with one row per player
+        and one column per stat. Requires pandas
+        RETURNS:
+            pandas.DataFrame - frame in list order
+        """
+        frames.getPandas()
+        columns = [('id', [player.id for player in self.players]),
+                   ('name', [player.name for player in self.players]),
+                   ('number', frames.getNumpy().array([player.number for player in self.players], dtype=int)),
+                   ('position', [player.position for player in self.players]),
+                   ('captain', frames.getNumpy().array([player.isCaptain for player in self.players], dtype=bool)),
+                   ('minutesPlayed', frames.getNumpy().array([player.minutesPlayed for player in self.players], dtype=float))]
+        columns.extend(frames.statColumns([player.matchStats for player in self.players]))
+        return frames.toFrame(columns)
+
 
 class PlayerSeries(PlayerList):
     """
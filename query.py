@@ -0,0 +1,190 @@
+from rugbydb import CachedDB
+from match import Match
+from symbols import TEAMS
+from variables import MATCH_IDS
+
+# Fields that can be read straight from the stored match dictionary
+# without building a Match object
+FIELDS = {'id': lambda league, season, matchId, matchDict: matchId,
+          'league': lambda league, season, matchId, matchDict: league,
+          'season': lambda league, season, matchId, matchDict: season,
+          'date': lambda league, season, matchId, matchDict: matchDict['gamePackage']['gameStrip']['isoDate'],
+          'homeTeam': lambda league, season, matchId, matchDict: TEAMS.intern(matchDict['gamePackage']['gameStrip']['teams']['home']['name']),
+          'awayTeam': lambda league, season, matchId, matchDict: TEAMS.intern(matchDict['gamePackage']['gameStrip']['teams']['away']['name']),
+          'homeScore': lambda league, season, matchId, matchDict: float(matchDict['gamePackage']['gameStrip']['teams']['home']['score']),
+          'awayScore': lambda league, season, matchId, matchDict: float(matchDict['gamePackage']['gameStrip']['teams']['away']['score'])}
+
+
+def query(db=None):
+    """
+    Start a new lazy query over the database
+    ARGS:
+        db (RugbyDB) - database to query, default to the cached database
+    RETURNS:
+        Query (obj) - Query object with no filters applied
+    """
+    return Query(db)
+
+
+def getLeagueId(league):
+    """
+    Resolve a league name or id to the league id used in the database
+    ARGS:
+        league (str) - league id or league name
+    RETURNS:
+        str - league id, None if the league is not found
+    """
+    league = str(league)
+    if league in MATCH_IDS:
+        return league
+    for leagueId in MATCH_IDS.keys():
+        if MATCH_IDS[leagueId]['name'].lower() == league.lower():
+            return leagueId
+    return None
+
+
+def _toList(values):
+    """
+    Internal function to accept a single value or a list of values
+    """
+    if values is None:
+        return None
+    if isinstance(values, (list, tuple, set)):
+        return list(values)
+    return [values]
+
+
+class Query(object):
+    """
+    Lazy query over the database. Filters are chained and each returns a
+    new Query, nothing is read until the query is iterated, e.g.
+    query().league('Champions Cup').season('1819').team('Munster')
+    Matches are parsed one at a time so scans run in constant memory
+    """
+
+    def __init__(self, db=None):
+        """
+        ARGS:
+            db (RugbyDB) - database to query, default to the cached database
+        """
+        self._db = db
+        self._leagues = None
+        self._seasons = None
+        self._teams = None
+        self._startDate = None
+        self._endDate = None
+
+    def _copy(self, **filters):
+        """
+        Internal function to return a new Query with updated filters
+        """
+        newQuery = Query(self._db)
+        newQuery.__dict__.update(self.__dict__)
+        for key, value in filters.items():
+            setattr(newQuery, key, value)
+        return newQuery
+
+    @property
+    def db(self):
+        """
+        Return the database the query runs against
+        """
+        return self._db if self._db is not None else CachedDB()
+
+    def league(self, leagues):
+        """
+        Filter by league
+        ARGS:
+            leagues (str/[str]) - league id or name, or list of league ids or names
+        RETURNS:
+            Query (obj) - new filtered query
+        """
+        leagueIds = [getLeagueId(league) for league in _toList(leagues)]
+        return self._copy(_leagues=[league for league in leagueIds if league is not None])
+
+    def season(self, seasons):
+        """
+        Filter by season
+        ARGS:
+            seasons (str/[str]) - season string or list of season strings
+        RETURNS:
+            Query (obj) - new filtered query
+        """
+        return self._copy(_seasons=_toList(seasons))
+
+    def team(self, teams):
+        """
+        Filter by team, matches are kept if either team is in the filter
+        ARGS:
+            teams (str/[str]) - team name or list of team names
+        RETURNS:
+            Query (obj) - new filtered query
+        """
+        return self._copy(_teams=_toList(teams))
+
+    def dateRange(self, startDate=None, endDate=None):
+        """
+        Filter by kick off date
+        ARGS:
+            startDate (datetime) - start date in range to search, default no limit
+            endDate (datetime) - end date in range to search, default no limit
+        RETURNS:
+            Query (obj) - new filtered query
+        """
+        return self._copy(_startDate=startDate, _endDate=endDate)
+
+    def records(self):
+        """
+        Generator over the raw records that match the query
+        YIELDS:
+            (str, str, str, dict) - tuple in the form (leagueId, season, matchId, matchDict)
+        """
+        if self._leagues == []:
+            return iter([])
+        return self.db.iterMatches(leagues=self._leagues,
+                                   seasons=self._seasons,
+                                   teams=self._teams,
+                                   startDate=self._startDate,
+                                   endDate=self._endDate)
+
+    def matchIds(self):
+        """
+        Generator over the ids of matches that match the query
+        YIELDS:
+            str - match id
+        """
+        for record in self.records():
+            yield record[2]
+
+    def fields(self, *names):
+        """
+        Generator over selected fields of the matches without parsing them
+        ARGS:
+            names (str) - field names, any of the keys in FIELDS
+        YIELDS:
+            tuple - values of the fields in the order requested
+        """
+        for name in names:
+            if name not in FIELDS:
+                raise ValueError("Unknown field {}, expected one of {}".format(name, sorted(FIELDS.keys())))
+        getters = [FIELDS[name] for name in names]
+        for record in self.records():
+            yield tuple(getter(*record) for getter in getters)
+
+    def __iter__(self):
+        """
+        Iterate over parsed Match objects one at a time
+        """
+        for record in self.records():
+            yield Match(record[3])
+
+    def count(self):
+        """
+        Count the matches in the query without parsing them
+        RETURNS:
+            int - number of matches
+        """
+        total = 0
+        for record in self.records():
+            total += 1
+        return total
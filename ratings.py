@@ -0,0 +1,323 @@
+import bisect
+import math
+
+from query import query
+from rugbydb import parseIsoDate
+from symbols import TEAMS
+
+class MatchHistory(object):
+    """
+    Compact, kick off ordered arrays of every result, read from the match
+    scores without building Match objects so ratings can be replayed quickly
+    """
+
+    @classmethod
+    def fromQuery(cls, matchQuery=None):
+        """
+        Build the history for the matches in a query
+        ARGS:
+            matchQuery (Query) - query of the matches to include, default every match in the database
+        RETURNS:
+            MatchHistory (obj) - new MatchHistory object
+        """
+        history = cls()
+        matchQuery = matchQuery if matchQuery is not None else query()
+        for result in matchQuery.fields('id', 'date', 'homeTeam', 'awayTeam', 'homeScore', 'awayScore'):
+            history.addMatch(*result)
+        return history
+
+    def __init__(self):
+        self.teams = []
+        self._teamIds = {}
+        self.matchIds = []
+        self.days = []
+        self.homeTeams = []
+        self.awayTeams = []
+        self.homeScores = []
+        self.awayScores = []
+
+    def __len__(self):
+        return len(self.matchIds)
+
+    def getTeamId(self, team):
+        """
+        Get the integer id used for a team in the arrays, adding it if it is new
+        ARGS:
+            team (str) - team name
+        RETURNS:
+            int - team id
+        """
+        team = TEAMS.intern(team)
+        teamId = self._teamIds.get(team)
+        if teamId is None:
+            teamId = self._teamIds[team] = len(self.teams)
+            self.teams.append(team)
+        return teamId
+
+    def addMatch(self, matchId, date, homeTeam, awayTeam, homeScore, awayScore):
+        """
+        Add or replace a result, keeping the arrays in kick off order
+        ARGS:
+            matchId (str) - id of the match
+            date (str) - espn iso date string of the kick off
+            homeTeam (str) - home team name
+            awayTeam (str) - away team name
+            homeScore (float) - home team score
+            awayScore (float) - away team score
+        RETURNS:
+            int - index of the match in the arrays
+        """
+        matchId = str(matchId)
+        if matchId in self.matchIds:
+            index = self.matchIds.index(matchId)
+            for column in (self.matchIds, self.days, self.homeTeams, self.awayTeams, self.homeScores, self.awayScores):
+                del column[index]
+        day = parseIsoDate(date).toordinal()
+        index = bisect.bisect_right(self.days, day)
+        self.matchIds.insert(index, matchId)
+        self.days.insert(index, day)
+        self.homeTeams.insert(index, self.getTeamId(homeTeam))
+        self.awayTeams.insert(index, self.getTeamId(awayTeam))
+        self.homeScores.insert(index, float(homeScore))
+        self.awayScores.insert(index, float(awayScore))
+        return index
+
+
+class EloRatings(object):
+    """
+    Elo ratings with home advantage and an optional margin of victory multiplier
+    """
+
+    def __init__(self, k=20.0, homeAdvantage=50.0, initial=1500.0, marginOfVictory=True):
+        """
+        ARGS:
+            k (float) - maximum rating change for a single match
+            homeAdvantage (float) - rating points added to the home team when predicting
+            initial (float) - rating of a team in its first match
+            marginOfVictory (bool) - True = scale changes by the log of the points margin
+        """
+        self.k = k
+        self.homeAdvantage = homeAdvantage
+        self.initial = initial
+        self.marginOfVictory = marginOfVictory
+
+    def newState(self):
+        return {}
+
+    def getRating(self, state, team):
+        return state.get(team, self.initial)
+
+    def expected(self, state, home, away):
+        """
+        Probability of a home win
+        """
+        difference = self.getRating(state, away) - self.getRating(state, home) - self.homeAdvantage
+        return 1.0 / (1.0 + 10 ** (difference / 400.0))
+
+    def update(self, state, home, away, homeScore, awayScore, day):
+        """
+        Update the state with a single result
+        """
+        expected = self.expected(state, home, away)
+        actual = 1.0 if homeScore > awayScore else (0.5 if homeScore == awayScore else 0.0)
+        multiplier = math.log(abs(homeScore - awayScore) + 1) if self.marginOfVictory and homeScore != awayScore else 1.0
+        change = self.k * multiplier * (actual - expected)
+        state[home] = self.getRating(state, home) + change
+        state[away] = self.getRating(state, away) - change
+
+
+class GlickoRatings(object):
+    """
+    Glicko ratings where every match is its own rating period and a team's
+    rating deviation grows with the days since it last played
+    """
+
+    Q = math.log(10) / 400.0
+
+    def __init__(self, initial=1500.0, deviation=350.0, minDeviation=30.0, dailyGrowth=1.5, homeAdvantage=50.0):
+        """
+        ARGS:
+            initial (float) - rating of a team in its first match
+            deviation (float) - rating deviation of a team in its first match, also the maximum
+            minDeviation (float) - lowest rating deviation a team can reach
+            dailyGrowth (float) - constant c, deviation grows by sqrt(c^2 * days) between matches
+            homeAdvantage (float) - rating points added to the home team when predicting
+        """
+        self.initial = initial
+        self.deviation = deviation
+        self.minDeviation = minDeviation
+        self.dailyGrowth = dailyGrowth
+        self.homeAdvantage = homeAdvantage
+
+    def newState(self):
+        return {}
+
+    def getRating(self, state, team):
+        return state[team][0] if team in state else self.initial
+
+    def _current(self, state, team, day):
+        """
+        Internal function to get a team's rating and deviation grown to the given day
+        """
+        if team not in state:
+            return self.initial, self.deviation
+        rating, deviation, lastDay = state[team]
+        deviation = math.sqrt(deviation ** 2 + self.dailyGrowth ** 2 * (day - lastDay))
+        return rating, min(max(deviation, self.minDeviation), self.deviation)
+
+    def _g(self, deviation):
+        return 1.0 / math.sqrt(1.0 + 3.0 * self.Q ** 2 * deviation ** 2 / math.pi ** 2)
+
+    def expected(self, state, home, away, day=None):
+        """
+        Probability of a home win
+        """
+        homeRating, homeDeviation = self._current(state, home, day) if day is not None else (self.getRating(state, home), 0.0)
+        awayRating, awayDeviation = self._current(state, away, day) if day is not None else (self.getRating(state, away), 0.0)
+        g = self._g(math.sqrt(homeDeviation ** 2 + awayDeviation ** 2))
+        return 1.0 / (1.0 + 10 ** (-g * (homeRating + self.homeAdvantage - awayRating) / 400.0))
+
+    def update(self, state, home, away, homeScore, awayScore, day):
+        """
+        Update the state with a single result
+        """
+        homeResult = 1.0 if homeScore > awayScore else (0.5 if homeScore == awayScore else 0.0)
+        homeRating, homeDeviation = self._current(state, home, day)
+        awayRating, awayDeviation = self._current(state, away, day)
+        state[home] = self._updateTeam(homeRating, homeDeviation, awayRating, awayDeviation, homeResult, day, self.homeAdvantage)
+        state[away] = self._updateTeam(awayRating, awayDeviation, homeRating, homeDeviation, 1.0 - homeResult, day, -self.homeAdvantage)
+
+    def _updateTeam(self, rating, deviation, oppositionRating, oppositionDeviation, result, day, advantage):
+        """
+        Internal function to apply the glicko update for one team
+        """
+        g = self._g(oppositionDeviation)
+        expected = 1.0 / (1.0 + 10 ** (-g * (rating + advantage - oppositionRating) / 400.0))
+        dSquared = 1.0 / (self.Q ** 2 * g ** 2 * expected * (1.0 - expected))
+        denominator = 1.0 / deviation ** 2 + 1.0 / dSquared
+        newRating = rating + self.Q / denominator * g * (result - expected)
+        newDeviation = max(math.sqrt(1.0 / denominator), self.minDeviation)
+        return (newRating, newDeviation, day)
+
+
+class RatingsEngine(object):
+    """
+    Replays a MatchHistory through a rating system in one date ordered pass.
+    Results added after the latest processed match are applied incrementally,
+    earlier results replay the precomputed arrays
+    """
+
+    def __init__(self, history=None, system=None):
+        """
+        ARGS:
+            history (MatchHistory) - results to rate, default every match in the database
+            system (EloRatings/GlickoRatings) - rating system, default EloRatings()
+        """
+        self.history = history if history is not None else MatchHistory.fromQuery()
+        self.system = system if system is not None else EloRatings()
+        self.run()
+
+    def _replay(self, system, end=None):
+        """
+        Internal function to replay the history through a rating system
+        """
+        history = self.history
+        state = system.newState()
+        for index in range(len(history) if end is None else end):
+            system.update(state, history.homeTeams[index], history.awayTeams[index],
+                          history.homeScores[index], history.awayScores[index], history.days[index])
+        return state
+
+    def run(self):
+        """
+        Rate the full history from scratch
+        """
+        self._state = self._replay(self.system)
+        self._processed = len(self.history)
+
+    def addMatch(self, matchId, date, homeTeam, awayTeam, homeScore, awayScore):
+        """
+        Add a result and update the ratings
+        ARGS:
+            matchId (str) - id of the match
+            date (str) - espn iso date string of the kick off
+            homeTeam (str) - home team name
+            awayTeam (str) - away team name
+            homeScore (float) - home team score
+            awayScore (float) - away team score
+        """
+        replaced = str(matchId) in self.history.matchIds
+        index = self.history.addMatch(matchId, date, homeTeam, awayTeam, homeScore, awayScore)
+        if not replaced and index == self._processed:
+            history = self.history
+            self.system.update(self._state, history.homeTeams[index], history.awayTeams[index],
+                               history.homeScores[index], history.awayScores[index], history.days[index])
+            self._processed += 1
+        else:
+            self.run()
+
+    def attach(self, db):
+        """
+        Keep the ratings up to date with matches added to a RugbyDBReadWrite database
+        ARGS:
+            db (RugbyDBReadWrite) - database to listen to
+        """
+        def listener(leagueId, year, matchId, matchDict):
+            gameStrip = matchDict['gamePackage']['gameStrip']
+            self.addMatch(matchId, gameStrip['isoDate'],
+                          gameStrip['teams']['home']['name'], gameStrip['teams']['away']['name'],
+                          gameStrip['teams']['home']['score'], gameStrip['teams']['away']['score'])
+        db.addIngestListener(listener)
+
+    def _ratings(self, system, state):
+        """
+        Internal function to sort every rated team by rating
+        """
+        ratings = [(self.history.teams[team], system.getRating(state, team)) for team in state.keys()]
+        return sorted(ratings, key=lambda tup: tup[1], reverse=True)
+
+    def getRatings(self):
+        """
+        Get the rating of every team
+        RETURNS:
+            [(str, float),] - list of tuples sorted by rating, in the form (teamName, rating)
+        """
+        return self._ratings(self.system, self._state)
+
+    def getRating(self, team):
+        """
+        Get the rating of a team
+        ARGS:
+            team (str) - team name
+        RETURNS:
+            float - rating, None if the team has not played
+        """
+        teamId = self.history._teamIds.get(TEAMS.canonical(team))
+        if teamId is None or teamId not in self._state:
+            return None
+        return self.system.getRating(self._state, teamId)
+
+    def predict(self, homeTeam, awayTeam):
+        """
+        Probability of the home team winning using the current ratings
+        ARGS:
+            homeTeam (str) - home team name
+            awayTeam (str) - away team name
+        RETURNS:
+            float - probability of a home win
+        """
+        teamIds = self.history._teamIds
+        return self.system.expected(self._state, teamIds.get(TEAMS.canonical(homeTeam)), teamIds.get(TEAMS.canonical(awayTeam)))
+
+    def whatIf(self, system, endDate=None):
+        """
+        Replay the same history with a different rating system or parameters,
+        the engine's own ratings are not changed
+        ARGS:
+            system (EloRatings/GlickoRatings) - rating system to replay with
+            endDate (datetime) - only include results up to this date, None for the full history
+        RETURNS:
+            [(str, float),] - list of tuples sorted by rating, in the form (teamName, rating)
+        """
+        end = None if endDate is None else bisect.bisect_right(self.history.days, endDate.toordinal())
+        return self._ratings(system, self._replay(system, end))
@@ -0,0 +1,158 @@
+import copy
+import functools
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+def _freezeKey(value):
+    """
+    Internal function to turn lists, sets and dicts in arguments into hashable tuples
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freezeKey(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freezeKey(item) for item in value))
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freezeKey(item)) for key, item in value.items()))
+    return value
+
+
+class ResultCache(object):
+    """
+    Size bounded least recently used cache of function results with an
+    optional time to live and optional persistence to a pickle file.
+    Keys include a database version so results are never served for data
+    that has changed since they were computed
+    """
+
+    def __init__(self, maxSize=512, ttl=None, path=None):
+        """
+        ARGS:
+            maxSize (int) - maximum number of results to keep, least recently used are evicted first
+            ttl (float) - seconds a result stays valid, None for no expiry
+            path (str) - pickle file to load results from and save them to, None to keep them in memory only
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Look up a result, counting the hit or miss
+        ARGS:
+            key (tuple) - hashable key of the result
+        RETURNS:
+            (bool, obj) - True and the result if found and not expired, otherwise False and None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self._entries[key] = entry
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        """
+        Store a result, evicting the least recently used results if the cache is full
+        ARGS:
+            key (tuple) - hashable key of the result
+            value (obj) - result to store
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove every result and reset the metrics
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def getMetrics(self):
+        """
+        Get the cache metrics
+        RETURNS:
+            dict - dictionary in the form {'hits': int, 'misses': int, 'evictions': int, 'size': int, 'hitRate': float}
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hitRate': float(self.hits) / lookups if lookups else 0.0}
+
+    def save(self, path=None):
+        """
+        Write the unexpired results to a pickle file
+        ARGS:
+            path (str) - file to write, default the path the cache was created with
+        """
+        path = path if path is not None else self.path
+        now = time.time()
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._entries.items() if entry[0] is None or entry[0] > now]
+        with open(path, "wb") as cacheFile:
+            pickle.dump(entries, cacheFile, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path=None):
+        """
+        Read results from a pickle file written by save, a file that cannot be read is ignored
+        ARGS:
+            path (str) - file to read, default the path the cache was created with
+        """
+        path = path if path is not None else self.path
+        try:
+            with open(path, "rb") as cacheFile:
+                entries = pickle.load(cacheFile)
+        except Exception as e:
+            print("Failed to load result cache {}: {}".format(path, e))
+            return
+        with self._lock:
+            for key, entry in entries:
+                self._entries[key] = entry
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def wrap(self, func, version=None):
+        """
+        Wrap a function so its results are cached by its arguments and a version.
+        Each call returns a copy so callers can modify the result safely
+        ARGS:
+            func (function) - function to cache
+            version (function) - function returning the current data version, None for no version
+        RETURNS:
+            function - caching version of func
+        """
+        @functools.wraps(func)
+        def cachedFunc(*args, **kwargs):
+            key = (func.__name__, _freezeKey(args), _freezeKey(kwargs), version() if version is not None else None)
+            found, value = self.get(key)
+            if not found:
+                value = func(*args, **kwargs)
+                self.set(key, value)
+            return copy.deepcopy(value)
+        cachedFunc.uncached = func
+        return cachedFunc
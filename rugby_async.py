@@ -0,0 +1,218 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import rugby_stats
+from rugbydb import CachedDB, warmUp
+from match import Match, MatchList
+from league import League
+
+# only a concurrent.futures API is offered, there is no asyncio adapter as asyncio
+# does not exist on python 2. concurrent.futures needs the futures backport on
+# python 2 (see requirements.txt), callers can block on the returned futures or
+# chain callbacks with add_done_callback
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent identical calls so the work is only done once,
+    every caller with the same key gets the same future while it is running
+    """
+
+    def __init__(self, executor):
+        """
+        ARGS:
+            executor (Executor) - executor the work is submitted to
+        """
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._inFlight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def submit(self, key, func, *args):
+        """
+        Run a function in the executor unless an identical call is already running
+        ARGS:
+            key (tuple) - hashable key identifying the call
+            func (function) - function to run
+            args - arguments for the function
+        RETURNS:
+            Future (obj) - future for the result of the call
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._inFlight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._executor.submit(func, *args)
+            self._inFlight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        """
+        Internal function to forget a call once it has finished
+        """
+        with self._lock:
+            if self._inFlight.get(key) is future:
+                del self._inFlight[key]
+
+
+def _parseMatch(matchDict):
+    """
+    Internal function to build a Match, module level so it can run in a process pool
+    """
+    return Match(matchDict) if matchDict is not None else None
+
+
+def _freeze(value):
+    """
+    Internal function to make list arguments hashable for the single flight key
+    """
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class RugbyService(object):
+    """
+    Non blocking facade over RugbyDB, MatchList, League and rugby_stats.
+    Every call returns a concurrent.futures.Future and identical calls that
+    overlap share one computation
+    """
+
+    def __init__(self, maxWorkers=4, parseExecutor=None):
+        """
+        ARGS:
+            maxWorkers (int) - number of threads used for database and stats calls
+            parseExecutor (Executor) - executor used to parse match dictionaries, e.g. a
+                                       ProcessPoolExecutor to keep parsing off the GIL,
+                                       default to the thread pool
+        """
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self._parseExecutor = parseExecutor if parseExecutor is not None else self._executor
+        self._singleFlight = SingleFlight(self._executor)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads
+        ARGS:
+            wait (bool) - True = wait for running calls to finish
+        """
+        self._executor.shutdown(wait=wait)
+
+    def _submit(self, name, func, *args):
+        """
+        Internal function to submit a call through the single flight group
+        """
+        return self._singleFlight.submit((name,) + _freeze(args), func, *args)
+
+    def warmUp(self):
+        """
+        Load the full database in the background
+        RETURNS:
+            Future (obj) - future that completes when the database is loaded
+        """
+        return self._submit('warmUp', warmUp, False)
+
+    def getMatchById(self, matchId):
+        """
+        Get a match dictionary for a given id
+        ARGS:
+            matchId (str) - match id to search for
+        RETURNS:
+            Future (obj) - future for the match dictionary, None if not found
+        """
+        return self._submit('getMatchById', CachedDB().getMatchById, str(matchId))
+
+    def getMatchesForTeam(self, team, leagues=None, seasons=None):
+        """
+        Get the match dictionaries for a team
+        ARGS:
+            team (str) - team name
+            leagues ([str]) - list of league ids to search, default all leagues
+            seasons ([str]) - list of seasons to search, default all seasons
+        RETURNS:
+            Future (obj) - future for a dictionary in the form {matchId: matchDict}
+        """
+        return self._submit('getMatchesForTeam', CachedDB().getMatchesForTeam, team.lower(), leagues, seasons)
+
+    def matchFromId(self, matchId):
+        """
+        Create a Match object from a match id, parsing runs in the parse executor
+        ARGS:
+            matchId (str) - match id
+        RETURNS:
+            Future (obj) - future for the Match object, None if not found
+        """
+        return self._submit('matchFromId', self._matchFromId, str(matchId))
+
+    def _matchFromId(self, matchId):
+        """
+        Internal function to read a match in a worker thread and parse it in the parse executor
+        """
+        matchDict = CachedDB().getMatchById(matchId)
+        if self._parseExecutor is self._executor:
+            return _parseMatch(matchDict)
+        return self._parseExecutor.submit(_parseMatch, matchDict).result()
+
+    def matchListForTeam(self, team, leagues=None, seasons=None):
+        """
+        Create a MatchList for a team
+        ARGS:
+            team (str) - team name
+            leagues ([str]) - list of league ids to filter by, search all leagues if None
+            seasons ([str]) - list of seasons to filter by, search all seasons if None
+        RETURNS:
+            Future (obj) - future for the MatchList object
+        """
+        return self._submit('matchListForTeam', MatchList.createMatchListForTeam, team.lower(), leagues, seasons)
+
+    def league(self, name, initMatches=True):
+        """
+        Create a League from its name
+        ARGS:
+            name (str) - name of the league
+            initMatches (bool) - True = Load all match data into MatchList, False = Only store match ids in MatchList
+        RETURNS:
+            Future (obj) - future for the League object, None if the league is not found
+        """
+        return self._submit('league', League.fromLeagueName, name.lower(), initMatches)
+
+    def stat(self, functionName, *args):
+        """
+        Run any rugby_stats function
+        ARGS:
+            functionName (str) - name of the function in rugby_stats, e.g. 'getAverageStatForTeam'
+            args - arguments for the function
+        RETURNS:
+            Future (obj) - future for the result of the function
+        """
+        func = getattr(rugby_stats, functionName, None)
+        if func is None or functionName.startswith('_'):
+            raise AttributeError("rugby_stats has no function {}".format(functionName))
+        return self._submit(functionName, func, *args)
+
+    def getLeagueLeadersForStatTotal(self, leagueName, season, stat):
+        """
+        Get the league leaders for a given stat in a season
+        ARGS:
+            leagueName (str) - name of the league
+            season (str) - seasons string to search
+            stat (str) - stat name to get leaders for
+        RETURNS:
+            Future (obj) - future for a list of tuples in the form (playerName, teamName, statValue)
+        """
+        return self.stat('getLeagueLeadersForStatTotal', leagueName.lower(), season, stat.lower())
+
+    def getAverageStatForTeam(self, stat, team, seasons=None):
+        """
+        Get average of a stat for a team
+        ARGS:
+            stat (str) - name of stat to search for
+            team (str) - team name
+            seasons (str) - season string to limit search, None is all seasons
+        RETURNS:
+            Future (obj) - future for the average
+        """
+        return self.stat('getAverageStatForTeam', stat.lower(), team.lower(), seasons)
@@ -1,6 +1,21 @@
 from match import MatchList
 from league import League
+from query import query, getLeagueId
+from rugbydb import CachedDB
+from resultcache import ResultCache
 
+# results of the stat functions keyed by their arguments and the cached database version,
+# set RESULT_CACHE.ttl or RESULT_CACHE.maxSize to tune and RESULT_CACHE.save(path) to persist
+RESULT_CACHE = ResultCache()
+
+def _cached(func):
+    """
+    Internal decorator to cache a stat function in RESULT_CACHE
+    """
+    return RESULT_CACHE.wrap(func, lambda: CachedDB().getVersion())
+
+
+@_cached
 def getAveragePointsScored(team, seasons=None):
     """
     Get average points scored by a team, limit it by season
@@ -13,23 +28,27 @@ def getAveragePointsScored(team, seasons=None):
     return getAverageStatForTeam('points', team, seasons)
 
 
+@_cached
 def getAverageStatForTeam(stat, team, seasons=None):
     """
-    Get average of a stat for a team, limit it by season
+    Get average of a stat for a team, limit it by season. Answered from the
+    season summaries of every league season the team played in
     ARGS:
         stat (str) - name of stat to search for
         team (str) - team name
         seasons (str) - season string to limit search, None is all seasons
     RETURNS:
-        float - average of stats
+        float - average of stats, None if the team or stat is not found
     """
-    matchList = MatchList.createMatchListForTeam(team, seasons=seasons)
+    db = CachedDB()
     statTotal = 0
     matches = 0
-    for match in matchList:
-        statTotal += match.getStatForTeam(team, stat)
-        matches += 1
-    return float(statTotal)/float(matches)
+    for league, season in set(query().team(team).season(seasons).fields('league', 'season')):
+        total, count = db.getSeasonSummary(league, season).getTeamTotal(team, stat)
+        if count:
+            statTotal += total
+            matches += count
+    return float(statTotal)/float(matches) if matches else None
 
 
 def getPlayerStatInMatches(matchList, stat):
@@ -66,6 +85,7 @@ def getTeamStatInMatches(matchList, stat):
             teamStats.append((team, match.getStatForTeam(team,stat)))
     return sorted(teamStats, key=lambda tup: tup[1], reverse=True)
 
+@_cached
 def getLeagueLeadersForStatTotal(leagueName, season, stat):
     """
     Get the league leaders for a given stat in a season
@@ -76,17 +96,121 @@ def getLeagueLeadersForStatTotal(leagueName, season, stat):
     RETURNS:
         [(str, str, float),] - list of tuples sorted by value, in the form (playerName, teamName, statValue)
     """
-    leagueLeadersDict = {}
-    league = League.fromLeagueName(leagueName)
-    if league is not None:
-        seasonMatchList = league._matches[season]
-        for match in seasonMatchList:
-            for team in match.players.keys():
-                for player in match.players[team]:
-                    if player.id in leagueLeadersDict:
-                        leagueLeadersDict[player.id][2] += player.getStat(stat)
-                    else:
-                        leagueLeadersDict[player.id] = [player.name, team, player.getStat(stat)]
-    return sorted(leagueLeadersDict.values(), key=lambda tup: tup[2], reverse=True)
+    leagueId = getLeagueId(leagueName)
+    if leagueId is None:
+        return []
+    summary = CachedDB().getSeasonSummary(leagueId, season)
+    return summary.getPlayerLeaders(stat) if summary is not None else []
+
+
+@_cached
+def getLeadersForStat(stat, leagues=None, seasons=None, aggregation='sum', processes=None):
+    """
+    Get the leaders for a stat across leagues and seasons, merged from the
+    cached aggregate of each league season rather than walking the matches
+    ARGS:
+        stat (str) - stat name to get leaders for
+        leagues ([str]) - list of league ids or names to search, None is all leagues
+        seasons ([str]) - list of seasons to search, None is all seasons
+        aggregation (str) - one of aggregates.AGGREGATIONS, e.g. 'sum', 'mean' or 'per80'
+        processes (int) - number of worker processes to build missing season aggregates, None to build them here
+    RETURNS:
+        [(str, str, float),] - list of tuples sorted by value, in the form (playerName, teamName, statValue)
+    """
+    from aggregates import aggregate
+    return aggregate(leagues, seasons, processes=processes).getPlayerLeaders(stat, aggregation)
     
 
+
+AGGREGATIONS = ('sum', 'mean', 'median', 'per80', 'against')
+
+def _median(values):
+    """
+    Internal function to get the median of a list of values
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _matchMinutes(match):
+    """
+    Internal function to get the length of a match from the end of game event, default 80
+    """
+    for event in match.matchEventList.getAllEventsForType(12):
+        return max(80, event.time + event.addedTime)
+    return 80
+
+
+@_cached
+def getTeamStatTable(teams, stats, aggregations=('mean',), leagues=None, seasons=None):
+    """
+    Aggregate several stats for several teams in one pass over the selected matches
+    ARGS:
+        teams ([str]) - list of team names, None for every team in the selected matches
+        stats ([str]) - list of stat names
+        aggregations ([str]) - list of aggregations from AGGREGATIONS, 'against' is the
+                               mean value of the stat for the opposition
+        leagues ([str]) - list of league ids or names to limit search, None is all leagues
+        seasons ([str]) - list of seasons to limit search, None is all seasons
+    RETURNS:
+        ([str], [tuple]) - column names in the form ['team', 'stat aggregation', ...] and one
+                           row per team sorted by team name, aggregate is None if the stat is not found
+    """
+    for aggregation in aggregations:
+        if aggregation not in AGGREGATIONS:
+            raise ValueError("Unknown aggregation {}, expected one of {}".format(aggregation, AGGREGATIONS))
+    stats = [stat.lower() for stat in stats]
+    teamFilter = [team.lower() for team in teams] if teams else None
+    matchQuery = query().team(teamFilter).season(seasons)
+    if leagues:
+        matchQuery = matchQuery.league(leagues)
+
+    valuesFor = {}
+    valuesAgainst = {}
+    minutes = {}
+    for match in matchQuery:
+        matchMinutes = None
+        for team, opposition in ((match.homeTeam['name'], match.awayTeam['name']),
+                                 (match.awayTeam['name'], match.homeTeam['name'])):
+            if teamFilter is not None and team not in teamFilter:
+                continue
+            if team not in valuesFor:
+                valuesFor[team] = {stat: [] for stat in stats}
+                valuesAgainst[team] = {stat: [] for stat in stats}
+                minutes[team] = {stat: 0 for stat in stats}
+            if matchMinutes is None:
+                matchMinutes = _matchMinutes(match)
+            for stat in stats:
+                value = match.getStatForTeam(team, stat)
+                if value is not None:
+                    valuesFor[team][stat].append(float(value))
+                    minutes[team][stat] += matchMinutes
+                against = match.getStatForTeam(opposition, stat)
+                if against is not None:
+                    valuesAgainst[team][stat].append(float(against))
+
+    columns = ['team'] + ["{} {}".format(stat, aggregation) for stat in stats for aggregation in aggregations]
+    rows = []
+    for team in sorted(teamFilter if teamFilter is not None else valuesFor.keys()):
+        row = [team]
+        for stat in stats:
+            values = valuesFor.get(team, {}).get(stat, [])
+            against = valuesAgainst.get(team, {}).get(stat, [])
+            for aggregation in aggregations:
+                if aggregation == 'against':
+                    row.append(sum(against) / len(against) if against else None)
+                elif not values:
+                    row.append(None)
+                elif aggregation == 'sum':
+                    row.append(sum(values))
+                elif aggregation == 'mean':
+                    row.append(sum(values) / len(values))
+                elif aggregation == 'median':
+                    row.append(_median(values))
+                elif aggregation == 'per80':
+                    row.append(sum(values) * 80.0 / minutes[team][stat])
+        rows.append(tuple(row))
+    return columns, rows
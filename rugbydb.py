@@ -1,49 +1,366 @@
 import json
 import os
 import re
-import requests
 import datetime
+import threading
 
 import variables
+from archive import MatchArchive, MATCH_SUBTREES, writeArchive
+from discovery import getManifest
+from symbols import TEAMS
 
 CWD = os.path.dirname(os.path.realpath(__file__))
 
 RUGBY_DB = None
+RUGBY_DB_LOCK = threading.Lock()
+
+# number of matches stored by any writer in this process, part of the version of every database
+WRITE_GENERATION = 0
+WRITE_GENERATION_LOCK = threading.Lock()
+
+def parseIsoDate(date):
+    """
+    Convert an espn iso date string to a datetime
+    ARGS:
+        date (str) - date string in the form 2018-03-17T14:15Z
+    RETURNS:
+        datetime - datetime of the match kick off
+    """
+    dateParts = date[:10].split('-')
+    timeParts = date[11:-1].split(':')
+    return datetime.datetime(int(dateParts[0]),
+                             int(dateParts[1]),
+                             int(dateParts[2]),
+                             int(timeParts[0]),
+                             int(timeParts[1]))
+
+def parseMatchStr(matchStr):
+    """
+    Read the match dictionary from the initial state line of an espn match page
+    ARGS:
+        matchStr (str) - full match dictionary string read from file or online
+    RETURNS:
+        dict - match dictionary, raises a ValueError if the string is not valid json
+    """
+    return json.loads(matchStr[:-1].replace('          window.__INITIAL_STATE__ = ', ''))
+
+def getFileVersion(path):
+    """
+    Version of a file, stored with the catalogs and summaries written beside a league
+    file so they are only read back for the league file they were built from
+    ARGS:
+        path (str) - path of the file
+    RETURNS:
+        [float, int] - modification time and size, None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    return [os.path.getmtime(path), os.path.getsize(path)]
+
+def bumpWriteGeneration():
+    """
+    Record that a match has been stored, changing the version of every database in the process
+    RETURNS:
+        int - new write generation
+    """
+    global WRITE_GENERATION
+    with WRITE_GENERATION_LOCK:
+        WRITE_GENERATION += 1
+        return WRITE_GENERATION
 
 def CachedDB():
     """
-    Use the cached database to avoid reloading the database multiple times
+    Use the cached database to avoid reloading the database multiple times.
+    League files are only loaded when a query first needs them
     RETURNS:  
         RugbyDB (obj) - RugbyDB object  
     """
     global RUGBY_DB
     if RUGBY_DB is None:
-        RUGBY_DB = RugbyDB()
+        with RUGBY_DB_LOCK:
+            if RUGBY_DB is None:
+                RUGBY_DB = RugbyDB(lazy=True)
     return RUGBY_DB
 
+def warmUp(background=True):
+    """
+    Preload every league and its indexes into the cached database, queries
+    can be served while the warm up runs in the background
+    ARGS:
+        background (bool) - True = load in a daemon thread, False = load before returning
+    RETURNS:
+        threading.Thread - thread loading the database, None if not run in the background
+    """
+    db = CachedDB()
+    if not background:
+        db.loadDb()
+        return None
+    thread = threading.Thread(target=db.loadDb, name="RugbyDBWarmUp")
+    thread.daemon = True
+    thread.start()
+    return thread
+
 class RugbyDB(object):
     """
     Class to load and manipulate the raw data
     """
 
-    def __init__(self):
+    # gamePackage subtrees decoded from compressed archives, None for the full payload
+    archiveSubtrees = MATCH_SUBTREES
+
+    def __init__(self, lazy=False):
         """
         Init and load the database
+        ARGS:
+            lazy (bool) - True = only load a league file when it is first queried,
+                          False = load the full database now
         """
         self.dbPath = os.path.join(CWD, "rugby_database")
         self.db = {}
-        self.loadDb()
+        self._summaries = {}
+        self._catalogs = {}
+        self._catalogFiles = {}
+        self._matchIndex = {}
+        self._teamIndex = {}
+        self._dateIndex = {}
+        self._loadLock = threading.RLock()
+        self._leagueFiles = {}
+        self._archives = {}
+        for db in sorted(os.listdir(self.dbPath)):
+            if "backup" not in db and db.endswith(".db"):
+                self._leagueFiles[os.path.splitext(db)[0]] = os.path.join(self.dbPath, db)
+        # compressed archives are read for leagues without a json database file
+        for db in sorted(os.listdir(self.dbPath)):
+            if "backup" not in db and db.endswith(".dbz") and os.path.splitext(db)[0] not in self._leagueFiles:
+                self._leagueFiles[os.path.splitext(db)[0]] = os.path.join(self.dbPath, db)
+        # files the database was read from, with the writes since then gives the data version
+        self._fileVersion = tuple(sorted((league, os.path.getmtime(path), os.path.getsize(path))
+                                         for league, path in self._leagueFiles.items()))
+        if not lazy:
+            self.loadDb()
     
     def loadDb(self):
         """
         Load the database into memory
         """
-        for db in os.listdir(self.dbPath):
-            if "backup" not in db:
-                with open(os.path.join(self.dbPath, db)) as dbFile:
-                    dbContents = dbFile.read()
-                leagueDict = json.loads(dbContents)
-                self.db[os.path.splitext(db)[0]] = leagueDict
+        for league in sorted(self._leagueFiles.keys()):
+            self._loadLeague(league)
+
+    def _loadLeague(self, league, seasons=None):
+        """
+        Load a league file and index its matches if it has not been loaded yet
+        ARGS:
+            league (str) - league id
+            seasons ([str]) - seasons to load, None for every season. Only these seasons are decoded
+                              from a compressed archive, a json league file is parsed in full
+        RETURNS:
+            bool - True if the league is in the database
+        """
+        if league in self.db:
+            return True
+        if league not in self._leagueFiles:
+            return False
+        with self._loadLock:
+            if league not in self.db:
+                archive = self._getArchive(league)
+                if archive is not None:
+                    leagueDict = archive.toLeagueDict(self.archiveSubtrees, seasons)
+                else:
+                    with open(self._leagueFiles[league]) as dbFile:
+                        dbContents = dbFile.read()
+                    leagueDict = json.loads(dbContents)
+                    if seasons is not None:
+                        leagueDict = dict((year, matches) for year, matches in leagueDict.items() if year in seasons)
+                self._replayJournal(league, leagueDict)
+                for year in leagueDict.keys():
+                    for match in leagueDict[year].keys():
+                        self._indexMatch(league, year, match, leagueDict[year][match])
+                self.db[league] = leagueDict
+        return True
+
+    def _getJournalPath(self, league):
+        """
+        Internal function to get the path of the live journal of a league, deltas are
+        journaled against the league file in the same directory
+        ARGS:
+            league (str) - league id
+        RETURNS:
+            str - path of the journal file
+        """
+        return os.path.join(os.path.dirname(self._leagueFiles[league]), "{}.live".format(league))
+
+    def _replayJournal(self, league, leagueDict):
+        """
+        Internal function to apply the live deltas journaled since a league file was written
+        ARGS:
+            league (str) - league id
+            leagueDict (dict) - league dictionary read from the league file, updated in place
+        """
+        journalPath = self._getJournalPath(league)
+        if not os.path.exists(journalPath):
+            return
+        from live import applyDelta
+        with open(journalPath) as journalFile:
+            for line in journalFile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last delta cut off by the process stopping while it was written
+                    print("Skipping incomplete live delta in {}".format(journalPath))
+                    continue
+                matchDict = leagueDict.get(entry['year'], {}).get(entry['gameId'])
+                if matchDict is not None:
+                    applyDelta(matchDict, entry['delta'])
+
+    def _getArchive(self, league):
+        """
+        Get the compressed archive a league is read from
+        ARGS:
+            league (str) - league id
+        RETURNS:
+            MatchArchive (obj) - archive of the league, None if the league is not stored in an archive
+        """
+        path = self._leagueFiles.get(league)
+        if path is None or not path.endswith(".dbz"):
+            return None
+        if league not in self._archives:
+            with self._loadLock:
+                if league not in self._archives:
+                    self._archives[league] = MatchArchive(path)
+        return self._archives[league]
+
+    def getVersion(self):
+        """
+        Version of the data, changes whenever the database files change or any writer in the process adds a match
+        RETURNS:
+            (tuple, int) - version of the database files and the process write generation
+        """
+        return self._fileVersion, WRITE_GENERATION
+
+    def getLeagueFileVersion(self, league):
+        """
+        Version of the file a league is read from, with the version of its live journal if it has one
+        ARGS:
+            league (str) - league id
+        RETURNS:
+            [float, int] - league file modification time and size, followed by the journal modification
+                           time and size if deltas have been journaled, None if the league has no file
+        """
+        path = self._leagueFiles.get(league)
+        if path is None:
+            return None
+        version = getFileVersion(path)
+        # journaled deltas change the data without changing the league file
+        journalVersion = getFileVersion(self._getJournalPath(league))
+        return version + journalVersion if version and journalVersion else version
+
+    def restrict(self, partition):
+        """
+        Load only the league seasons in a partition, every other league season is
+        dropped and the indexes are rebuilt so the database holds just the partition.
+        Leagues stored in compressed archives only decode the partition's seasons, a
+        json league file has no season offsets so it is still parsed in full
+        ARGS:
+            partition (dict) - dictionary in the form {leagueId: [season]}, None for every season of a league
+        """
+        with self._loadLock:
+            for league, seasons in partition.items():
+                self._loadLeague(league, seasons)
+            for league in self.db.keys():
+                seasons = partition.get(league)
+                if league not in partition:
+                    del self.db[league]
+                elif seasons is not None:
+                    for year in self.db[league].keys():
+                        if year not in seasons:
+                            del self.db[league][year]
+            self._leagueFiles = dict((league, path) for league, path in self._leagueFiles.items() if league in self.db)
+            self._summaries = dict((key, summary) for key, summary in self._summaries.items()
+                                   if key[0] in self.db and key[1] in self.db[key[0]])
+            self._catalogs = dict((key, catalog) for key, catalog in self._catalogs.items()
+                                  if key[0] in self.db and key[1] in self.db[key[0]])
+            self._matchIndex = {}
+            self._teamIndex = {}
+            self._dateIndex = {}
+            for league in self.db.keys():
+                for year in self.db[league].keys():
+                    for match in self.db[league][year].keys():
+                        self._indexMatch(league, year, match, self.db[league][year][match])
+
+    def getStoredLeagueIds(self):
+        """
+        Return the ids of every league file in the database without loading them
+        RETURNS:
+            [str] - sorted list of league ids
+        """
+        return sorted(set(self._leagueFiles.keys()) | set(self.db.keys()))
+
+    def getLeagueIds(self, leagues=None):
+        """
+        Return the league ids in the database, loading them if needed
+        ARGS:
+            leagues ([str]) - list of league ids to limit to, default all leagues
+        RETURNS:
+            [str] - sorted list of league ids that are in the database
+        """
+        if not leagues:
+            leagues = set(self._leagueFiles.keys()) | set(self.db.keys())
+        return sorted(league for league in leagues if self._loadLeague(league))
+
+    def _indexMatch(self, league, year, matchId, matchDict):
+        """
+        Add a single match to the lookup indexes
+        ARGS:
+            league (str) - league id of the match
+            year (str) - year/season string of the match
+            matchId (str) - id of the match
+            matchDict (dict) - match dictionary
+        """
+        matchId = str(matchId)
+        gameStrip = matchDict['gamePackage']['gameStrip']
+        self._matchIndex[matchId] = (league, year)
+        self._dateIndex[matchId] = parseIsoDate(gameStrip['isoDate'])
+        for side in ('home', 'away'):
+            teamId = TEAMS.add(gameStrip['teams'][side]['name'])
+            self._teamIndex.setdefault(teamId, set()).add(matchId)
+
+    def iterMatches(self, leagues=None, seasons=None, teams=None, startDate=None, endDate=None):
+        """
+        Generator over the stored matches, filters are resolved against the
+        indexes so only matching dictionaries are read
+        ARGS:
+            leagues ([str]) - list of league ids to search, default all leagues
+            seasons ([str]) - list of seasons to search, default all seasons
+            teams ([str]) - list of team names, match if either team plays, default all teams
+            startDate (datetime) - only matches after this date, default no limit
+            endDate (datetime) - only matches before this date, default no limit
+        YIELDS:
+            (str, str, str, dict) - tuple in the form (leagueId, season, matchId, matchDict)
+        """
+        leagues = self.getLeagueIds(leagues)
+        if teams:
+            candidates = set()
+            with self._loadLock:
+                for team in teams:
+                    candidates.update(self._teamIndex.get(TEAMS.getId(team), ()))
+        else:
+            candidates = None
+        for league in leagues:
+            for year in (seasons or sorted(self.db[league].keys())):
+                if year not in self.db[league]:
+                    continue
+                yearDict = self.db[league][year]
+                if candidates is None:
+                    matchIds = sorted(yearDict.keys())
+                else:
+                    matchIds = sorted(id for id in candidates if self._matchIndex[id] == (league, year))
+                for matchId in matchIds:
+                    date = self._dateIndex[str(matchId)]
+                    if startDate is not None and not date > startDate:
+                        continue
+                    if endDate is not None and not date < endDate:
+                        continue
+                    yield league, year, matchId, yearDict[matchId]
 
     def _getMatchesDictList(self, ids, leagues=None, seasons=None):
         """
@@ -57,9 +374,7 @@ class RugbyDB(object):
         """
         matches = []
         ids = [str(id) for id in ids]
-        if not leagues:
-            leagues = self.db.keys()
-        for league in leagues:
+        for league in self.getLeagueIds(leagues):
             if not seasons:
                 yearList = self.db[league].keys()
             else:
@@ -83,8 +398,29 @@ class RugbyDB(object):
         RETURNS:
             matchDict - match dictionary if found else None
         """
-        match = self._getMatchesDictList([id])
-        return match[0] if len(match) == 1 else None
+        id = str(id)
+        if id not in self._matchIndex:
+            # decode only the requested match from an archive rather than loading its league
+            for league in sorted(self._leagueFiles.keys()):
+                archive = self._getArchive(league) if league not in self.db else None
+                if archive is not None and id in archive:
+                    return archive.getMatch(id, self.archiveSubtrees)
+        if id not in self._matchIndex and getManifest().getLeague(id) is not None:
+            self._loadLeague(getManifest().getLeague(id))
+        if id not in self._matchIndex:
+            # load the leagues whose configured match ids include the id, only an id outside
+            # every configured range falls back to searching every league
+            candidates = [league for league in sorted(variables.MATCH_IDS.keys())
+                          if id.isdigit() and any(int(id) in seasonIds for seasonIds in variables.MATCH_IDS[league]['matchIds'].values())]
+            for league in candidates:
+                self._loadLeague(league)
+            if id not in self._matchIndex and not candidates and not set(self._leagueFiles.keys()) <= set(self.db.keys()):
+                self.loadDb()
+        location = self._matchIndex.get(id)
+        if location is None:
+            return None
+        league, year = location
+        return self.db[league][year][id]
 
     def getMatchesForTeam(self, team, leagues=None, seasons=None):
         """
@@ -96,34 +432,140 @@ class RugbyDB(object):
         RETURNS
             {matchDict} - dictionary of match dictionaries, in the form {matchId: matchDict}
         """
+        return dict((matchId, matchDict) for league, year, matchId, matchDict
+                    in self.iterMatches(leagues=leagues, seasons=seasons, teams=[team]))
+
+    def getMatchesForLeague(self, league, seasons=None):
+        """
+        Return the match dictionaries of a league in one read of its stored seasons
+        ARGS:
+            league (str) - league id
+            seasons ([str]) - list of seasons to include, default all seasons
+        RETURNS
+            {matchDict} - dictionary of match dictionaries, in the form {matchId: matchDict}
+        """
+        if not self._loadLeague(league):
+            return {}
         matches = {}
-        if not leagues:
-            leagues = self.db.keys()
-        for league in leagues:
-            if not seasons:
-                yearList = self.db[league].keys()
+        for year in (seasons or self.db[league].keys()):
+            matches.update(self.db[league].get(year, {}))
+        return matches
+
+    def getSeasonSummary(self, league, season):
+        """
+        Get the materialised team and player totals for a league season, loaded
+        from the stored summary file if it was written for the current league file
+        and has the season's matches, otherwise built from the matches
+        ARGS:
+            league (str) - league id
+            season (str) - season string
+        RETURNS:
+            SeasonSummary (obj) - summary for the season, None if the season is not in the database
+        """
+        from summary import SeasonSummary
+        if not self._loadLeague(league) or season not in self.db[league]:
+            return None
+        if (league, season) not in self._summaries:
+            matchDicts = self.db[league][season]
+            summaryDict = self._readStoredFile(league, "summary").get(season)
+            if summaryDict is not None and set(summaryDict.keys()) == set(matchDicts.keys()):
+                summary = SeasonSummary.fromDict(summaryDict)
             else:
-                yearList = seasons
+                summary = SeasonSummary.fromMatchDicts(matchDicts)
+            self._summaries[(league, season)] = summary
+        return self._summaries[(league, season)]
 
-            for year in yearList:
-                if year in self.db[league].keys():
-                    for match in self.db[league][year].keys():
-                        homeTeam = self.db[league][year][match]['gamePackage']['gameStrip']['teams']['home']['name'].lower()
-                        awayTeam = self.db[league][year][match]['gamePackage']['gameStrip']['teams']['away']['name'].lower()
-                        if team.lower() == homeTeam or team.lower() == awayTeam:
-                            matches[match] = self.db[league][year][match]
-        return matches
+    def getSeasonCatalog(self, league, season):
+        """
+        Get the teams, kick off span, match count and rounds of a league season,
+        read from the stored catalog file without loading the league if it has
+        not been loaded otherwise built from the game strips of its matches
+        ARGS:
+            league (str) - league id
+            season (str) - season string
+        RETURNS:
+            SeasonCatalog (obj) - catalog for the season, None if the season is not in the database
+        """
+        from catalog import SeasonCatalog
+        if (league, season) not in self._catalogs:
+            catalogDict = None
+            if league not in self.db and league in self._leagueFiles:
+                if league not in self._catalogFiles:
+                    self._catalogFiles[league] = self._readStoredFile(league, "catalog")
+                # a stored catalog covers every season of the league file
+                if self._catalogFiles[league] and season not in self._catalogFiles[league]:
+                    return None
+                catalogDict = self._catalogFiles[league].get(season)
+            if catalogDict is not None:
+                catalog = SeasonCatalog.fromDict(catalogDict)
+            elif self._loadLeague(league) and season in self.db[league]:
+                catalog = SeasonCatalog.fromMatchDicts(self.db[league][season])
+            else:
+                return None
+            self._catalogs[(league, season)] = catalog
+        return self._catalogs[(league, season)]
 
-    def getMatchesForLeague(self, league):
-        pass
+    def _readStoredFile(self, league, extension):
+        """
+        Internal function to read a file stored beside a league file, the catalog or summaries,
+        it is only used if it was written for the current version of the league file
+        ARGS:
+            league (str) - league id
+            extension (str) - file extension, 'catalog' or 'summary'
+        RETURNS:
+            dict - dictionary in the form {season: dict}, empty if there is no up to date file
+        """
+        storedPath = os.path.join(self.dbPath, "{}.{}".format(league, extension))
+        if not os.path.exists(storedPath):
+            return {}
+        with open(storedPath) as storedFile:
+            storedDict = json.loads(storedFile.read())
+        if not isinstance(storedDict.get('version'), list) or storedDict['version'] != self.getLeagueFileVersion(league):
+            return {}
+        return storedDict['seasons']
 
 
 class RugbyDBReadWrite(RugbyDB):
 
+    # leagues are written back out, so archives are decoded with every subtree to keep the full payload
+    archiveSubtrees = None
+
     def __init__(self):
-        super(RugbyDBReadWrite, self).__init__()
         timestamp = datetime.datetime.now()
         self.dbWritePath = os.path.join(CWD, "rugby_database_{}".format(str(timestamp.date())))
+        self._ingestListeners = []
+        super(RugbyDBReadWrite, self).__init__()
+
+    def _getJournalPath(self, league):
+        """
+        Internal function to get the path of the live journal of a league, writers
+        journal against the league file in the write directory
+        """
+        return os.path.join(self.dbWritePath, "{}.live".format(league))
+
+    def _loadLeague(self, league, seasons=None):
+        """
+        Load a league, a league with a live journal left by a stopped writer is read from
+        the league file in the write directory the journal was written against
+        ARGS:
+            league (str) - league id
+            seasons ([str]) - seasons to load, None for every season
+        RETURNS:
+            bool - True if the league is in the database
+        """
+        with self._loadLock:
+            writtenPath = os.path.join(self.dbWritePath, "{}.db".format(league))
+            if league not in self.db and os.path.exists(self._getJournalPath(league)) and os.path.exists(writtenPath):
+                self._leagueFiles[league] = writtenPath
+        return super(RugbyDBReadWrite, self)._loadLeague(league, seasons)
+
+    def addIngestListener(self, listener):
+        """
+        Register a function to call whenever a match is added or replaced
+        ARGS:
+            listener (function) - function taking (leagueId, year, matchId, matchDict)
+        """
+        self._ingestListeners.append(listener)
 
     def writeDbFile(self, league):
         """
@@ -137,9 +579,74 @@ class RugbyDBReadWrite(RugbyDB):
         try:
             with open(dbPath, "w") as dbFile:
                 dbFile.write(json.dumps(self.db[league], indent=4, sort_keys=True))
+            # the league file now has every journaled delta
+            if os.path.exists(self._getJournalPath(league)):
+                os.remove(self._getJournalPath(league))
         except Exception as e:
             print(e)
             print("Failed to update Database")
+        self.writeSummaryFile(league)
+        self.writeCatalogFile(league)
+
+    def writeArchiveFile(self, league, codec=None):
+        """
+        Write a league out as a compressed archive, see archive.writeArchive
+        ARGS:
+            league (str) - league id to write file
+            codec (str) - 'zstd' or 'zlib', default zstd if zstandard is installed otherwise zlib
+        RETURNS:
+            dict - archive stats in the form {'matches': int, 'rawBytes': int, 'compressedBytes': int, 'ratio': float}
+        """
+        if not os.path.exists(self.dbWritePath):
+            os.makedirs(self.dbWritePath)
+        return writeArchive(os.path.join(self.dbWritePath, "{}.dbz".format(league)), self.db[league], codec)
+
+    def writeSummaryFile(self, league):
+        """
+        Write the materialised season summaries for a league beside its database file
+        ARGS:
+            league (str) - league id to write file
+        """
+        summaries = {}
+        for (summaryLeague, season), summary in self._summaries.items():
+            if summaryLeague == league:
+                summaries[season] = summary.toDict()
+        if not summaries:
+            return
+        try:
+            self._writeStoredFile(league, "summary", summaries)
+        except Exception as e:
+            print(e)
+            print("Failed to update season summary")
+
+    def writeCatalogFile(self, league):
+        """
+        Write the catalog of every season of a league beside its database file
+        ARGS:
+            league (str) - league id to write file
+        """
+        catalogs = dict((season, self.getSeasonCatalog(league, season).toDict()) for season in self.db[league].keys())
+        try:
+            self._writeStoredFile(league, "catalog", catalogs)
+        except Exception as e:
+            print(e)
+            print("Failed to update league catalog")
+
+    def _writeStoredFile(self, league, extension, seasons):
+        """
+        Internal function to write a file beside the league database file in the write
+        directory, stamped with the version of that database file, or of the file the
+        league was read from if it has not been written yet
+        ARGS:
+            league (str) - league id
+            extension (str) - file extension, 'catalog' or 'summary'
+            seasons (dict) - dictionary in the form {season: dict}
+        """
+        if not os.path.exists(self.dbWritePath):
+            os.makedirs(self.dbWritePath)
+        version = getFileVersion(os.path.join(self.dbWritePath, "{}.db".format(league))) or self.getLeagueFileVersion(league)
+        with open(os.path.join(self.dbWritePath, "{}.{}".format(league, extension)), "w") as storedFile:
+            storedFile.write(json.dumps({'version': version, 'seasons': seasons}, sort_keys=True))
 
     def writeMatchDb(self):
         """
@@ -150,6 +657,90 @@ class RugbyDBReadWrite(RugbyDB):
         for league in self.db.keys():
             self.writeDbFile(league)
 
+    def _storeMatch(self, leagueId, year, gameId, matchDict):
+        """
+        Internal function to store a new or changed match dictionary, update the
+        indexes and season summary and call the ingest listeners
+        """
+        gameId = str(gameId)
+        if leagueId not in self.db.keys():
+            self.db[leagueId] = {}
+        if year not in self.db[leagueId].keys():
+            self.db[leagueId][year] = {}
+        self.db[leagueId][year][gameId] = matchDict
+        self._indexMatch(leagueId, year, gameId, matchDict)
+        bumpWriteGeneration()
+        if (leagueId, year) in self._summaries:
+            self._summaries[(leagueId, year)].addMatch(gameId, matchDict)
+        else:
+            self.getSeasonSummary(leagueId, year)
+        if (leagueId, year) in self._catalogs:
+            self._catalogs[(leagueId, year)].addMatch(gameId, matchDict)
+        for listener in self._ingestListeners:
+            listener(leagueId, year, gameId, matchDict)
+
+    def applyMatchDelta(self, leagueId, year, gameId, delta):
+        """
+        Apply a live delta to a stored match, the delta is appended to the league's
+        live journal instead of rewriting the league database file
+        ARGS:
+            leagueId (str) - id of the league of the match
+            year (str) - year/season string of the match
+            gameId (str) - id of the match
+            delta (dict) - delta from live.diffMatchDicts
+        RETURNS:
+            dict - updated match dictionary
+        """
+        from live import applyDelta
+        matchDict = self.db[leagueId][year][str(gameId)]
+        applyDelta(matchDict, delta)
+        self._storeMatch(leagueId, year, gameId, matchDict)
+        self.writeDelta(leagueId, year, gameId, delta)
+        return matchDict
+
+    def writeDelta(self, leagueId, year, gameId, delta):
+        """
+        Append a live delta to the league's journal file beside its database file in the
+        write directory, the journal is replayed when the league is next loaded and cleared
+        when the league file is written
+        ARGS:
+            leagueId (str) - id of the league of the match
+            year (str) - year/season string of the match
+            gameId (str) - id of the match
+            delta (dict) - delta from live.diffMatchDicts
+        """
+        if not os.path.exists(os.path.join(self.dbWritePath, "{}.db".format(leagueId))):
+            # the journal is replayed over the league file beside it, so the first delta writes
+            # that file with the delta already applied
+            self.writeDbFile(leagueId)
+            return
+        journalPath = os.path.join(self.dbWritePath, "{}.live".format(leagueId))
+        try:
+            with open(journalPath, "a") as journalFile:
+                journalFile.write(json.dumps({'year': year, 'gameId': str(gameId), 'delta': delta}) + "\n")
+        except Exception as e:
+            print(e)
+            print("Failed to write live delta")
+
+    def fetchMatchStr(self, leagueId, gameId):
+        """
+        Fetch the match dictionary string of a match from the internet
+        ARGS:
+            leagueId (str) - id of the league of the match
+            gameId (str) - id of the match
+        RETURNS:
+            str - match dictionary string, empty if the page has no match
+        """
+        # requests is only needed for the write path so it is not imported with the module
+        import requests
+        url = "http://www.espn.com/rugby/match?gameId={}&league={}".format(gameId, leagueId)
+        response = requests.get(url)
+        for line in response.text.splitlines():
+            if 'window.__INITIAL_STATE__ =' in line:
+                return re.sub(r'[^\x00-\x7f]',r' ',line)
+        print("Failed to get match dict from {}".format(url))
+        return ''
+
     def addToDb(self, leagueId, year, gameId, matchStr):
         """
         Add a new match to the database
@@ -161,19 +752,13 @@ class RugbyDBReadWrite(RugbyDB):
         RETURNS:
             bool - True if match added to database, False for failure to add to database
         """
-        matchStr = matchStr[:-1].replace('          window.__INITIAL_STATE__ = ', '')
         try:
-            matchDict = json.loads(matchStr)
+            matchDict = parseMatchStr(matchStr)
         except:
             print("Error getting game online - game id: {}, league id: {}".format(gameId, leagueId))
-            print(url)
             print(matchStr)
             return False
-        if leagueId not in self.db.keys():
-            self.db[leagueId] = {}
-        if year not in self.db[leagueId].keys():
-            self.db[leagueId][year] = {}
-        self.db[leagueId][year][gameId] = matchDict
+        self._storeMatch(leagueId, year, gameId, matchDict)
         self.writeDbFile(leagueId)
         homeTeam = matchDict['gamePackage']['gameStrip']['teams']['home'] 
         awayTeam = matchDict['gamePackage']['gameStrip']['teams']['away']
@@ -190,19 +775,38 @@ class RugbyDBReadWrite(RugbyDB):
             year (str) - year/season string to update
             force (bool) - True update the database for every match
                            False only update if the match is not in the database
+        RETURNS:
+            bool - True if every fetched match of the league was added, False if any id had no
+                   match page or failed to be added
+        Ids in the manifest's negative cache are never fetched, ids with no match
+        page are added to it and the manifest is saved to the write directory when
+        the update finishes. Pages that belong to another league are recorded against
+        that league and not stored
         """
-        for id in variables.MATCH_IDS[leagueId]['matchIds'][year]:
-            if force or leagueId not in self.db.keys() or year not in self.db[leagueId].keys() or str(id) not in self.db[leagueId][year].keys():
+        manifest = getManifest()
+        manifest.addDatabase(self)
+        success = True
+        try:
+            # ids with no match page or already found in another league are skipped
+            for id in manifest.getCandidates(leagueId, year, force):
                 gameId = str(id)
-                url = "http://www.espn.com/rugby/match?gameId={}&league={}".format(gameId, leagueId)
-                response = requests.get(url)
-                matchStr = ''
-                for line in response.text.splitlines():
-                    if 'window.__INITIAL_STATE__ =' in line:
-                        matchStr = re.sub(r'[^\x00-\x7f]',r' ',line)
-                        break
-                if matchStr:
-                    success = self.addToDb(leagueId, year, id, matchStr)
+                matchStr = self.fetchMatchStr(leagueId, gameId)
+                if not matchStr:
+                    manifest.addMissing(gameId)
+                    success = False
+                    continue
+                try:
+                    pageLeague = manifest.getPageLeague(leagueId, gameId, parseMatchStr(matchStr), self)
+                except Exception:
+                    # unreadable pages are reported by addToDb
+                    pageLeague = leagueId
+                if pageLeague != leagueId:
+                    print("Skipping {}: match of league {}".format(gameId, pageLeague))
+                    manifest.addOtherLeague(pageLeague, gameId)
+                elif self.addToDb(leagueId, year, id, matchStr):
+                    manifest.addFound(leagueId, year, gameId)
                 else:
-                    print("Failed to get match dict from {}".format(url))
-                    return False
+                    success = False
+        finally:
+            manifest.save(os.path.join(self.dbWritePath, "manifest.json"))
+        return success
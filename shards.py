@@ -0,0 +1,246 @@
+import multiprocessing
+
+from rugbydb import RugbyDB
+from query import getLeagueId
+from variables import MATCH_IDS
+
+def _teamMatches(db, team, seasons=None):
+    """
+    Internal shard query for the match dictionaries of a team
+    """
+    return dict((matchId, matchDict) for league, year, matchId, matchDict in db.iterMatches(seasons=seasons, teams=[team]))
+
+
+def _playerTotals(db, stat, seasons=None):
+    """
+    Internal shard query for every player's total of a stat, in the form {playerId: [name, team, total]}
+    """
+    totals = {}
+    for league in db.getLeagueIds():
+        for year in sorted(db.db[league].keys()):
+            if seasons and year not in seasons:
+                continue
+            for playerId, playerSummary in db.getSeasonSummary(league, year).players.items():
+                if stat.lower() in playerSummary['totals']:
+                    total = totals.setdefault(playerId, [playerSummary['name'], playerSummary['team'], 0])
+                    total[2] += playerSummary['totals'][stat.lower()]
+    return totals
+
+
+def _teamTotal(db, team, stat, seasons=None):
+    """
+    Internal shard query for a team's total of a stat and the number of matches it was recorded in
+    """
+    statTotal = 0
+    matches = 0
+    for league in db.getLeagueIds():
+        for year in sorted(db.db[league].keys()):
+            if seasons and year not in seasons:
+                continue
+            total, count = db.getSeasonSummary(league, year).getTeamTotal(team, stat)
+            if count:
+                statTotal += total
+                matches += count
+    return statTotal, matches
+
+
+def _matchCount(db, seasons=None):
+    """
+    Internal shard query for the number of matches in the shard
+    """
+    return sum(1 for match in db.iterMatches(seasons=seasons))
+
+
+SHARD_QUERIES = {'teamMatches': _teamMatches,
+                 'playerTotals': _playerTotals,
+                 'teamTotal': _teamTotal,
+                 'matchCount': _matchCount}
+
+
+def _serveShard(partition, connection):
+    """
+    Internal function run in each worker process, loads its partition and
+    answers queries sent over the pipe until it receives None. Only the
+    partition's seasons are decoded from compressed archives, a json league
+    file is parsed in full by every worker with a season of it
+    """
+    db = RugbyDB(lazy=True)
+    db.restrict(partition)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        name, args = request
+        try:
+            connection.send((True, SHARD_QUERIES[name](db, *args)))
+        except Exception as e:
+            connection.send((False, repr(e)))
+    connection.close()
+
+
+def partitionByLeague(leagues=None):
+    """
+    Build one partition for each league in the database
+    ARGS:
+        leagues ([str]) - league ids or names, default every league file
+    RETURNS:
+        [dict] - partitions in the form {leagueId: None}
+    """
+    if leagues is None:
+        leagues = RugbyDB(lazy=True).getStoredLeagueIds()
+    return [{getLeagueId(league) or league: None} for league in leagues]
+
+
+def partitionBySeason(leagues=None):
+    """
+    Build one partition for each configured league season, seasons are read
+    from MATCH_IDS so no league file is loaded
+    ARGS:
+        leagues ([str]) - league ids or names, default every league file
+    RETURNS:
+        [dict] - partitions in the form {leagueId: [season]}
+    """
+    if leagues is None:
+        leagues = RugbyDB(lazy=True).getStoredLeagueIds()
+    partitions = []
+    for league in leagues:
+        league = getLeagueId(league) or league
+        seasons = MATCH_IDS[league]['matchIds'].keys() if league in MATCH_IDS else [None]
+        for season in sorted(seasons):
+            partitions.append({league: [season] if season is not None else None})
+    return partitions
+
+
+class ShardedDB(object):
+    """
+    Database split into partitions, each loaded and owned by its own worker
+    process. Queries are scattered to every shard over pipes so they run on
+    every core and the partial results are merged in this process, which
+    never loads the matches itself
+    """
+
+    def __init__(self, partitions=None):
+        """
+        ARGS:
+            partitions ([dict]) - partitions in the form {leagueId: [season]}, None for every season
+                                  of a league, default partitionByLeague()
+        """
+        self.partitions = partitions if partitions is not None else partitionByLeague()
+        self._shards = []
+        for partition in self.partitions:
+            parentConnection, childConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serveShard, args=(partition, childConnection),
+                                              name="RugbyShard-{}".format(",".join(sorted(partition.keys()))))
+            process.daemon = True
+            process.start()
+            childConnection.close()
+            self._shards.append((partition, process, parentConnection))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._shards)
+
+    def close(self):
+        """
+        Stop every worker process
+        """
+        for partition, process, connection in self._shards:
+            try:
+                connection.send(None)
+                connection.close()
+            except (IOError, EOFError):
+                pass
+            process.join()
+        self._shards = []
+
+    def _scatter(self, name, args, leagues=None, seasons=None):
+        """
+        Internal function to send a query to every shard that holds any of the
+        leagues and seasons, then gather the partial results in shard order
+        """
+        leagues = set(getLeagueId(league) or league for league in leagues) if leagues else None
+        shards = []
+        for partition, process, connection in self._shards:
+            if leagues is not None and not leagues & set(partition.keys()):
+                continue
+            if seasons and all(partitionSeasons is not None and not set(seasons) & set(partitionSeasons)
+                               for partitionSeasons in partition.values()):
+                continue
+            connection.send((name, args))
+            shards.append(connection)
+        results = []
+        for connection in shards:
+            success, result = connection.recv()
+            if not success:
+                raise RuntimeError("Shard query {} failed: {}".format(name, result))
+            results.append(result)
+        return results
+
+    def getMatchesForTeam(self, team, leagues=None, seasons=None):
+        """
+        Return the match dictionaries for a team from every shard
+        ARGS:
+            team (str) - team name
+            leagues ([str]) - list of league ids or names to search, default all leagues
+            seasons ([str]) - list of seasons to search, default all seasons
+        RETURNS
+            {matchDict} - dictionary of match dictionaries, in the form {matchId: matchDict}
+        """
+        matches = {}
+        for shardMatches in self._scatter('teamMatches', (team.lower(), seasons), leagues, seasons):
+            matches.update(shardMatches)
+        return matches
+
+    def getLeagueLeadersForStatTotal(self, stat, leagues=None, seasons=None):
+        """
+        Get the leaders for a stat totalled across leagues and seasons, players
+        appearing in several shards are combined by player id
+        ARGS:
+            stat (str) - stat name to get leaders for
+            leagues ([str]) - list of league ids or names to search, default all leagues
+            seasons ([str]) - list of seasons to search, default all seasons
+        RETURNS:
+            [(str, str, float),] - list of tuples sorted by value, in the form (playerName, teamName, statValue)
+        """
+        totals = {}
+        for shardTotals in self._scatter('playerTotals', (stat, seasons), leagues, seasons):
+            for playerId, (name, team, total) in shardTotals.items():
+                if playerId in totals:
+                    totals[playerId][2] += total
+                else:
+                    totals[playerId] = [name, team, total]
+        return sorted(totals.values(), key=lambda tup: tup[2], reverse=True)
+
+    def getAverageStatForTeam(self, stat, team, leagues=None, seasons=None):
+        """
+        Get average of a stat for a team across every shard
+        ARGS:
+            stat (str) - name of stat to search for
+            team (str) - team name
+            leagues ([str]) - list of league ids or names to search, default all leagues
+            seasons ([str]) - list of seasons to search, default all seasons
+        RETURNS:
+            float - average of stats, None if the team or stat is not found
+        """
+        statTotal = 0
+        matches = 0
+        for total, count in self._scatter('teamTotal', (team, stat, seasons), leagues, seasons):
+            statTotal += total
+            matches += count
+        return float(statTotal)/float(matches) if matches else None
+
+    def count(self, leagues=None, seasons=None):
+        """
+        Count the matches held by the shards
+        ARGS:
+            leagues ([str]) - list of league ids or names to count, default all leagues
+            seasons ([str]) - list of seasons to count, default all seasons
+        RETURNS:
+            int - number of matches
+        """
+        return sum(self._scatter('matchCount', (seasons,), leagues, seasons))
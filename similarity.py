@@ -0,0 +1,211 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from match import Match
+
+class PlayerProfiles(object):
+    """
+    Embedding table of aggregated per 80 player profiles, one row per player
+    and one column per stat, standardised within each position so players are
+    compared against others in the same role. Requires numpy
+    """
+
+    @classmethod
+    def fromQuery(cls, matchQuery, stats=None, minMinutes=80):
+        """
+        Build the profiles from every player appearance in a query
+        ARGS:
+            matchQuery (Query) - query of the matches to include, e.g. query() for the full database
+            stats ([str]) - stats to include in the profile, None for every stat recorded
+            minMinutes (float) - only include players with at least this many minutes in total
+        RETURNS:
+            PlayerProfiles (obj) - new PlayerProfiles object
+        """
+        players = {}
+        for league, season, matchId, matchDict in matchQuery.records():
+            match = Match(matchDict)
+            for team in match.players.keys():
+                for player in match.players[team]:
+                    if not player.minutesPlayed:
+                        continue
+                    profile = players.setdefault(player.id, {'name': player.name, 'team': team, 'minutes': 0.0,
+                                                             'positions': {}, 'totals': {}})
+                    profile['minutes'] += player.minutesPlayed
+                    profile['positions'][player.position] = profile['positions'].get(player.position, 0) + 1
+                    for stat, value in player.matchStats.items():
+                        profile['totals'][stat] = profile['totals'].get(stat, 0.0) + value
+        return cls(players, stats, minMinutes)
+
+    def __init__(self, players, stats=None, minMinutes=80):
+        """
+        ARGS:
+            players (dict) - aggregated appearances in the form
+                             {playerId: {'name': str, 'team': str, 'minutes': float,
+                                         'positions': {position: appearances}, 'totals': {stat: float}}}
+            stats ([str]) - stats to include in the profile, None for every stat recorded
+            minMinutes (float) - only include players with at least this many minutes in total
+        """
+        if numpy is None:
+            raise ImportError("PlayerProfiles requires numpy")
+        players = dict((playerId, profile) for playerId, profile in players.items() if profile['minutes'] >= minMinutes)
+        if stats is None:
+            stats = sorted(set(stat for profile in players.values() for stat in profile['totals'].keys()))
+        self.stats = [stat.lower() for stat in stats]
+        self.playerIds = sorted(players.keys())
+        self.names = [players[playerId]['name'] for playerId in self.playerIds]
+        self.teams = [players[playerId]['team'] for playerId in self.playerIds]
+        self.positions = [max(players[playerId]['positions'].items(), key=lambda item: item[1])[0] for playerId in self.playerIds]
+        self._rows = dict((playerId, row) for row, playerId in enumerate(self.playerIds))
+
+        totals = numpy.array([[players[playerId]['totals'].get(stat, 0.0) for stat in self.stats] for playerId in self.playerIds],
+                             dtype=numpy.float64).reshape(len(self.playerIds), len(self.stats))
+        minutes = numpy.array([players[playerId]['minutes'] for playerId in self.playerIds], dtype=numpy.float64)
+        self.perEighty = totals * (80.0 / minutes)[:, numpy.newaxis]
+        self.vectors = numpy.zeros_like(self.perEighty)
+        positions = numpy.array(self.positions)
+        for position in set(self.positions):
+            rows = positions == position
+            mean = self.perEighty[rows].mean(axis=0)
+            std = self.perEighty[rows].std(axis=0)
+            std[std == 0] = 1.0
+            self.vectors[rows] = (self.perEighty[rows] - mean) / std
+        norms = numpy.linalg.norm(self.vectors, axis=1)
+        norms[norms == 0] = 1.0
+        self._unitVectors = self.vectors / norms[:, numpy.newaxis]
+        self._squaredNorms = (self.vectors ** 2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.playerIds)
+
+    def getRow(self, playerId):
+        """
+        Get the row of a player in the table
+        ARGS:
+            playerId (str) - id of the player
+        RETURNS:
+            int - row index, None if the player is not in the table
+        """
+        return self._rows.get(playerId)
+
+    def distances(self, rows, metric='cosine', candidates=None):
+        """
+        Distances from a batch of players to every player, or to a set of candidate rows
+        ARGS:
+            rows ([int]) - rows of the players to compare
+            metric (str) - 'cosine' or 'euclidean'
+            candidates ([int]) - rows to compare against, None for every player
+        RETURNS:
+            numpy.ndarray - matrix of distances with one row per player in the batch
+        """
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        candidates = numpy.arange(len(self.playerIds)) if candidates is None else numpy.asarray(candidates, dtype=numpy.intp)
+        if metric == 'cosine':
+            return 1.0 - self._unitVectors[rows].dot(self._unitVectors[candidates].T)
+        elif metric == 'euclidean':
+            squared = (self._squaredNorms[rows][:, numpy.newaxis] + self._squaredNorms[candidates][numpy.newaxis, :]
+                       - 2.0 * self.vectors[rows].dot(self.vectors[candidates].T))
+            return numpy.sqrt(numpy.maximum(squared, 0.0))
+        raise ValueError("Unknown metric {}, expected 'cosine' or 'euclidean'".format(metric))
+
+    def _results(self, row, candidates, distances, k, samePosition):
+        """
+        Internal function to pick the k nearest candidates for one player
+        """
+        candidates = numpy.asarray(candidates)
+        keep = candidates != row
+        if samePosition:
+            keep &= numpy.array([self.positions[candidate] == self.positions[row] for candidate in candidates], dtype=bool)
+        candidates = candidates[keep]
+        distances = distances[keep]
+        if len(candidates) > k:
+            nearest = numpy.argpartition(distances, k)[:k]
+        else:
+            nearest = numpy.arange(len(candidates))
+        nearest = nearest[numpy.argsort(distances[nearest])]
+        return [(self.playerIds[candidates[index]], self.names[candidates[index]], float(distances[index])) for index in nearest]
+
+    def getSimilarPlayers(self, playerIds, k=5, metric='cosine', samePosition=False):
+        """
+        Exact nearest neighbours for a batch of players by brute force
+        ARGS:
+            playerIds ([str]) - ids of the players to find neighbours for
+            k (int) - number of neighbours for each player
+            metric (str) - 'cosine' or 'euclidean'
+            samePosition (bool) - True = only return players from the same position
+        RETURNS:
+            [[(str, str, float),]] - for each player a list of tuples sorted by distance,
+                                     in the form (playerId, playerName, distance), None if the player is not in the table
+        """
+        found = [(index, self._rows[playerId]) for index, playerId in enumerate(playerIds) if playerId in self._rows]
+        results = [None] * len(playerIds)
+        if not found:
+            return results
+        allRows = numpy.arange(len(self.playerIds))
+        distances = self.distances([row for index, row in found], metric)
+        for batchRow, (index, row) in enumerate(found):
+            results[index] = self._results(row, allRows, distances[batchRow], k, samePosition)
+        return results
+
+
+class ApproximatePlayerIndex(object):
+    """
+    Approximate nearest neighbour index over PlayerProfiles using random
+    hyperplane hashing, candidates sharing a bucket in any table are re-ranked exactly
+    """
+
+    def __init__(self, profiles, bits=8, tables=4, seed=0):
+        """
+        ARGS:
+            profiles (PlayerProfiles) - profiles to index
+            bits (int) - hyperplanes per table, more bits give smaller buckets
+            tables (int) - number of hash tables, more tables give better recall
+            seed (int) - random seed for the hyperplanes
+        """
+        self.profiles = profiles
+        random = numpy.random.RandomState(seed)
+        self._planes = [random.randn(len(profiles.stats), bits) for table in range(tables)]
+        self._powers = 2 ** numpy.arange(bits)
+        self._buckets = []
+        for planes in self._planes:
+            codes = self._hash(planes, profiles.vectors)
+            buckets = {}
+            for row, code in enumerate(codes):
+                buckets.setdefault(code, []).append(row)
+            self._buckets.append(buckets)
+
+    def _hash(self, planes, vectors):
+        """
+        Internal function to get the bucket code of each vector
+        """
+        return (vectors.dot(planes) > 0).dot(self._powers)
+
+    def getSimilarPlayers(self, playerIds, k=5, metric='cosine', samePosition=False):
+        """
+        Approximate nearest neighbours for a batch of players
+        ARGS:
+            playerIds ([str]) - ids of the players to find neighbours for
+            k (int) - number of neighbours for each player
+            metric (str) - 'cosine' or 'euclidean'
+            samePosition (bool) - True = only return players from the same position
+        RETURNS:
+            [[(str, str, float),]] - for each player a list of tuples sorted by distance,
+                                     in the form (playerId, playerName, distance), None if the player is not in the table
+        """
+        profiles = self.profiles
+        results = [None] * len(playerIds)
+        rows = [(index, profiles.getRow(playerId)) for index, playerId in enumerate(playerIds)]
+        rows = [(index, row) for index, row in rows if row is not None]
+        if not rows:
+            return results
+        vectors = profiles.vectors[[row for index, row in rows]]
+        codes = [self._hash(planes, vectors) for planes in self._planes]
+        for batchRow, (index, row) in enumerate(rows):
+            candidates = set()
+            for table, buckets in enumerate(self._buckets):
+                candidates.update(buckets.get(codes[table][batchRow], ()))
+            candidates = sorted(candidates)
+            distances = profiles.distances([row], metric, candidates)[0]
+            results[index] = profiles._results(row, candidates, distances, k, samePosition)
+        return results
@@ -0,0 +1,153 @@
+"""
+Declared schema for the team stats stored in a match dictionary.
+Every section of the espn gamePackage that holds team stats is listed in
+SECTIONS with the kind of values it stores. The first time an item text is
+seen in a section a parser is compiled for it and kept in the parser table,
+so each match is parsed with one table lookup per item and every value is
+stored as a float
+"""
+
+def _number(value):
+    """
+    Internal function to convert a stored value to a float, values such as
+    "55%" or "12m" have their unit stripped
+    """
+    if isinstance(value, (int, long, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return float(value.strip()[:-1])
+
+
+def _valueParser(key):
+    """
+    Internal function to compile a parser for a single numeric value
+    """
+    def parse(item):
+        return [(key, _number(item['homeValue']), _number(item['awayValue']))]
+    return parse
+
+
+def _wonTotalParser(wonKey, totalKey):
+    """
+    Internal function to compile a parser for values in the form "5 / 7"
+    """
+    def parse(item):
+        homeStat = item['homeValue'].split(' ')
+        awayStat = item['awayValue'].split(' ')
+        return [(wonKey, _number(homeStat[0]), _number(awayStat[0])),
+                (totalKey, _number(homeStat[2]), _number(awayStat[2]))]
+    return parse
+
+
+def _splitParser(firstKey, secondKey):
+    """
+    Internal function to compile a parser for paired values in the form "55% / 60%"
+    """
+    def parse(item):
+        homeStat = item['homeValue'].split(' / ')
+        awayStat = item['awayValue'].split(' / ')
+        return [(firstKey, _number(homeStat[0]), _number(awayStat[0])),
+                (secondKey, _number(homeStat[1]), _number(awayStat[1]))]
+    return parse
+
+
+def _setPieceParser(wonKey, totalKey):
+    """
+    Internal function to compile a parser for set piece dictionaries with won and total counts
+    """
+    def parse(item):
+        return [(wonKey, _number(item['homeWon']), _number(item['awayWon'])),
+                (totalKey, _number(item['homeTotal']), _number(item['awayTotal']))]
+    return parse
+
+
+def _totalParser(key):
+    """
+    Internal function to compile a parser for dictionaries with home and away totals
+    """
+    def parse(item):
+        return [(key, _number(item['homeTotal']), _number(item['awayTotal']))]
+    return parse
+
+
+def _compileValue(item):
+    return _valueParser(item['text'].lower())
+
+
+def _compileAttacking(item):
+    if "/" not in item['homeValue']:
+        return _valueParser(item['text'].lower())
+    words = item['text'].split(' ')
+    statName = words[0].lower()
+    if "Won" in item['text']:
+        return _wonTotalParser("{} won".format(statName), "{} total".format(statName))
+    statSubText = words[1].split('/')
+    return _splitParser("{} {}".format(statName, statSubText[0].lower()),
+                        "{} {}".format(statName, statSubText[1].lower()))
+
+
+def _compileSetPiece(item):
+    statName = item['text'].split(' ')[0].lower()
+    return _setPieceParser("{} won".format(statName), "{} total".format(statName))
+
+
+def _compilePenalties(item):
+    return _totalParser('penalties conceded')
+
+
+# (section name, function returning the section's items, parser compiler), in the
+# order they are applied, a later section overwrites an earlier stat with the same name.
+# Tackles are adjusted to completed tackles between the two groups of sections
+SECTIONS = [('dataVis', lambda gamePackage: gamePackage['matchStats']['dataVis'], _compileValue),
+            ('table', lambda gamePackage: gamePackage['matchStats']['table'], _compileValue),
+            ('discipline', lambda gamePackage: gamePackage['matchDiscipline']['col'][1][0]['data'], _compileValue),
+            ('scores', lambda gamePackage: gamePackage['matchEvents']['col'][0][0]['data'], _compileValue),
+            ('attacking', lambda gamePackage: gamePackage['matchEvents']['col'][1][1]['data'], _compileValue),
+            ('penalties', lambda gamePackage: [gamePackage['matchDiscipline']['col'][0][0]['data']], _compilePenalties)]
+SET_PIECE_SECTIONS = [('matchAttacking', lambda gamePackage: gamePackage['matchAttacking']['col'][1][0]['data'], _compileAttacking),
+                      ('matchDefending', lambda gamePackage: [stat['data'] for stat in gamePackage['matchDefending']['col'][0]], _compileSetPiece)]
+
+# compiled parsers in the form {(section, text, hasSlash): parser}
+PARSERS = {}
+
+
+def _getParser(section, compiler, item):
+    """
+    Internal function to look up the parser for an item, compiling it the first time it is seen
+    """
+    homeValue = item.get('homeValue')
+    parserKey = (section, item.get('text'), isinstance(homeValue, basestring) and "/" in homeValue)
+    parser = PARSERS.get(parserKey)
+    if parser is None:
+        parser = PARSERS[parserKey] = compiler(item)
+    return parser
+
+
+def parseMatchStats(gamePackage):
+    """
+    Parse every team stat in a match into typed values
+    ARGS:
+        gamePackage (dict) - gamePackage dictionary from a stored match
+    RETURNS:
+        dict - dictionary in the form {stat: {'homeValue': float, 'awayValue': float}}
+    """
+    teams = gamePackage['gameStrip']['teams']
+    matchStats = {'points': {'homeValue': _number(teams['home']['score']), 'awayValue': _number(teams['away']['score'])}}
+    _applySections(matchStats, gamePackage, SECTIONS)
+    # adjust tackles to remove missed tackles from the total
+    for value in ('homeValue', 'awayValue'):
+        matchStats['tackles'][value] = matchStats['tackles'][value] - matchStats['missed tackles'][value]
+    _applySections(matchStats, gamePackage, SET_PIECE_SECTIONS)
+    return matchStats
+
+
+def _applySections(matchStats, gamePackage, sections):
+    """
+    Internal function to parse the items of each section into the match stats
+    """
+    for section, getItems, compiler in sections:
+        for item in getItems(gamePackage):
+            for key, homeValue, awayValue in _getParser(section, compiler, item)(item):
+                matchStats[key] = {'homeValue': homeValue, 'awayValue': awayValue}
@@ -0,0 +1,184 @@
+from match import Match
+
+class SeasonSummary(object):
+    """
+    Materialised team and player totals for a single league season.
+    Each match's contribution is kept so a match can be replaced or
+    removed incrementally without recomputing the season
+    """
+
+    @classmethod
+    def fromMatchDicts(cls, matchDicts):
+        """
+        Build a summary from the stored match dictionaries for a season
+        ARGS:
+            matchDicts (dict) - dictionary in the form {matchId: matchDict}
+        RETURNS:
+            SeasonSummary (obj) - new SeasonSummary object
+        """
+        summary = cls()
+        for matchId in sorted(matchDicts.keys()):
+            summary.addMatch(matchId, matchDicts[matchId])
+        return summary
+
+    @classmethod
+    def fromDict(cls, summaryDict):
+        """
+        Load a summary stored with toDict
+        ARGS:
+            summaryDict (dict) - dictionary of match contributions in the form {matchId: contribution}
+        RETURNS:
+            SeasonSummary (obj) - new SeasonSummary object
+        """
+        summary = cls()
+        for matchId, contribution in summaryDict.items():
+            summary._addContribution(matchId, contribution)
+        return summary
+
+    def __init__(self):
+        self.teams = {}
+        self.players = {}
+        self._contributions = {}
+
+    def __len__(self):
+        """
+        Number of matches in the summary
+        """
+        return len(self._contributions)
+
+    def getMatchIds(self):
+        """
+        Return all match ids in the summary
+        RETURNS:
+            [str] - list of match ids
+        """
+        return sorted(self._contributions.keys())
+
+    def toDict(self):
+        """
+        Return the summary in a form that can be stored beside the database
+        RETURNS:
+            dict - dictionary of match contributions in the form {matchId: contribution}
+        """
+        return self._contributions
+
+    def addMatch(self, matchId, matchDict):
+        """
+        Add a match to the summary, replacing it if it is already included
+        ARGS:
+            matchId (str) - id of the match
+            matchDict (dict) - match dictionary from the database
+        """
+        match = Match(matchDict)
+        contribution = {'teams': {}, 'players': {}}
+        for team in match.players.keys():
+            teamStats = {}
+            for stat in match.matchStats.keys():
+                value = _toFloat(match.getStatForTeam(team, stat))
+                if value is not None:
+                    teamStats[stat] = value
+            contribution['teams'][team] = teamStats
+            for player in match.players[team]:
+                # an id listed more than once in a match adds to its contribution rather than replacing it
+                playerStats = contribution['players'].setdefault(player.id, {'name': player.name, 'team': team, 'stats': {}})['stats']
+                for stat, value in player.matchStats.items():
+                    value = _toFloat(value)
+                    if value is not None:
+                        playerStats[stat] = playerStats.get(stat, 0) + value
+        self.removeMatch(matchId)
+        self._addContribution(matchId, contribution)
+
+    def removeMatch(self, matchId):
+        """
+        Remove a match from the summary, does nothing if it is not included
+        ARGS:
+            matchId (str) - id of the match
+        """
+        contribution = self._contributions.pop(str(matchId), None)
+        if contribution is None:
+            return
+        for team, teamStats in contribution['teams'].items():
+            teamSummary = self.teams[team]
+            teamSummary['matches'] -= 1
+            for stat, value in teamStats.items():
+                teamSummary['totals'][stat] -= value
+                teamSummary['counts'][stat] -= 1
+            if teamSummary['matches'] == 0:
+                del self.teams[team]
+        for playerId, playerContribution in contribution['players'].items():
+            playerSummary = self.players[playerId]
+            playerSummary['appearances'] -= 1
+            for stat, value in playerContribution['stats'].items():
+                playerSummary['totals'][stat] -= value
+            if playerSummary['appearances'] == 0:
+                del self.players[playerId]
+
+    def _addContribution(self, matchId, contribution):
+        """
+        Internal function to add the totals for a single match
+        """
+        self._contributions[str(matchId)] = contribution
+        for team, teamStats in contribution['teams'].items():
+            teamSummary = self.teams.setdefault(team, {'matches': 0, 'totals': {}, 'counts': {}})
+            teamSummary['matches'] += 1
+            for stat, value in teamStats.items():
+                teamSummary['totals'][stat] = teamSummary['totals'].get(stat, 0) + value
+                teamSummary['counts'][stat] = teamSummary['counts'].get(stat, 0) + 1
+        for playerId, playerContribution in contribution['players'].items():
+            playerSummary = self.players.setdefault(playerId, {'name': playerContribution['name'],
+                                                               'team': playerContribution['team'],
+                                                               'appearances': 0,
+                                                               'totals': {}})
+            playerSummary['appearances'] += 1
+            for stat, value in playerContribution['stats'].items():
+                playerSummary['totals'][stat] = playerSummary['totals'].get(stat, 0) + value
+
+    def getTeamTotal(self, team, stat):
+        """
+        Get the season total of a stat for a team
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+        RETURNS:
+            (float, int) - total of the stat and number of matches it was recorded in, (None, 0) if not found
+        """
+        teamSummary = self.teams.get(team.lower())
+        if teamSummary is None or stat.lower() not in teamSummary['totals']:
+            return None, 0
+        return teamSummary['totals'][stat.lower()], teamSummary['counts'][stat.lower()]
+
+    def getTeamAverage(self, team, stat):
+        """
+        Get the season average of a stat for a team
+        ARGS:
+            team (str) - team name
+            stat (str) - stat name
+        RETURNS:
+            float - average of the stat, None if not found
+        """
+        total, count = self.getTeamTotal(team, stat)
+        return total / count if count else None
+
+    def getPlayerLeaders(self, stat):
+        """
+        Get the season totals of a stat for every player
+        ARGS:
+            stat (str) - stat name
+        RETURNS:
+            [(str, str, float),] - list of tuples sorted by value, in the form (playerName, teamName, statValue)
+        """
+        leaders = []
+        for playerSummary in self.players.values():
+            if stat.lower() in playerSummary['totals']:
+                leaders.append([playerSummary['name'], playerSummary['team'], playerSummary['totals'][stat.lower()]])
+        return sorted(leaders, key=lambda tup: tup[2], reverse=True)
+
+
+def _toFloat(value):
+    """
+    Internal function to convert a stored stat value to a float, None if it is not numeric
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,106 @@
+import threading
+
+
+def _lowerName(name):
+    """
+    Internal function to normalise a team or stat name
+    """
+    return name.lower()
+
+
+class SymbolTable(object):
+    """
+    Two way mapping between names and small integer ids. Each name is
+    normalised and stored once, so every match and player refers to the same
+    string object and indexes keyed on ids compare and join integers. Every
+    spelling seen is remembered so a name is only normalised the first time
+    """
+
+    def __init__(self, normalise=None):
+        """
+        ARGS:
+            normalise (function) - function taking a name returning the name it is stored as, default unchanged
+        """
+        self.normalise = normalise
+        self._ids = {}
+        self._names = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return self.getId(name) is not None
+
+    def getId(self, name):
+        """
+        Get the id of a name without adding it
+        ARGS:
+            name (str) - name in any spelling
+        RETURNS:
+            int - id of the name, None if the name has not been added
+        """
+        symbolId = self._ids.get(name)
+        if symbolId is None and self.normalise is not None and name is not None:
+            symbolId = self._ids.get(self.normalise(name))
+        return symbolId
+
+    def add(self, name):
+        """
+        Get the id of a name, adding it if it is new
+        ARGS:
+            name (str) - name in any spelling
+        RETURNS:
+            int - id of the name
+        """
+        symbolId = self._ids.get(name)
+        if symbolId is not None:
+            return symbolId
+        with self._lock:
+            normalised = self.normalise(name) if self.normalise is not None else name
+            symbolId = self._ids.get(normalised)
+            if symbolId is None:
+                symbolId = len(self._names)
+                self._names.append(normalised)
+                self._ids[normalised] = symbolId
+            self._ids[name] = symbolId
+        return symbolId
+
+    def getName(self, symbolId):
+        """
+        ARGS:
+            symbolId (int) - id of a name
+        RETURNS:
+            str - name stored for the id
+        """
+        return self._names[symbolId]
+
+    def intern(self, name):
+        """
+        Get the stored string for a name, adding it if it is new
+        ARGS:
+            name (str) - name in any spelling
+        RETURNS:
+            str - normalised name shared by every use of the name
+        """
+        return self._names[self.add(name)]
+
+    def canonical(self, name):
+        """
+        Get the stored string for a name without adding it, used for names
+        passed in by callers so lookups of unknown names do not grow the table
+        ARGS:
+            name (str) - name in any spelling
+        RETURNS:
+            str - normalised name, shared if the name has been added
+        """
+        symbolId = self.getId(name)
+        if symbolId is not None:
+            return self._names[symbolId]
+        return self.normalise(name) if self.normalise is not None else name
+
+
+TEAMS = SymbolTable(_lowerName)
+STATS = SymbolTable(_lowerName)
+PLAYERS = SymbolTable()
+POSITIONS = SymbolTable()
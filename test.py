@@ -1,10 +1,17 @@
+import os
+import sys
 import time
 import datetime
+import subprocess
 
 from league import League
 from match import MatchList, Match
-from rugbydb import RugbyDB
+from rugbydb import RugbyDB, CachedDB, parseIsoDate
+from summary import SeasonSummary
 from matchevent import MatchEvent, MatchEventList
+from query import query
+from variables import MATCH_IDS
+import rugby_stats
 
 class Timer():
 
@@ -103,6 +110,716 @@ def testDB():
     with Timer('Team Search') as t:
         matches = db.getMatchesForTeam('Munster')
 
+def testQuery():
+    munsterQuery = query().team('Munster')
+    checkResult('Query - team matches agree with MatchList', cmp,
+                [sorted(munsterQuery.matchIds()), MatchList.createMatchListForTeam('munster').getMatchIds()], 0)
+    sixNations = query().league('Six Nations').season('2018')
+    storedMatches = CachedDB().getMatchesForLeague('180659', ['2018'])
+    checkResult('Query - count agrees with stored matches', cmp, [sixNations.count(), len(storedMatches)], 0)
+    kickoffs = sorted(parseIsoDate(matchDict['gamePackage']['gameStrip']['isoDate']) for matchDict in storedMatches.values())
+    startDate = kickoffs[len(kickoffs) // 2] - datetime.timedelta(days=1)
+    endDate = startDate + datetime.timedelta(days=3)
+    inRange = [matchId for matchId, matchDict in storedMatches.items()
+               if startDate < parseIsoDate(matchDict['gamePackage']['gameStrip']['isoDate']) < endDate]
+    checkResult('Query - test date range', sorted, [sixNations.dateRange(startDate, endDate).matchIds()], sorted(inRange))
+    checkResult('Query - test fields', next, [query().league('Six Nations').season('2013').fields('homeTeam', 'awayTeam')], ('ireland', 'wales'))
+
+def testBatchStats():
+    teams = ['connacht', 'leinster', 'munster', 'ulster']
+    stats = ['points', 'tackles', 'carries', 'clean breaks']
+    with Timer('Team Stats - per call loop'):
+        loopResult = [tuple([team] + [rugby_stats.getAverageStatForTeam(stat, team) for stat in stats]) for team in teams]
+    with Timer('Team Stats - batch'):
+        columns, rows = rugby_stats.getTeamStatTable(teams, stats, ['mean'])
+    checkResult('Team Stats - batch columns', cmp, [columns, ['team', 'points mean', 'tackles mean', 'carries mean', 'clean breaks mean']], 0)
+    checkResult('Team Stats - batch agrees with loop', cmp, [rows, loopResult], 0)
+
+def testSummary():
+    db = CachedDB()
+    with Timer('Season Summary Build'):
+        summary = db.getSeasonSummary('271937', '1819')
+    leaders = summary.getPlayerLeaders('tackles')
+    with Timer('Season Summary Leaders'):
+        summaryLeaders = rugby_stats.getLeagueLeadersForStatTotal('Champions Cup', '1819', 'tackles')
+    totals = {}
+    for match in MatchList.createMatchListForLeague('271937', ['1819']):
+        for team in match.players.keys():
+            for player in match.players[team]:
+                if player.getStat('tackles') is not None:
+                    totals[player.id] = totals.get(player.id, 0) + player.getStat('tackles')
+    checkResult('Summary - leaders match a walk over the matches', lambda: [round(value, 6) for name, team, value in summaryLeaders], [],
+                sorted((round(value, 6) for value in totals.values()), reverse=True))
+    matchId = summary.getMatchIds()[0]
+    incremental = SeasonSummary.fromDict(dict(summary.toDict()))
+    incremental.removeMatch(matchId)
+    checkResult('Summary - remove match', len, [incremental], len(summary) - 1)
+    incremental.addMatch(matchId, db.getMatchById(matchId))
+    checkResult('Summary - re-add match', cmp, [sorted(incremental.getPlayerLeaders('tackles')), sorted(leaders)], 0)
+    import json
+    import shutil
+    import tempfile
+    from rugbydb import RugbyDBReadWrite
+    writeDb = RugbyDBReadWrite()
+    writeDb.dbWritePath = tempfile.mkdtemp()
+    try:
+        writeDb.getSeasonSummary('271937', '1819')
+        writeDb.writeDbFile('271937')
+        leaguePath = os.path.join(writeDb.dbWritePath, '271937.db')
+        readDb = RugbyDB(lazy=True)
+        readDb.dbPath = writeDb.dbWritePath
+        readDb._leagueFiles = {'271937': leaguePath}
+        checkResult('Summary - stored summary read', lambda: readDb.getSeasonSummary('271937', '1819').toDict() == summary.toDict(), [], True)
+        # a re-fetch changes a match under the same ids, the summary file is left from the earlier league file
+        with open(leaguePath) as leagueFile:
+            leagueDict = json.loads(leagueFile.read())
+        leagueDict['1819'][matchId]['gamePackage']['gameStrip']['teams']['home']['name'] = 'Refetched XV'
+        with open(leaguePath, 'w') as leagueFile:
+            leagueFile.write(json.dumps(leagueDict))
+        readDb = RugbyDB(lazy=True)
+        readDb.dbPath = writeDb.dbWritePath
+        readDb._leagueFiles = {'271937': leaguePath}
+        checkResult('Summary - summary of another league file version rebuilt', readDb.getSeasonSummary('271937', '1819').getTeamTotal, ['Refetched XV', 'points'],
+                    SeasonSummary.fromMatchDicts(leagueDict['1819']).getTeamTotal('Refetched XV', 'points'))
+    finally:
+        shutil.rmtree(writeDb.dbWritePath)
+
+def runStartup(command):
+    return subprocess.check_output([sys.executable, '-c', command], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+
+def testStartup():
+    checkResult('Startup - requests not imported', runStartup, ["import sys, match; print('requests' in sys.modules)"], 'False')
+    checkResult('Startup - numpy not imported', runStartup, ["import sys, match; print('numpy' in sys.modules)"], 'False')
+    importTime = runStartup("import time; start = time.time(); import rugby_stats; print(time.time() - start)")
+    print "Timer: Startup - import rugby_stats - {}s".format(importTime)
+    # the timer stops at the first result, the warm up thread is only joined after it
+    firstQuery = ("import time; start = time.time(); from match import Match; from rugbydb import {}; "
+                  "{}; match = Match.fromMatchId('291689'); elapsed = time.time() - start{}; print(elapsed if match else None)")
+    print "Timer: Startup - first match, eager load - {}s".format(runStartup(firstQuery.format('RugbyDB', 'RugbyDB()', '')))
+    print "Timer: Startup - first match, lazy load - {}s".format(runStartup(firstQuery.format('CachedDB', 'CachedDB()', '')))
+    print "Timer: Startup - first match, background warm up - {}s".format(runStartup(firstQuery.format('warmUp', 'thread = warmUp()', '; thread.join()')))
+    lazyDb = RugbyDB(lazy=True)
+    checkResult('Startup - configured id not stored', lazyDb.getMatchById, [291701], None)
+    checkResult('Startup - miss only loads the configured league', lambda: sorted(lazyDb.db.keys()), [], ['180659'])
+
+def testAsync():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from rugby_async import RugbyService, SingleFlight
+    service = RugbyService()
+    with Timer('Async - concurrent league leaders'):
+        futures = [service.getLeagueLeadersForStatTotal('Champions Cup', '1819', 'tackles') for i in range(20)]
+        results = [future.result() for future in futures]
+    checkResult('Async - results match', cmp, [results[0], rugby_stats.getLeagueLeadersForStatTotal('Champions Cup', '1819', 'tackles')], 0)
+    release = threading.Event()
+    singleFlight = SingleFlight(ThreadPoolExecutor(max_workers=4))
+    futures = [singleFlight.submit(('leaders',), release.wait) for i in range(20)]
+    release.set()
+    checkResult('Async - identical requests coalesced', len, [set(id(future) for future in futures)], 1)
+    checkResult('Async - match from id', str, [service.matchFromId('133782').result()], str(Match.fromMatchId('133782')))
+    service.shutdown()
+    import json
+    import rugby_async
+    from concurrent.futures import ProcessPoolExecutor
+    from symbols import TEAMS
+    pool = ProcessPoolExecutor(max_workers=1)
+    pool.submit(len, []).result()
+    # the forked worker's team table now diverges, the parent adds the new teams in the opposite order
+    matchDict = json.loads(json.dumps(CachedDB().getMatchById(291689)))
+    matchDict['gamePackage']['gameStrip']['teams']['home']['name'] = 'Async Home XV'
+    matchDict['gamePackage']['gameStrip']['teams']['away']['name'] = 'Async Away XV'
+    TEAMS.add('Async Away XV')
+    TEAMS.add('Async Home XV')
+    m = pool.submit(rugby_async._parseMatch, matchDict).result()
+    pool.shutdown()
+    checkResult('Async - team ids resolved in the parent process', lambda: (m.getHomeAwayValue('async home xv'), m.getOpposition('async home xv')), [], ('homeValue', 'async away xv'))
+    checkResult('Async - team stats across processes', m.getStatForTeam, ['async away xv', 'points'], Match(matchDict).getStatForTeam('async away xv', 'points'))
+
+def testStatSchema():
+    m = Match.fromMatchId('133782')
+    valueTypes = set(type(value) for stat in m.matchStats.values() for value in stat.values())
+    checkResult('Stat Schema - all values typed', set, [valueTypes], set([float]))
+    checkResult('Stat Schema - set piece stat', type, [m.getStatForTeam('Ireland', 'lineouts won')], float)
+    matchDicts = [record[3] for record in query().records()]
+    with Timer('Stat Schema - parse {} matches'.format(len(matchDicts))):
+        for matchDict in matchDicts:
+            Match(matchDict)
+
+def testHeadToHead():
+    from headtohead import HeadToHeadIndex
+    with Timer('Head to Head - season index'):
+        index = HeadToHeadIndex.forSeason('Pro14', '1819')
+    columns, rows = rugby_stats.getTeamStatTable(['munster'], ['tackles'], ['mean', 'against'], leagues=['Pro14'], seasons=['1819'])
+    checkResult('Head to Head - stat for', index.getStatFor, ['Munster', 'tackles'], rows[0][1])
+    checkResult('Head to Head - stat against', index.getStatAgainst, ['Munster', 'tackles'], rows[0][2])
+    checkResult('Head to Head - cached per season', HeadToHeadIndex.forSeason, ['270557', '1819'], index)
+    topFour = index.getTopTeams(4)
+    checkResult('Head to Head - top teams', len, [topFour], 4)
+    with Timer('Head to Head - adjusted against top four'):
+        adjusted = index.getAdjustedStat('Munster', 'tackles', topFour)
+    matches = MatchList.createMatchListForLeague('270557', ['1819'])
+    conceded = {}
+    for match in matches:
+        for team in [match.homeTeam['name'], match.awayTeam['name']]:
+            conceded.setdefault(team, []).append(match.getStatForTeam(match.getOpposition(team), 'tackles'))
+    differences = [match.getStatForTeam('munster', 'tackles') - float(sum(conceded[match.getOpposition('munster')])) / len(conceded[match.getOpposition('munster')])
+                   for match in matches if match.getOpposition('munster') in topFour]
+    checkResult('Head to Head - adjusted against top four', lambda: round(adjusted[0], 6), [], round(sum(differences) / len(differences), 6))
+    import headtohead
+    numpy = headtohead.numpy
+    headtohead.numpy = None
+    try:
+        listIndex = HeadToHeadIndex(query().league('Pro14').season('1819').records())
+        listAdjusted = listIndex.getAdjustedStat('Munster', 'tackles', topFour)
+    finally:
+        headtohead.numpy = numpy
+    checkResult('Head to Head - list columns without numpy', lambda: [round(value, 6) for value in listAdjusted], [], [round(value, 6) for value in adjusted])
+
+def testForm():
+    from form import FormTable
+    with Timer('Form - build for all leagues'):
+        formTable = FormTable.fromQuery(query())
+    columns, rows = rugby_stats.getTeamStatTable(['munster'], ['points'], ['mean'])
+    checkResult('Form - full window matches average', formTable.getTeamForm, ['Munster', 'points'], rows[0][1])
+    lastThree = [match.getStatForTeam('munster', 'points') for match in sorted(query().team('munster'), key=lambda match: match.date)[-3:]]
+    checkResult('Form - last three matches', formTable.getTeamForm, ['Munster', 'points', 3], sum(lastThree) / 3.0)
+    m = Match.fromMatchId('133782')
+    player = m.players[m.homeTeam['name']].getPlayer(0)
+    checkResult('Form - player last match', formTable.getPlayerForm, [player.id, 'tackles', 1, None, m.date], player.getStat('tackles'))
+    from form import FormSeries
+    series = FormSeries()
+    series.addMatch(datetime.datetime(2018, 2, 1), '1', {'points': 10.0})
+    series.addMatch(datetime.datetime(2018, 2, 8), '2', {'points': 20.0, 'tries': 2.0})
+    series.addMatch(datetime.datetime(2018, 2, 15), '3', {'points': 30.0, 'tries': 4.0})
+    checkResult('Form - stat first seen in a later match', lambda: (series.getWindow('tries'), series.getWindow('tries', 1), series.getWindow('points', 2)), [],
+                ((6.0, 2), (4.0, 1), (50.0, 2)))
+    checkResult('Form - columns aligned with dates', lambda: set(len(totals) for totals in series._totals.values()), [], set([len(series)]))
+
+def testRatings():
+    from ratings import MatchHistory, RatingsEngine, EloRatings, GlickoRatings
+    with Timer('Ratings - build history'):
+        history = MatchHistory.fromQuery()
+    with Timer('Ratings - elo full pass'):
+        engine = RatingsEngine(history)
+    ratings = engine.getRatings()
+    checkResult('Ratings - every team rated', len, [ratings], len(history.teams))
+    checkResult('Ratings - zero sum elo', round, [sum(rating for team, rating in ratings) / len(ratings), 6], 1500.0)
+    with Timer('Ratings - glicko what if'):
+        glicko = engine.whatIf(GlickoRatings())
+    checkResult('Ratings - what if leaves engine unchanged', cmp, [engine.getRatings(), ratings], 0)
+    incremental = RatingsEngine(MatchHistory())
+    for index in range(len(history)):
+        date = datetime.date.fromordinal(history.days[index]).strftime('%Y-%m-%dT00:00Z')
+        incremental.addMatch(history.matchIds[index], date, history.teams[history.homeTeams[index]],
+                             history.teams[history.awayTeams[index]], history.homeScores[index], history.awayScores[index])
+    checkResult('Ratings - incremental matches full pass', cmp, [incremental.getRatings(), engine.whatIf(EloRatings())], 0)
+
+def testDistributions():
+    from distribution import StatDistributions
+    with Timer('Distributions - build'):
+        distributions = StatDistributions.fromQuery(query().league('Champions Cup'))
+    values = distributions.getValues('carries', 'Champions Cup', '1819', 'FL', 40)
+    checkResult('Distributions - median', distributions.getQuantile, [0.5, 'carries', 'Champions Cup', '1819', 'FL', 40], (values[(len(values) - 1) // 2] + values[len(values) // 2]) / 2.0)
+    checkResult('Distributions - top percentile', distributions.getPercentile, [values[-1], 'carries', 'Champions Cup', '1819', 'FL', 40], 100.0)
+    checkResult('Distributions - histogram covers all', sum, [distributions.getHistogram([0, 5, 10, 1000], 'carries', 'Champions Cup', '1819', 'FL', 40)], len(values))
+    m = Match.fromMatchId('133782')
+    player = m.players[m.homeTeam['name']].getPlayer(0)
+    player.minutesPlayed = 0
+    checkResult('Player - per 80 with no minutes', player.getStatPerEighty, ['Tries'], None)
+
+def testSimilarity():
+    from similarity import PlayerProfiles, ApproximatePlayerIndex
+    with Timer('Similarity - build player profiles for full database'):
+        profiles = PlayerProfiles.fromQuery(query())
+    with Timer('Similarity - exact k-NN for {} players'.format(len(profiles))):
+        exact = profiles.getSimilarPlayers(profiles.playerIds, k=5)
+    with Timer('Similarity - build approximate index'):
+        index = ApproximatePlayerIndex(profiles)
+    with Timer('Similarity - approximate k-NN for {} players'.format(len(profiles))):
+        approximate = index.getSimilarPlayers(profiles.playerIds, k=5)
+    recall = [len(set(player[0] for player in exact[row]) & set(player[0] for player in approximate[row])) for row in range(len(exact))]
+    print "Similarity - approximate recall: {}".format(sum(recall) / (5.0 * len(recall)))
+    checkResult('Similarity - neighbours per player', len, [exact[0]], 5)
+    checkResult('Similarity - player not own neighbour', lambda: profiles.playerIds[0] in [player[0] for player in exact[0]], [], False)
+    checkResult('Similarity - unknown player', profiles.getSimilarPlayers, [['fakePlayer']], [None])
+
+def testMatchCluster():
+    from matchcluster import MatchMatrix
+    with Timer('Match Cluster - build matrix for full database'):
+        matrix = MatchMatrix.fromQuery(query())
+    with Timer('Match Cluster - nearest matches for {} matches'.format(len(matrix))):
+        similar = matrix.getSimilarMatches(matrix.matchIds, k=5)
+    checkResult('Match Cluster - neighbours per match', len, [similar[0]], 5)
+    checkResult('Match Cluster - match not own neighbour', lambda: matrix.matchIds[0] in [match[0] for match in similar[0]], [], False)
+    with Timer('Match Cluster - k-means'):
+        labels, centroids = matrix.kMeans(6)
+    checkResult('Match Cluster - every match labelled', len, [labels], len(matrix))
+    checkResult('Match Cluster - every stored match included or skipped', lambda: len(matrix) + len(matrix.skipped), [], query().count())
+    def noIterations():
+        try:
+            matrix.kMeans(6, iterations=0)
+        except ValueError:
+            return True
+        return False
+    checkResult('Match Cluster - k-means needs an iteration', noIterations, [], True)
+
+def testExport():
+    import copy
+    import csv
+    import shutil
+    import tempfile
+    import export
+    from export import exportDatabase
+    outputDir = tempfile.mkdtemp()
+    try:
+        with Timer('Export - full database to csv'):
+            tables = exportDatabase(outputDir, fileFormat='csv', chunkSize=1000)
+        checkResult('Export - one row per match', lambda: tables['matches'][1], [], query().count())
+        checkResult('Export - csv rows match count', lambda: len(list(csv.reader(open(tables['playerStats'][0])))) - 1, [], tables['playerStats'][1])
+        tables = exportDatabase(outputDir, query().league('Six Nations'), fileFormat='csv')
+        checkResult('Export - filtered by league', lambda: tables['matches'][1], [], query().league('Six Nations').count())
+        checkResult('Export - no matches skipped', lambda: tables['skipped'], [], [])
+        brokenQuery = query().league('Six Nations')
+        records = list(brokenQuery.records())
+        brokenDict = copy.deepcopy(records[0][3])
+        brokenDict['gamePackage']['matchLineUp'] = {}
+        records[0] = records[0][:3] + (brokenDict,)
+        brokenQuery.records = lambda: iter(records)
+        tables = exportDatabase(outputDir, brokenQuery, fileFormat='csv')
+        checkResult('Export - match without players reported', lambda: (tables['skipped'], tables['matches'][1]), [], ([str(records[0][2])], len(records) - 1))
+        if export.pyarrow is None:
+            print "Export - parquet and arrow skipped, pyarrow is not installed"
+        else:
+            for fileFormat, readTable in (('parquet', export.pyarrow.parquet.read_table),
+                                          ('arrow', lambda path: export.pyarrow.ipc.open_file(export.pyarrow.memory_map(path)).read_all())):
+                tables = exportDatabase(outputDir, query().league('Six Nations'), fileFormat=fileFormat, chunkSize=100)
+                table = readTable(tables['playerStats'][0])
+                checkResult('Export - {} rows match count'.format(fileFormat), lambda: table.num_rows, [], tables['playerStats'][1])
+                checkResult('Export - {} columns'.format(fileFormat), lambda: table.schema.names, [], [column for column, columnType in export.TABLES['playerStats']])
+    finally:
+        shutil.rmtree(outputDir)
+
+def testFrames():
+    l = League('180659', 'Six Nations', initMatches=True)
+    with Timer('Frames - league to frame'):
+        leagueFrame = l.toFrame()
+    checkResult('Frames - one row per match', len, [leagueFrame], len(l.getMatchIds()))
+    matchList = MatchList(l.getMatchIds('2018'))
+    with Timer('Frames - season MatchList to frame'):
+        matchFrame = matchList.toFrame()
+    checkResult('Frames - match ids', lambda: list(matchFrame['matchId']), [], [str(id) for id in matchList.getMatchIds()])
+    match = Match.fromMatchId(matchList.getMatchIds()[0])
+    team = match.homeTeam['name']
+    playerFrame = match.players[team].toFrame()
+    checkResult('Frames - player stat column', lambda: list(playerFrame['carries']), [], [player.getStat('carries') for player in match.players[team].players])
+    checkResult('Frames - events', len, [match.matchEventList.toFrame()], len(match.matchEventList))
+
+def testResultCache():
+    import tempfile
+    from resultcache import ResultCache
+    rugby_stats.RESULT_CACHE.clear()
+    with Timer('Result Cache - league leaders, first call'):
+        leaders = rugby_stats.getLeagueLeadersForStatTotal('Six Nations', '2018', 'tackles')
+    with Timer('Result Cache - league leaders, cached call'):
+        cachedLeaders = rugby_stats.getLeagueLeadersForStatTotal('Six Nations', '2018', 'tackles')
+    checkResult('Result Cache - cached result', cmp, [leaders, cachedLeaders], 0)
+    checkResult('Result Cache - hit counted', lambda: rugby_stats.RESULT_CACHE.getMetrics()['hits'], [], 1)
+    cachedLeaders.pop()
+    checkResult('Result Cache - callers get a copy', len, [rugby_stats.getLeagueLeadersForStatTotal('Six Nations', '2018', 'tackles')], len(leaders))
+    import json
+    import shutil
+    from rugbydb import RugbyDBReadWrite
+    writeDb = RugbyDBReadWrite()
+    writeDb.dbWritePath = tempfile.mkdtemp()
+    try:
+        matchStr = "          window.__INITIAL_STATE__ = {};".format(json.dumps(writeDb.db['180659']['2018']['291689']))
+        writeDb.addToDb('180659', '2018', '291689', matchStr)
+    finally:
+        shutil.rmtree(writeDb.dbWritePath)
+    rugby_stats.getLeagueLeadersForStatTotal('Six Nations', '2018', 'tackles')
+    checkResult('Result Cache - addToDb on any writer misses', lambda: rugby_stats.RESULT_CACHE.getMetrics()['misses'], [], 2)
+
+    cache = ResultCache(maxSize=2, ttl=60)
+    for key in range(3):
+        cache.set(key, key)
+    checkResult('Result Cache - size bounded', cache.get, [0], (False, None))
+    cache.ttl = -1
+    cache.set('expired', 1)
+    checkResult('Result Cache - ttl expiry', cache.get, ['expired'], (False, None))
+    cache.ttl = None
+    cache.set('saved', 1)
+    path = os.path.join(tempfile.mkdtemp(), 'results.cache')
+    cache.save(path)
+    checkResult('Result Cache - persisted', ResultCache(path=path).get, ['saved'], (True, 1))
+    os.remove(path)
+
+def testDiscovery():
+    import tempfile
+    from discovery import MatchManifest, getLeagueMatchIds
+    path = os.path.join(tempfile.mkdtemp(), 'manifest.json')
+    manifest = MatchManifest(path)
+    checkResult('Discovery - unresolved season keeps configured ids', lambda: list(manifest.getSeasonMatchIds('270559', '1718')), [], list(MATCH_IDS['270559']['matchIds']['1718']))
+    with Timer('Discovery - record stored matches'):
+        manifest.addDatabase(CachedDB())
+    manifest.addFound('270559', '1718', 291366)
+    manifest.addMissing(291367)
+    candidates = manifest.getCandidates('270559', '1718')
+    checkResult('Discovery - found ids skipped', lambda: 291366 in candidates, [], False)
+    checkResult('Discovery - missing ids skipped', lambda: 291367 in candidates, [], False)
+    checkResult('Discovery - other league ids skipped', lambda: 291705 in candidates, [], not CachedDB().getMatchById(291705))
+    manifest.save()
+    with Timer('Discovery - compact match ids'):
+        compacted = MatchManifest(path).compact()
+    checkResult('Discovery - compacted ids', lambda: 291367 in compacted['270559']['matchIds']['1718'], [], False)
+    checkResult('Discovery - league match ids', lambda: list(getLeagueMatchIds('270559', manifest)['1718']), [], list(compacted['270559']['matchIds']['1718']))
+    os.remove(path)
+    # 290914 to 290916 are configured for both Six Nations and Super Rugby 2017 and are not stored
+    import discovery
+    import json
+    import shutil
+    from rugbydb import RugbyDBReadWrite
+    writeDb = RugbyDBReadWrite()
+    writeDb.dbWritePath = tempfile.mkdtemp()
+    # a Six Nations page, every other id has no match page
+    page = "          window.__INITIAL_STATE__ = {};".format(json.dumps(writeDb.getMatchById(291689)))
+    writeDb.fetchMatchStr = lambda leagueId, gameId: page if gameId == '290916' else ''
+    discovery.MANIFEST = MatchManifest(path)
+    try:
+        checkResult('Discovery - update reports missing pages', writeDb.updateDbFromWeb, ['242041', '2017'], False)
+        checkResult('Discovery - teams of another league checked before storing', lambda: '290916' in writeDb.getMatchesForLeague('242041', ['2017']), [], False)
+        checkResult('Discovery - teams of another league recorded', discovery.MANIFEST.getLeague, ['290916'], '180659')
+        checkResult('Discovery - other league page not fetched again', lambda: 290916 in discovery.MANIFEST.getCandidates('242041', '2017'), [], False)
+        checkResult('Discovery - manifest saved to the write directory', lambda: (os.path.exists(os.path.join(writeDb.dbWritePath, 'manifest.json')), os.path.exists(path)), [], (True, False))
+    finally:
+        discovery.MANIFEST = None
+        shutil.rmtree(writeDb.dbWritePath)
+
+def testShards():
+    from shards import ShardedDB, partitionBySeason
+    with Timer('Shards - start one worker per league'):
+        shardedDb = ShardedDB()
+    try:
+        checkResult('Shards - match count', shardedDb.count, [], query().count())
+        with Timer('Shards - team matches across leagues'):
+            matches = shardedDb.getMatchesForTeam('Munster')
+        checkResult('Shards - team matches', sorted, [matches.keys()], sorted(CachedDB().getMatchesForTeam('munster').keys()))
+        checkResult('Shards - leaders', lambda: sorted(shardedDb.getLeagueLeadersForStatTotal('tackles', ['Six Nations'], ['2018'])), [],
+                    sorted(rugby_stats.getLeagueLeadersForStatTotal('Six Nations', '2018', 'tackles')))
+        checkResult('Shards - team average', shardedDb.getAverageStatForTeam, ['carries', 'munster'], rugby_stats.getAverageStatForTeam('carries', 'munster'))
+    finally:
+        shardedDb.close()
+    with ShardedDB(partitionBySeason(['Six Nations'])) as seasonDb:
+        checkResult('Shards - season partitions', seasonDb.count, [None, ['2018']], query().league('Six Nations').season('2018').count())
+
+def testDaemon():
+    import tempfile
+    from daemon import RugbyDaemon, DaemonClient
+    path = os.path.join(tempfile.mkdtemp(), 'rugbydb.sock')
+    daemon = RugbyDaemon(path)
+    daemon.start()
+    try:
+        with Timer('Daemon - connect and first match'):
+            client = DaemonClient(path)
+            match = client.matchFromId(291689)
+        checkResult('Daemon - match from id', str, [match], str(Match.fromMatchId(291689)))
+        with Timer('Daemon - team match list'):
+            matchList = client.matchListForTeam('Munster')
+        checkResult('Daemon - team match list', matchList.getMatchIds, [], MatchList.createMatchListForTeam('Munster').getMatchIds())
+        checkResult('Daemon - league', lambda: client.league('Six Nations', ['2018']).getMatchIds('2018'), [], list(query().league('Six Nations').season('2018').matchIds()))
+        checkResult('Daemon - stat function', client.stat, ['getAverageStatForTeam', 'carries', 'munster'], rugby_stats.getAverageStatForTeam('carries', 'munster'))
+        client.close()
+    finally:
+        daemon.shutdown()
+
+def testLive():
+    import copy
+    import json
+    import shutil
+    import tempfile
+    from rugbydb import RugbyDBReadWrite
+    from live import LiveUpdater
+    db = RugbyDBReadWrite()
+    db.dbWritePath = tempfile.mkdtemp()
+    try:
+        leagueId, year, matchId = '180659', '2018', '291689'
+        final = copy.deepcopy(db.db[leagueId][year][matchId])
+        stored = db.db[leagueId][year][matchId]
+        stored['gamePackage']['matchCommentary']['events'] = stored['gamePackage']['matchCommentary']['events'][:5]
+        stored['gamePackage']['gameStrip']['teams']['home']['score'] = '0'
+        homePlayer = stored['gamePackage']['matchLineUp']['home']['team'][0]
+        for key in homePlayer.keys():
+            if type(homePlayer[key]) is dict and key != 'eventTimes':
+                homePlayer[key]['value'] = '0'
+        middle = copy.deepcopy(final)
+        middle['gamePackage']['matchCommentary']['events'] = [event for event in final['gamePackage']['matchCommentary']['events']
+                                                              if event.get('type') != 12][:10]
+        match = Match(stored)
+        states = [middle, middle, final]
+        updater = LiveUpdater(db, interval=0, fetch=lambda leagueId, gameId: "          window.__INITIAL_STATE__ = {};".format(json.dumps(states[0])))
+        updater.watch(leagueId, year, [matchId])
+        updater.track(matchId, match)
+        journalPath = os.path.join(db.dbWritePath, '{}.live'.format(leagueId))
+        with Timer('Live - poll and apply delta'):
+            deltas = updater.poll()
+        checkResult('Live - only new events in delta', len, [deltas[matchId]['events']], 5)
+        checkResult('Live - first delta writes league file', lambda: os.path.exists(os.path.join(db.dbWritePath, '{}.db'.format(leagueId))) and not os.path.exists(journalPath), [], True)
+        states[0] = copy.deepcopy(middle)
+        states[0]['gamePackage']['matchCommentary']['events'] = [event for event in final['gamePackage']['matchCommentary']['events']
+                                                                 if event.get('type') != 12]
+        players = list(match.players[match.homeTeam['name']].players) + list(match.players[match.awayTeam['name']].players)
+        updater.poll()
+        checkResult('Live - delta journaled', os.path.exists, [journalPath], True)
+        checkResult('Live - sub events do not rebuild players', lambda: all(player is before for player, before in
+                    zip(list(match.players[match.homeTeam['name']].players) + list(match.players[match.awayTeam['name']].players), players)), [], True)
+        replayed = RugbyDBReadWrite()
+        replayed.dbWritePath = db.dbWritePath
+        replayed.db.pop(leagueId)
+        replayed.getLeagueIds([leagueId])
+        checkResult('Live - writer replays journal', cmp, [replayed.db[leagueId][year][matchId], db.db[leagueId][year][matchId]], 0)
+        reader = RugbyDB(lazy=True)
+        reader._leagueFiles = {leagueId: os.path.join(db.dbWritePath, '{}.db'.format(leagueId))}
+        checkResult('Live - reader replays journal beside league file', cmp, [reader.getMatchById(matchId), db.db[leagueId][year][matchId]], 0)
+        states[0] = final
+        updater.poll()
+        finalMatch = Match(final)
+        checkResult('Live - events appended', len, [match.matchEventList], len(finalMatch.matchEventList))
+        checkResult('Live - team stats updated', cmp, [match.matchStats, finalMatch.matchStats], 0)
+        checkResult('Live - player stats updated', cmp, [match.players[match.homeTeam['name']].players[0].matchStats,
+                                                        finalMatch.players[finalMatch.homeTeam['name']].players[0].matchStats], 0)
+        checkResult('Live - summary updated', db.getSeasonSummary(leagueId, year).getTeamTotal,
+                    [match.homeTeam['name'], 'points'], SeasonSummary.fromMatchDicts(db.db[leagueId][year]).getTeamTotal(match.homeTeam['name'], 'points'))
+        checkResult('Live - finished match not polled', updater.getWatched, [], [])
+        checkResult('Live - journal cleared when league file written', os.path.exists, [journalPath], False)
+    finally:
+        shutil.rmtree(db.dbWritePath)
+
+def testArchive():
+    import shutil
+    import tempfile
+    import json
+    from archive import MatchArchive, MATCH_SUBTREES, writeArchive
+    from rugbydb import RugbyDBReadWrite
+    leagueId = '180659'
+    leagueDict = RugbyDB().db[leagueId]
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, '{}.dbz'.format(leagueId))
+        with Timer('Archive - write league'):
+            stats = writeArchive(path, leagueDict)
+        print "Archive - compression ratio {:.2f} ({} bytes to {} bytes)".format(stats['ratio'], stats['rawBytes'], stats['compressedBytes'])
+        archive = MatchArchive(path)
+        matchIds = archive.getMatchIds()
+        checkResult('Archive - every match stored', len, [matchIds], sum(len(matches) for matches in leagueDict.values()))
+        checkResult('Archive - compressed', lambda: stats['ratio'] > 1, [], True)
+        start = time.time()
+        for matchId in matchIds:
+            archive.getMatch(matchId)
+        print "Timer: Archive - full match decode - {}s per match".format((time.time() - start) / len(matchIds))
+        start = time.time()
+        for matchId in matchIds:
+            archive.getMatch(matchId, MATCH_SUBTREES)
+        print "Timer: Archive - match subtree decode - {}s per match".format((time.time() - start) / len(matchIds))
+        season = archive.getSeason(matchIds[0])
+        checkResult('Archive - full decode matches original', cmp, [archive.getMatch(matchIds[0]), leagueDict[season][matchIds[0]]], 0)
+        db = RugbyDB(lazy=True)
+        db._leagueFiles = {leagueId: path}
+        matchDict = db.getMatchById(matchIds[0])
+        checkResult('Archive - RugbyDB decodes one match', lambda: leagueId not in db.db and sorted(matchDict['gamePackage'].keys()), [],
+                    sorted(key for key in MATCH_SUBTREES if key in leagueDict[season][matchIds[0]]['gamePackage']))
+        checkResult('Archive - Match from subtrees', cmp, [Match(matchDict).matchStats, Match(leagueDict[season][matchIds[0]]).matchStats], 0)
+        checkResult('Archive - RugbyDB loads league', lambda: len(db.getMatchesForTeam(Match(matchDict).homeTeam['name'], [leagueId])) > 0, [], True)
+        restricted = RugbyDB(lazy=True)
+        restricted._leagueFiles = {leagueId: path}
+        decoded = []
+        restrictedArchive = restricted._getArchive(leagueId)
+        archiveGetMatch = restrictedArchive.getMatch
+        restrictedArchive.getMatch = lambda matchId, subtrees=None: decoded.append(matchId) or archiveGetMatch(matchId, subtrees)
+        restricted.restrict({leagueId: [season]})
+        checkResult('Archive - restrict decodes only the partition seasons', sorted, [decoded], archive.getMatchIds(season))
+        checkResult('Archive - restrict loads the partition seasons', lambda: restricted.db[leagueId].keys(), [], [season])
+        restrictedArchive.close()
+        archive.close()
+        payloadDict = json.loads(json.dumps(leagueDict))
+        for matches in payloadDict.values():
+            for payloadMatch in matches.values():
+                payloadMatch['gamePackage']['matchOdds'] = {'home': 1.5, 'away': 2.5}
+        writeArchive(path, payloadDict)
+        writeDb = RugbyDBReadWrite()
+        writeDb.dbWritePath = os.path.join(directory, 'write')
+        writeDb._leagueFiles = {leagueId: path}
+        writeDb.db.pop(leagueId)
+        writeDb.getLeagueIds([leagueId])
+        writeDb.writeArchiveFile(leagueId)
+        rewritten = MatchArchive(os.path.join(writeDb.dbWritePath, '{}.dbz'.format(leagueId)))
+        checkResult('Archive - writer keeps the full payload', cmp, [rewritten.getMatch(matchIds[0]), payloadDict[season][matchIds[0]]], 0)
+        rewritten.close()
+    finally:
+        shutil.rmtree(directory)
+
+def testSymbols():
+    from symbols import SymbolTable, TEAMS, STATS
+    table = SymbolTable(lambda name: name.lower())
+    checkResult('Symbols - spellings share an id', lambda: table.add('Leinster') == table.add('LEINSTER') == table.getId('leinster'), [], True)
+    checkResult('Symbols - unknown name', table.getId, ['Munster'], None)
+    checkResult('Symbols - canonical does not add', lambda: (table.canonical('Munster'), len(table)), [], ('munster', 1))
+    match = Match(CachedDB().getMatchById(291689))
+    checkResult('Symbols - match team ids', TEAMS.getName, [match.homeTeamId], match.homeTeam['name'])
+    player = match.players[match.homeTeam['name']].players[0]
+    checkResult('Symbols - stat names interned', lambda: all(stat is STATS.intern(stat) for stat in player.matchStats.keys()), [], True)
+    with Timer('Symbols - matches for team from index'):
+        matches = CachedDB().getMatchesForTeam(match.homeTeam['name'].upper())
+    checkResult('Symbols - matches for team', lambda: '291689' in matches and all(Match(matchDict).isTeamPlaying(match.homeTeam['name']) for matchDict in matches.values()), [], True)
+
+def testCatalog():
+    import shutil
+    import tempfile
+    from rugbydb import RugbyDBReadWrite
+    leagueId, season = '180659', '2018'
+    writeDb = RugbyDBReadWrite()
+    writeDb.dbWritePath = tempfile.mkdtemp()
+    try:
+        writeDb.writeCatalogFile(leagueId)
+        db = RugbyDB(lazy=True)
+        db.dbPath = writeDb.dbWritePath
+        with Timer('Catalog - read season catalog'):
+            catalog = db.getSeasonCatalog(leagueId, season)
+        checkResult('Catalog - league not loaded', lambda: leagueId in db.db, [], False)
+        matchList = MatchList(sorted(writeDb.db[leagueId][season].keys()))
+        checkResult('Catalog - teams', catalog.getTeams, [], matchList.getAllTeams())
+        dates = sorted(match.date for match in matchList)
+        checkResult('Catalog - date span', catalog.getDateSpan, [], (dates[0], dates[-1]))
+        checkResult('Catalog - match count', len, [catalog], len(matchList))
+        checkResult('Catalog - rounds cover every match', lambda: sorted(sum(catalog.getRounds(), [])), [], catalog.getMatchIds())
+    finally:
+        shutil.rmtree(writeDb.dbWritePath)
+    writeDb.dbWritePath = tempfile.mkdtemp()
+    try:
+        writeDb.writeDbFile(leagueId)
+        leaguePath = os.path.join(writeDb.dbWritePath, '{}.db'.format(leagueId))
+        storedFiles = sorted(os.listdir(writeDb.dbWritePath))
+        db = RugbyDB(lazy=True)
+        db.dbPath = writeDb.dbWritePath
+        db._leagueFiles = {leagueId: leaguePath}
+        checkResult('Catalog - catalog written with the league read without loading', lambda: db.getSeasonCatalog(leagueId, season).getTeams() and leagueId in db.db, [], False)
+        # the same size with an older modification time, e.g. a database file copied in from a backup
+        os.utime(leaguePath, (time.time() - 3600, time.time() - 3600))
+        db = RugbyDB(lazy=True)
+        db.dbPath = writeDb.dbWritePath
+        db._leagueFiles = {leagueId: leaguePath}
+        db.getSeasonCatalog(leagueId, season)
+        checkResult('Catalog - catalog of another league file version ignored', lambda: leagueId in db.db, [], True)
+        checkResult('Catalog - reader writes nothing beside the league', sorted, [os.listdir(writeDb.dbWritePath)], storedFiles)
+    finally:
+        shutil.rmtree(writeDb.dbWritePath)
+    shippedFiles = sorted(os.listdir(CachedDB().dbPath))
+    league = League(leagueId, MATCH_IDS[leagueId]['name'], initMatches=False)
+    team = matchList.getAllTeams()[0]
+    with Timer('Catalog - League contains team'):
+        checkResult('Catalog - League contains team', league.containsTeam, [team.upper(), season], True)
+    checkResult('Catalog - League match count', league.getMatchCount, [season], len(matchList))
+    checkResult('Catalog - shipped database left unchanged', sorted, [os.listdir(CachedDB().dbPath)], shippedFiles)
+
+def testLeagueLoad():
+    leagueId = '180659'
+    storedIds = sorted(query().league(leagueId).matchIds())
+    checkResult('League load - db matches for league', sorted, [CachedDB().getMatchesForLeague(leagueId).keys()], storedIds)
+    checkResult('League load - db matches for season', len, [CachedDB().getMatchesForLeague(leagueId, ['2018'])], query().league(leagueId).season('2018').count())
+    with Timer('League load - match list for league'):
+        matchList = MatchList.createMatchListForLeague(leagueId)
+    checkResult('League load - match list ids', matchList.getMatchIds, [], storedIds)
+    checkResult('League load - lite match list', lambda: MatchList.createMatchListForLeague(leagueId, ['2018'], lite=True).getAllTeams(), [],
+                MatchList.createMatchListForLeague(leagueId, ['2018']).getAllTeams())
+    for seasons in (['2017', '2018'], None):
+        lite = MatchList.createMatchListForLeague(leagueId, seasons, lite=True)
+        full = MatchList.createMatchListForLeague(leagueId, seasons)
+        dates = sorted(match.date for match in full)
+        checkResult('League load - lite match list teams for seasons {}'.format(seasons), lite.getAllTeams, [], full.getAllTeams())
+        checkResult('League load - lite match list date span for seasons {}'.format(seasons), lite.getDateSpan, [], (dates[0], dates[-1]))
+    with Timer('League load - full league'):
+        league = League(leagueId, 'Six Nations', initMatches=True)
+    checkResult('League load - full league matches', lambda: sorted(str(matchId) for matchId in league.getMatchIds()), [], storedIds)
+
+def testIteration():
+    import threading
+    matchList = MatchList.createMatchListForLeague('180659', ['2018'])
+    players = matchList[0].players[matchList[0].homeTeam['name']]
+    checkResult('Iteration - nested player loops', lambda: sum(1 for a in players for b in players), [], len(players) ** 2)
+    checkResult('Iteration - nested match loops', lambda: sum(1 for a in matchList for b in matchList), [], len(matchList) ** 2)
+    checkResult('Iteration - match slice', lambda: [match.date for match in matchList[1:3]], [], [match.date for match in matchList.getMatches(matchList.getMatchIds()[1:3])])
+    checkResult('Iteration - event slice', lambda: matchList[0].matchEventList[:2], [], matchList[0].matchEventList.matchEvents[:2])
+    checkResult('Iteration - bulk stat values', players.getStatValues, ['Tackles'], [player.getStat('tackles') for player in players])
+    counts = []
+    def countEvents():
+        counts.append(sum(len(match.matchEventList) for match in matchList for repeat in range(20)))
+    threads = [threading.Thread(target=countEvents) for thread in range(4)]
+    with Timer('Iteration - concurrent match list readers'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    checkResult('Iteration - concurrent readers agree', lambda: len(set(counts)), [], 1)
+
+def testAggregates():
+    import shutil
+    import tempfile
+    import json
+    import aggregates
+    from rugbydb import RugbyDBReadWrite
+    from aggregates import PartialAggregate, getPartitions, getSeasonAggregates, aggregate
+    partitions = getPartitions(['180659'])
+    directory = tempfile.mkdtemp()
+    try:
+        with Timer('Aggregates - season partials on a process pool'):
+            partials = getSeasonAggregates(partitions, directory, processes=2)
+        aggregates.SEASON_AGGREGATES.clear()
+        with Timer('Aggregates - season partials from files'):
+            loaded = getSeasonAggregates(partitions, directory)
+        checkResult('Aggregates - persisted partials', lambda: [partial.toDict() for partial in loaded] == [partial.toDict() for partial in partials], [], True)
+        # a stale file with the same match ids but another data version is rebuilt
+        aggregates.SEASON_AGGREGATES.clear()
+        stale = PartialAggregate.load(aggregates._aggregatePath(directory, *partitions[0]))
+        stale.teams = {}
+        stale.version = [0, 0]
+        stale.save(aggregates._aggregatePath(directory, *partitions[0]))
+        checkResult('Aggregates - stale persisted partial rebuilt', lambda: getSeasonAggregates(partitions[:1], directory)[0].toDict(), [], partials[0].toDict())
+        cached = getSeasonAggregates(partitions[:1])[0]
+        checkResult('Aggregates - persisted version is the league file version', lambda: cached.version, [], CachedDB().getLeagueFileVersion(partitions[0][0]))
+        writeDb = RugbyDBReadWrite()
+        writeDb.dbWritePath = os.path.join(directory, 'write')
+        aggregates.attach(writeDb)
+        leagueId, season = partitions[0]
+        matchId = sorted(writeDb.db[leagueId][season].keys())[0]
+        writeDb.addToDb(leagueId, season, matchId, "          window.__INITIAL_STATE__ = {};".format(json.dumps(writeDb.db[leagueId][season][matchId])))
+        checkResult('Aggregates - cached partial dropped by a write', lambda: getSeasonAggregates(partitions[:1])[0] is cached, [], False)
+        checkResult('Aggregates - other seasons kept after a write', lambda: getSeasonAggregates(partitions[1:2])[0] is aggregates.SEASON_AGGREGATES[partitions[1]], [], True)
+    finally:
+        shutil.rmtree(directory)
+    merged = aggregate(['180659'])
+    whole = PartialAggregate.fromMatchDicts(CachedDB().getMatchesForLeague('180659'))
+    checkResult('Aggregates - merged matches', len, [merged], len(whole))
+    team = sorted(whole.teams.keys())[0]
+    for aggregation in ('count', 'sum', 'mean', 'min', 'max', 'per80'):
+        checkResult('Aggregates - merged team {}'.format(aggregation), lambda a: round(merged.getTeamAggregate(team, 'points').getValue(a), 6), [aggregation],
+                    round(whole.getTeamAggregate(team, 'points').getValue(aggregation), 6))
+    checkResult('Aggregates - merged std', lambda: abs(merged.getTeamAggregate(team, 'points').getValue('std') - whole.getTeamAggregate(team, 'points').getValue('std')) < 1e-6, [], True)
+    def mergeOverlapping():
+        try:
+            merged.merge(partials[0])
+        except ValueError:
+            return True
+        return False
+    checkResult('Aggregates - overlapping merge rejected', mergeOverlapping, [], True)
+    with Timer('Aggregates - leaders across seasons'):
+        leaders = rugby_stats.getLeadersForStat('tackles', ['180659'])
+    totals = {}
+    for match in MatchList.createMatchListForLeague('180659'):
+        for team in match.players.keys():
+            for player in match.players[team]:
+                if player.getStat('tackles') is not None:
+                    totals[player.id] = totals.get(player.id, 0) + player.getStat('tackles')
+    checkResult('Aggregates - leaders match a walk over the matches', lambda: [round(value, 6) for name, team, value in leaders], [],
+                sorted((round(value, 6) for value in totals.values()), reverse=True))
+
 if __name__ == "__main__":
     testDB()    
     testLeague()
@@ -111,4 +828,29 @@ if __name__ == "__main__":
     testPlayer()
     testMatchEvent()
     testMatchEventList()
+    testQuery()
+    testBatchStats()
+    testSummary()
+    testStartup()
+    testAsync()
+    testStatSchema()
+    testHeadToHead()
+    testForm()
+    testRatings()
+    testDistributions()
+    testSimilarity()
+    testMatchCluster()
+    testExport()
+    testFrames()
+    testResultCache()
+    testDiscovery()
+    testShards()
+    testDaemon()
+    testLive()
+    testArchive()
+    testSymbols()
+    testCatalog()
+    testLeagueLoad()
+    testIteration()
+    testAggregates()
 
@@ -1,33 +1,92 @@
+class MatchIdRange(object):
+    """
+    Reusable collection of match ids made of ranges and single ids that
+    is never expanded into a list, membership is checked arithmetically
+    """
+
+    @classmethod
+    def fromIds(cls, matchIds):
+        """
+        Create a MatchIdRange from a list of ids, consecutive ids are stored as one range
+        ARGS:
+            matchIds ([int]) - match ids
+        RETURNS:
+            MatchIdRange (obj) - new MatchIdRange object
+        """
+        parts = []
+        for matchId in sorted(set(int(matchId) for matchId in matchIds)):
+            if parts and parts[-1][1] == matchId:
+                parts[-1] = (parts[-1][0], matchId + 1)
+            else:
+                parts.append((matchId, matchId + 1))
+        return cls(*[part if part[1] - part[0] > 1 else part[0] for part in parts])
+
+    def __init__(self, *parts):
+        """
+        ARGS:
+            parts (int/tuple) - single match ids or ranges in the form (start, stop) or (start, stop, step)
+        """
+        self._ranges = []
+        for part in parts:
+            if isinstance(part, tuple):
+                self._ranges.append((part[0], part[1], part[2] if len(part) > 2 else 1))
+            else:
+                self._ranges.append((part, part + 1, 1))
+
+    def __iter__(self):
+        for start, stop, step in self._ranges:
+            matchId = start
+            while matchId < stop:
+                yield matchId
+                matchId += step
+
+    def __len__(self):
+        return sum(max(0, (stop - start + step - 1) // step) for start, stop, step in self._ranges)
+
+    def __contains__(self, matchId):
+        try:
+            matchId = int(matchId)
+        except (TypeError, ValueError):
+            return False
+        for start, stop, step in self._ranges:
+            if start <= matchId < stop and (matchId - start) % step == 0:
+                return True
+        return False
+
+    def __repr__(self):
+        return "MatchIdRange({})".format(", ".join(str(part) for part in self._ranges))
+
+
 MATCH_IDS = {'180659': {'name': 'six nations',
-                        'matchIds': {'2018': range(291689, 291704),
-                        '2017': [290767,290768] + [x for x in range(290904, 290917)],
-                        '2016': range(254973, 255003, 2),
-                        '2015': range(180679, 180694),
-                        '2014': range(180664, 180679),
-                        '2013': range(133782, 133797)}
+                        'matchIds': {'2018': MatchIdRange((291689, 291704)),
+                        '2017': MatchIdRange(290767, 290768, (290904, 290917)),
+                        '2016': MatchIdRange((254973, 255003, 2)),
+                        '2015': MatchIdRange((180679, 180694)),
+                        '2014': MatchIdRange((180664, 180679)),
+                        '2013': MatchIdRange((133782, 133797))}
                      },
             '270557': {'name': 'pro14', 
-                       'matchIds': {'1718': [x for x in range(291359,291366)]+[x for x in range(291872,292017)],
-                                    '1819': range(293236, 293300)}
+                       'matchIds': {'1718': MatchIdRange((291359, 291366), (291872, 292017)),
+                                    '1819': MatchIdRange((293236, 293300))}
                        },
             '271937': {'name': 'champions cup',
-                       'matchIds': {'1718': range(291705, 291764),
-                                    '1819': range(293564, 293584)}},
+                       'matchIds': {'1718': MatchIdRange((291705, 291764)),
+                                    '1819': MatchIdRange((293564, 293584))}},
             '242041': {'name': 'super rugby',
-                       'matchIds': {'2018': range(292098, 292225),
-                                    '2017': range(290856, 290924)}},#range(290769, 290924)}},290856
+                       'matchIds': {'2018': MatchIdRange((292098, 292225)),
+                                    '2017': MatchIdRange((290856, 290924))}},#range(290769, 290924)}},290856
             '244293': {'name': 'the rugby championship',
-                       'matchIds': {'2017': range(291158, 291170),
-                                    '2018': range(292786, 292798)}},
+                       'matchIds': {'2017': MatchIdRange((291158, 291170)),
+                                    '2018': MatchIdRange((292786, 292798))}},
             '267979': {'name': 'aviva premiership',
-                       'matchIds': {'1718': range(291554, 291689),
-                                    '1819': [x for x in range(293392, 293438)]+[x for x in range(293440,293444)]}},
+                       'matchIds': {'1718': MatchIdRange((291554, 291689)),
+                                    '1819': MatchIdRange((293392, 293438), (293440, 293444))}},
             '270559': {'name': 'top 14',
-                       'matchIds': {'1718': range(291366, 292098),
-                                    '1819': range(293042, 293112)}},
+                       'matchIds': {'1718': MatchIdRange((291366, 292098)),
+                                    '1819': MatchIdRange((293042, 293112))}},
             '272073' : {'name': 'challenge cup',
-                        'matchIds': {'1819': range(293631, 293651),
-                                     '1718': range(291764, 292812)}},
+                        'matchIds': {'1819': MatchIdRange((293631, 293651)),
+                                     '1718': MatchIdRange((291764, 292812))}},
             '289234' : {'name': 'internationals',
                         'matchIds': {'june18': [292944, 292780, 292784, 292940, 292953, 292696, 292718, 292735, 292781, 292959, 292785, 292958, 292697, 292719, 292736, 292963, 292782, 292964, 292962, 292698, 292720, 292941],
                                      'june17' : [291239,291229,291236,291228,291175,291237,291184,291264,291226,291240,291231,291230,291176,291232,291238,291182,291227,291234,291233,291177,291235,291183],